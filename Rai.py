@@ -4,8 +4,16 @@ import asyncio
 from discord.ext.commands import Bot
 from discord.ext import commands
 import sys, traceback
-import json
 from cogs.utils import helper_functions as hf
+from cogs.utils.stats_db import StatsDB
+from cogs.utils.database import Database
+from cogs.utils.journal import Journal
+from cogs.utils.backups import BackupStore
+from cogs.utils.configs import DB_CONFIGS, STATS_CONFIGS
+from cogs.utils.join_order import JoinOrder
+from cogs.utils.lang_batcher import DetectionBatcher
+from cogs.utils.lru_cache import LRUCache
+from cogs.utils.wordfilter import WordFilters
 from datetime import datetime
 import os
 
@@ -39,6 +47,15 @@ def prefix(bot, msg):
         return default
 
 
+# the bot.db sections keyed by guild ID, which are split into the guild shards (along with the DB_CONFIGS sections).
+# Everything else, like the sections keyed by user ID ('banlog', 'global_blacklist'...), stays in the global shard.
+GUILD_SECTIONS = ('antispam', 'auto_bans', 'bans', 'captcha', 'channel_mods', 'deletes', 'edits', 'hardcore', 'joins',
+                  'kicks', 'leaves', 'mod_channel', 'mod_role', 'modlog', 'modsonly', 'mutes', 'nicknames', 'prefix',
+                  'questions', 'reactionroles', 'reactions', 'report', 'roles', 'SAR', 'selfmute', 'staff_ping',
+                  'stats', 'submod_channel', 'submod_role', 'super_voicewatch', 'super_watch', 'timed_voice_role',
+                  'voice', 'voice_mutes', 'voicemod', 'welcome_message', 'wordfilter')
+
+
 class Rai(Bot):
     def __init__(self):
         super().__init__(description="Bot by Ryry013#9234", command_prefix=prefix, owner_id=202995638860906496,
@@ -47,19 +64,31 @@ class Rai(Bot):
         self.last_error = datetime.utcnow()
         self.num_of_errors = 0
         self.language_detection = False
+        self.lang_batcher = DetectionBatcher(hf.detect_languages)
+        self.lang_batcher_task = self.loop.create_task(self.lang_batcher.run())
+        self.lang_cache = LRUCache(maxsize=4096, ttl=3600)  # (model, normalized text): detected language
+        self.wordfilters = WordFilters()
         print('starting loading of jsons')
-        with open(f"{dir_path}/db.json", "r") as read_file1:
-            read_file1.seek(0)
-            self.db = json.load(read_file1)
-        with open(f"{dir_path}/stats.json", "r") as read_file2:
-            read_file2.seek(0)
-            self.stats = json.load(read_file2)
-
-        date = datetime.today().strftime("%d%m%Y%H%M")
-        with open(f"{dir_path}/database_backups/database_{date}.json", "w") as write_file:
-            json.dump(self.db, write_file)
-        with open(f"{dir_path}/database_backups/stats_{date}.json", "w") as write_file:
-            json.dump(self.stats, write_file)
+        # only the global parts are read here, the config of each guild is read the first time it's used
+        self.db_store = Database(f"{dir_path}/db", legacy_file=f"{dir_path}/db.json",
+                                 journal=Journal(f"{dir_path}/db_journal"), guild_sections=GUILD_SECTIONS,
+                                 configs=DB_CONFIGS)
+        self.db = self.db_store.load()
+        self.journal_task = self.loop.create_task(self.db_store.journal.run(self.db_store))
+        self.stats_store = Database(f"{dir_path}/stats", legacy_file=f"{dir_path}/stats.json", sharded_root=True,
+                                    configs=STATS_CONFIGS)
+        self.stats = self.stats_store.load()
+        self.stats_db = StatsDB(f"{dir_path}/stats.sqlite3")
+        self.stats_flush_task = self.loop.create_task(self.stats_db.flusher())
+        self.join_order = JoinOrder()
+
+        self.backups = BackupStore(f"{dir_path}/database_backups",
+                                   {'db': f"{dir_path}/db", 'stats': f"{dir_path}/stats"}, stats_db=self.stats_db)
+        if self.stats_store.converted:
+            if self.migrate_stats():
+                self.stats_store.save()
+        else:
+            self.loop.run_in_executor(None, self.backups.backup).add_done_callback(self.backup_done)
 
         initial_extensions = ['cogs.admin', 'cogs.channel_mods', 'cogs.general', 'cogs.jpserv', 'cogs.logger',
                               'cogs.math', 'cogs.owner', 'cogs.questions', 'cogs.reports', 'cogs.stats', 'cogs.submod',
@@ -73,7 +102,39 @@ class Rai(Bot):
                 traceback.print_exc()
                 continue
 
+    def migrate_stats(self):
+        """Moves the message/emoji/lang/voice counters that are still in bot.stats (the old stats.json layout) into
+        stats.sqlite3, backed up first.  Safe to run again, guilds without counters are skipped.  Returns the number
+        of guilds that were migrated, bot.stats has to be saved after that."""
+        self.backups.backup()
+        migrated = self.stats_db.migrate_from_json(self.stats)
+        if migrated:
+            print(f'migrated the stats.json counters of {migrated} guilds into stats.sqlite3')
+        return migrated
+
+    @staticmethod
+    def backup_done(future):
+        try:
+            name, new_bytes = future.result()
+        except Exception:
+            print('Failed to back up the database on startup', file=sys.stderr)
+            traceback.print_exc()
+        else:
+            print(f'Backed up the database as {name} ({new_bytes} new bytes)')
+
     async def on_ready(self):
+        # read the shards of every guild the bot is in, after that guild lookups are plain dict lookups and the
+        # shards of guilds the bot has left are only read if one of them is indexed directly
+        for store in [self.db_store, self.stats_store]:
+            store.active_guilds = {str(guild.id) for guild in self.guilds}
+            store.load_active()
+        if any('messages' in config for config in self.stats.values()):
+            # the last start stopped between converting stats.json and migrating its counters
+            if self.migrate_stats():
+                await hf.dump_json()
+        for guild in self.guilds:
+            self.join_order.build(guild)
+
         self.ryry = self.get_user(202995638860906496)
         self.ryryServ = self.get_guild(275146036178059265)
         self.testChan = self.get_channel(304110816607862785)
@@ -93,6 +154,7 @@ class Rai(Bot):
         self.selfMute = False
 
         await hf.load_language_dection_model()
+        await hf.load_language_identifier()
         self.language_detection = True
 
         print("Bot loaded")
@@ -117,13 +179,10 @@ class Rai(Bot):
 
                 if x.hour == 0 and x.minute == 0:
                     counter = 0
-                    date = datetime.today().strftime("%Y%m%d-%H.%M")
-                    with open(f"{dir_path}/database_backups/database_{date}.json", "w") as write_file:
-                        json.dump(self.db, write_file)
-                    with open(f"{dir_path}/database_backups/stats_{date}.json", "w") as write_file:
-                        json.dump(self.stats, write_file)
                     await ctx.invoke(self.get_command("_delete_old_stats_days"))
                 await hf.dump_json()
+                if x.minute == 0:  # the files on disk are up to date right after dump_json()
+                    await self.loop.run_in_executor(None, self.backups.backup)
 
                 if counter % 5 == 0:
                     await ctx.invoke(self.get_command("_unban_users"))
@@ -0,0 +1,97 @@
+"""Load test of the antispam stage: the old bot.wait_for loop against SpamTracker (cogs/utils/antispam.py).
+
+One account sends the same message at a fixed rate.  The dispatcher below works like discord.py's: every dispatched
+message is checked against every pending wait_for listener.  Printed are the latency of the antispam stage of each
+on_message, how many times the ban/kick/mute action would have fired, and the dispatch cost per message.
+
+    python benchmarks/antispam_load.py
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cogs.utils.antispam import SpamTracker
+
+MESSAGE_THRESHHOLD = 5
+TIME_THRESHHOLD = 10
+SECONDS = 2
+
+
+class Dispatcher:
+    def __init__(self):
+        self.listeners = []  # (future, check)
+
+    def dispatch(self, message):
+        removed = []
+        for i, (future, check) in enumerate(self.listeners):
+            if future.cancelled():
+                removed.append(i)
+            elif check(message):
+                future.set_result(message)
+                removed.append(i)
+        for i in reversed(removed):
+            del self.listeners[i]
+
+    async def wait_for(self, check, timeout):
+        future = asyncio.get_event_loop().create_future()
+        self.listeners.append((future, check))
+        return await asyncio.wait_for(future, timeout)
+
+
+async def old_antispam(dispatcher, message, actions):
+    """What General.antispam_check did before SpamTracker"""
+    count = 1
+    while count < MESSAGE_THRESHHOLD:
+        try:
+            await dispatcher.wait_for(lambda m: m == message, TIME_THRESHHOLD)
+        except asyncio.TimeoutError:
+            return
+        count += 1
+    actions.append(message)
+
+
+async def run(rate, old):
+    dispatcher = Dispatcher()
+    tracker = SpamTracker()
+    actions = []
+    latencies = []
+    dispatch_time = 0
+
+    async def on_message(message):
+        start = time.perf_counter()
+        if old:
+            await old_antispam(dispatcher, message, actions)
+        elif tracker.is_spam(1, 42, message, MESSAGE_THRESHHOLD, TIME_THRESHHOLD):
+            actions.append(message)
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(rate * SECONDS):
+        dispatch_start = time.perf_counter()
+        dispatcher.dispatch('raid message')
+        dispatch_time += time.perf_counter() - dispatch_start
+        tasks.append(asyncio.ensure_future(on_message('raid message')))
+        await asyncio.sleep(max(0, start + (i + 1) / rate - time.perf_counter()))
+    await asyncio.sleep(0.01)
+    blocked = sum(not task.done() for task in tasks)
+    for task in tasks:
+        task.cancel()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{'old' if old else 'new'} {rate:4}/s  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms  actions {len(actions):4}  "
+          f"dispatch {dispatch_time / len(tasks) * 1e6:3.0f} us/msg  still waiting {blocked}")
+
+
+async def main():
+    for rate in (100, 500):
+        await run(rate, old=True)
+        await run(rate, old=False)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""The precompiled regex character classes of helper_functions against the per-character range checks they replaced.
+
+The old is_emoji/is_cjk/... ran `any(start <= ord(char) <= end ...)` over their ranges for every character, and
+msg_count and get_character_spread called them once per character of the message.  Both versions are checked to
+agree on every code point before timing them on a 200 character mixed English/Japanese/emoji message.
+
+    python benchmarks/char_classes.py
+"""
+import os
+import re
+import random
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def load_classifiers():
+    """The character class part of helper_functions.  Importing the whole module needs discord and sklearn, which
+    none of these functions use."""
+    with open(os.path.join(ROOT, 'cogs', 'utils', 'helper_functions.py'), encoding='utf-8') as read_file:
+        source = read_file.read()
+    start = source.index('def get_character_spread(text):')
+    end = source.index('_quote_lines = ')
+    namespace = {'re': re}
+    exec(source[start:end], namespace)
+    return namespace
+
+
+def per_character(ranges):
+    def check(char):
+        return any(start <= ord(char) <= end for start, end in ranges)
+    return check
+
+
+def main():
+    hf = load_classifiers()
+    old = {name: per_character(hf[ranges]) for name, ranges in (('generous_is_emoji', 'GENEROUS_EMOJI_RANGES'),
+                                                                  ('is_emoji', 'EMOJI_RANGES'),
+                                                                  ('is_ignored_emoji', 'IGNORED_EMOJI_RANGES'),
+                                                                  ('is_cjk', 'CJK_RANGES'),
+                                                                  ('is_english', 'ENGLISH_RANGES'))}
+    for name, check in old.items():
+        mismatches = sum(check(chr(c)) != hf[name](chr(c)) for c in range(0x110000) if not 0xD800 <= c <= 0xDFFF)
+        print(f"{name}: {mismatches} code points differ")
+
+    random.seed(0)
+    pool = 'hello world how are you wwww ' * 3 + 'こんにちは今日は天気がいいですね' + '😀🎉👍' + 'éñü—…“”'
+    msg = ''.join(random.choice(pool) for _ in range(200))
+
+    def old_spread():
+        english = japanese = 0
+        for char in msg:
+            if old['is_cjk'](char):
+                japanese += 1
+            elif old['is_english'](char):
+                english += 1
+        return english, japanese, english + japanese
+
+    def old_emoji_scan():
+        return [c for c in msg if old['is_emoji'](c)], [c for c in msg if old['is_ignored_emoji'](c)]
+
+    def new_emoji_scan():
+        return hf['find_emoji'](msg), hf['find_ignored_emoji'](msg)
+
+    assert old_spread() == hf['get_character_spread'](msg)
+    assert old_emoji_scan() == new_emoji_scan()
+
+    def us(func, number):
+        return timeit.timeit(func, number=number) / number * 1e6
+
+    print(f"msg_count emoji + ignored scan  {us(old_emoji_scan, 2000):6.1f} us -> {us(new_emoji_scan, 2000):5.2f} us")
+    print(f"get_character_spread            {us(old_spread, 2000):6.1f} us -> "
+          f"{us(lambda: hf['get_character_spread'](msg), 2000):5.2f} us")
+    print(f"is_emoji on one character       {us(lambda: old['is_emoji']('a'), 100000):6.2f} us -> "
+          f"{us(lambda: hf['is_emoji']('a'), 100000):5.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Memory of the hot db sections as plain dicts against the typed configs of cogs/utils/configs.py.
+
+Builds a synthetic db.json with GUILDS guilds, converts it to the sharded layout, loads every guild shard once with
+DB_CONFIGS and once without, and measures what stays allocated with tracemalloc.  The lookup times are in
+db_lookups.py.
+
+    python benchmarks/configs_memory.py
+"""
+import gc
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cogs.utils.database import Database
+from cogs.utils.configs import DB_CONFIGS
+
+GUILDS = 500
+
+
+def snowflake():
+    return random.randrange(10 ** 17, 10 ** 18)
+
+
+def synthetic_db():
+    random.seed(1)
+    db = {'ID': {}}
+    for section in DB_CONFIGS:
+        db[section] = {}
+    for i in range(GUILDS):
+        guild_id = str(243838819743432704 + i * 7919)
+        db['mod_channel'][guild_id] = snowflake()
+        db['wordfilter'][guild_id] = {'badword': '5'}
+        db['mutes'][guild_id] = {'role': snowflake(),
+                                 'timed_mutes': {str(snowflake()): '2021/01/01 00:00 UTC' for _ in range(3)}}
+        db['antispam'][guild_id] = {'enable': True, 'action': 'mute', 'message_threshhold': 5, 'time_threshhold': 10,
+                                    'ignored': [snowflake()]}
+        db['super_watch'][guild_id] = {'users': {str(snowflake()): 'url' for _ in range(2)}, 'channel': snowflake(),
+                                       'enable': False}
+        db['joins'][guild_id] = {'enable': True, 'channel': snowflake(), 'invites': {}, 'invites_enable': False,
+                                 'readd_roles': {'enable': False, 'users': {}, 'roles': {}}}
+        for section in ('deletes', 'edits', 'voice', 'nicknames'):
+            db[section][guild_id] = {'enable': True, 'channel': snowflake()}
+        db['edits'][guild_id]['distance_limit'] = 3
+    return db
+
+
+def loaded_size(directory, configs):
+    """Bytes still allocated after loading every guild shard of a fresh copy of the database"""
+    shutil.rmtree(os.path.join(directory, 'db'), ignore_errors=True)
+    Database(os.path.join(directory, 'db'), legacy_file=os.path.join(directory, 'db.json'),
+             guild_sections=DB_CONFIGS, configs=configs).load()
+    gc.collect()
+    tracemalloc.start()
+    store = Database(os.path.join(directory, 'db'), guild_sections=DB_CONFIGS, configs=configs)
+    data = store.load()
+    store.load_active()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, 'db.json'), 'w') as write_file:
+            json.dump(synthetic_db(), write_file)
+        dicts = loaded_size(directory, None)
+        typed = loaded_size(directory, DB_CONFIGS)
+    finally:
+        shutil.rmtree(directory)
+    print(f"{GUILDS} guilds: dict layout {dicts / 1024:.0f} KiB, typed configs {typed / 1024:.0f} KiB "
+          f"({100 * (typed - dicts) / dicts:+.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
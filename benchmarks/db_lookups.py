@@ -0,0 +1,66 @@
+"""The whole per-message config lookup, from bot.db down to the value, on the old plain dicts and on the sharded
+Database (cogs/utils/database.py), with and without the typed configs of cogs/utils/configs.py.
+
+Uses the synthetic GUILDS guild db.json of configs_memory.py.  The Database is timed before load_active() (every
+lookup checks for an unread shard) and after it (the sections are LoadedSections), with a tenth of the guild shards
+belonging to guilds the bot has left.
+
+    python benchmarks/db_lookups.py
+"""
+import os
+import sys
+import json
+import shutil
+import timeit
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cogs.utils.database import Database
+from cogs.utils.configs import DB_CONFIGS
+from configs_memory import GUILDS, synthetic_db
+
+NUMBER = 10 ** 6
+
+
+def ns(statement, namespace):
+    return min(timeit.repeat(statement, globals=namespace, number=NUMBER, repeat=7)) * 1e9 / NUMBER
+
+
+def main():
+    db = synthetic_db()
+    gid = int(next(iter(db['antispam'])))
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, 'db.json'), 'w') as write_file:
+            json.dump(db, write_file)
+        stores = {}
+        for name, configs in (('dicts', None), ('configs', DB_CONFIGS)):
+            folder = os.path.join(directory, name)
+            Database(folder, legacy_file=os.path.join(directory, 'db.json'), guild_sections=DB_CONFIGS,
+                     configs=configs).load()
+            stores[name] = Database(folder, guild_sections=DB_CONFIGS, configs=configs)
+            stores[name].load()
+
+        # without configs the sections are keyed by str, like the plain dicts
+        statements = {'db[s][str(gid)][key]': ("db['antispam'][str(gid)]['enable']",) * 2,
+                      'db[s].get(gid).field': ("db['antispam'].get(str(gid))['enable']",
+                                               "db['antispam'].get(gid).enable"),
+                      'str(gid) in db[s]': ("str(gid) in db['antispam']",) * 2}
+        print(f"{'':32}" + ''.join(f"{label:>24}" for label in statements))
+        print(f"{'plain dict':32}" + ''.join(f"{ns(statement[0], {'db': db, 'gid': gid}):21.0f} ns"
+                                                for statement in statements.values()))
+        for state in ('before load_active', 'after load_active'):
+            for name, store in stores.items():
+                if state == 'after load_active':
+                    store.active_guilds = set(list(db['antispam'])[:GUILDS - GUILDS // 10])
+                    store.load_active()
+                store.data['antispam'][str(gid)]  # read the shard
+                namespace = {'db': store.data, 'gid': gid}
+                print(f"{name + ', ' + state:32}" + ''.join(f"{ns(statement[name == 'configs'], namespace):21.0f} ns"
+                                                            for statement in statements.values()))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
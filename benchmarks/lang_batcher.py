@@ -0,0 +1,67 @@
+"""Throughput/latency of DetectionBatcher (cogs/utils/lang_batcher.py) against one executor call per message.
+
+The sklearn pipeline is modeled as a fixed cost per predict call plus a small cost per text, so this runs without
+the model.  The cost is spent busy, holding the GIL like CountVectorizer's Python tokenizing does, so per-message
+calls can't overlap in the executor threads.  Messages are sent on a fixed schedule and the rate that was actually reached is printed next to each
+run, since a slow machine can fall behind the target.
+
+    python benchmarks/lang_batcher.py
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cogs.utils.lang_batcher import DetectionBatcher
+
+CALL_COST = 0.002  # seconds per predict_proba call
+TEXT_COST = 0.00005  # seconds per text in the call
+SECONDS = 2
+
+
+def predict(texts):
+    end = time.perf_counter() + CALL_COST + TEXT_COST * len(texts)
+    while time.perf_counter() < end:
+        pass
+    return ['en'] * len(texts)
+
+
+async def single(text):
+    return (await asyncio.get_event_loop().run_in_executor(None, predict, [text]))[0]
+
+
+async def drive(rate, detect):
+    """Sends rate * SECONDS messages on schedule, returns (reached rate, p50 ms, p99 ms)"""
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await detect('hola que tal')
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(rate * SECONDS):
+        tasks.append(asyncio.ensure_future(one()))
+        await asyncio.sleep(max(0, start + (i + 1) / rate - time.perf_counter()))
+    sent = len(tasks) / (time.perf_counter() - start)
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    return sent, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+async def main():
+    print("target  reached  per-message calls  p50/p99 ms    reached  batched calls  p50/p99 ms")
+    for rate in (50, 200, 1000):
+        batcher = DetectionBatcher(predict)
+        task = asyncio.ensure_future(batcher.run())
+        single_rate, single_p50, single_p99 = await drive(rate, single)
+        batched_rate, batched_p50, batched_p99 = await drive(rate, batcher.detect)
+        task.cancel()
+        print(f"{rate:6}  {single_rate:5.0f}/s  {rate * SECONDS:17}  {single_p50:4.1f} / {single_p99:4.1f}"
+              f"  {batched_rate:5.0f}/s  {batcher.batches:13}  {batched_p50:4.1f} / {batched_p99:4.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+"""The stats aggregations at 100k users x 30 days: the old nested dicts of stats.json, the SQLite store of
+cogs/utils/stats_db.py and (when numpy is installed) a numpy columnar layout with np.bincount group-bys.
+
+The numpy layout is what a columnar engine would hold per guild: int arrays of day, user, channel and count, with
+the user/channel IDs dictionary encoded.  It's timed on the same queries the commands run: ;lb, ;chlb over two
+channels, the ;u page (channels + this week), count_messages and ;emotes.
+
+    python benchmarks/stats_engine.py
+"""
+import gc
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cogs.utils.stats_db import StatsDB
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+USERS = 100_000
+DAYS = [20200401 + day for day in range(30)]
+WEEK_START = 20200424
+CHANNELS = 40
+EMOJI = [f"emoji{i}" for i in range(300)]
+GUILD = 1
+USER = 777
+
+
+def synthetic_rows():
+    random.seed(0)
+    messages, emoji = [], []
+    for user in range(USERS):
+        for day in random.sample(DAYS, random.randint(1, 6)):
+            for channel in random.sample(range(CHANNELS), random.randint(1, 2)):
+                messages.append((GUILD, day, user, channel, random.randint(1, 30)))
+            if random.random() < 0.3:
+                emoji.append((GUILD, day, user, random.choice(EMOJI), random.randint(1, 3)))
+    return messages, emoji
+
+
+def timed(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1000
+
+
+def allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+# ### stats.json: {day: {user: {'channels': {channel: count}, 'emoji': {emoji: count}}}} ###
+
+def build_dicts(messages, emoji):
+    config = {}
+    for _, day, user, channel, count in messages:
+        config.setdefault(str(day), {}).setdefault(str(user), {}).setdefault('channels', {})[str(channel)] = count
+    for _, day, user, name, count in emoji:
+        config[str(day)].setdefault(str(user), {}).setdefault('emoji', {})[name] = count
+    return config
+
+
+def dict_queries(config):
+    def leaderboard(channels=None):
+        totals = {}
+        for users in config.values():
+            for user, user_config in users.items():
+                for channel, count in user_config.get('channels', {}).items():
+                    if channels is None or channel in channels:
+                        totals[user] = totals.get(user, 0) + count
+        return sorted(totals.items(), key=lambda item: -item[1])[:100]
+
+    def user_page():
+        channels, week = {}, 0
+        for day, users in config.items():
+            for channel, count in users.get(str(USER), {}).get('channels', {}).items():
+                channels[channel] = channels.get(channel, 0) + count
+                if int(day) >= WEEK_START:
+                    week += count
+        return channels, week
+
+    def count_messages():
+        return sum(sum(users[str(USER)].get('channels', {}).values()) for users in config.values()
+                   if str(USER) in users)
+
+    def emotes():
+        totals = {}
+        for users in config.values():
+            for user_config in users.values():
+                for name, count in user_config.get('emoji', {}).items():
+                    totals[name] = totals.get(name, 0) + count
+        return totals
+
+    return {'lb': leaderboard, 'chlb': lambda: leaderboard({'1', '2'}), 'u': user_page,
+            'count_messages': count_messages, 'emotes': emotes}
+
+
+# ### numpy columns ###
+
+class Columns:
+    def __init__(self, messages, emoji):
+        self.users = {}  # user ID: index
+        self.channels = {}
+        self.emoji = {}
+        self.day = np.array([day for _, day, _, _, _ in messages], dtype=np.int32)
+        self.user = np.array([self.users.setdefault(user, len(self.users)) for _, _, user, _, _ in messages],
+                             dtype=np.int32)
+        self.channel = np.array([self.channels.setdefault(channel, len(self.channels))
+                                 for _, _, _, channel, _ in messages], dtype=np.int32)
+        self.count = np.array([count for _, _, _, _, count in messages], dtype=np.int32)
+        self.emoji_user = np.array([self.users.setdefault(user, len(self.users)) for _, _, user, _, _ in emoji],
+                                   dtype=np.int32)
+        self.emoji_id = np.array([self.emoji.setdefault(name, len(self.emoji)) for _, _, _, name, _ in emoji],
+                                 dtype=np.int32)
+        self.emoji_count = np.array([count for _, _, _, _, count in emoji], dtype=np.int32)
+        self.user_ids = np.array(list(self.users), dtype=np.int64)
+        self.emoji_names = list(self.emoji)
+
+    def leaderboard(self, channels=None):
+        if channels is None:
+            totals = np.bincount(self.user, weights=self.count, minlength=len(self.users))
+        else:
+            mask = np.isin(self.channel, [self.channels[c] for c in channels])
+            totals = np.bincount(self.user[mask], weights=self.count[mask], minlength=len(self.users))
+        top = np.argpartition(-totals, 100)[:100]
+        top = top[np.argsort(-totals[top])]
+        return list(zip(self.user_ids[top].tolist(), totals[top].astype(int).tolist()))
+
+    def user_page(self):
+        mask = self.user == self.users[USER]
+        channels = np.bincount(self.channel[mask], weights=self.count[mask])
+        week = int(self.count[mask & (self.day >= WEEK_START)].sum())
+        return channels, week
+
+    def count_messages(self):
+        return int(self.count[self.user == self.users[USER]].sum())
+
+    def emotes(self):
+        totals = np.bincount(self.emoji_id, weights=self.emoji_count, minlength=len(self.emoji))
+        return dict(zip(self.emoji_names, totals.astype(int).tolist()))
+
+    def nbytes(self):
+        arrays = (self.day, self.user, self.channel, self.count, self.emoji_user, self.emoji_id, self.emoji_count,
+                  self.user_ids)
+        return sum(array.nbytes for array in arrays)
+
+
+def main():
+    messages, emoji = synthetic_rows()
+    print(f"{len(messages)} message counters, {len(emoji)} emoji counters")
+    config, dict_size = allocated(lambda: build_dicts(messages, emoji))
+    results = {'dicts': dict_queries(config)}
+    sizes = {'dicts': f"{dict_size / 2 ** 20:.0f} MB in memory"}
+
+    directory = tempfile.mkdtemp()
+    try:
+        db = StatsDB(os.path.join(directory, 'stats.sqlite3'))
+        conn = db._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", messages)
+            conn.executemany("INSERT INTO emoji VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING", emoji)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        sizes['sqlite'] = f"{os.path.getsize(os.path.join(directory, 'stats.sqlite3')) / 2 ** 20:.0f} MB on disk"
+        results['sqlite'] = {'lb': lambda: db.leaderboard(GUILD), 'chlb': lambda: db.leaderboard(GUILD, [1, 2]),
+                             'u': lambda: db.user_page(GUILD, USER), 'count_messages':
+                             lambda: db.count_messages(GUILD, USER), 'emotes': lambda: db.emoji_counts(GUILD)}
+
+        if np is not None:
+            columns, columns_size = allocated(lambda: Columns(messages, emoji))
+            sizes['numpy'] = f"{columns_size / 2 ** 20:.0f} MB in memory ({columns.nbytes() / 2 ** 20:.0f} MB arrays)"
+            results['numpy'] = {'lb': columns.leaderboard, 'chlb': lambda: columns.leaderboard([1, 2]),
+                                'u': columns.user_page, 'count_messages': columns.count_messages,
+                                'emotes': columns.emotes}
+
+        for engine, size in sizes.items():
+            print(f"{engine:8} {size}")
+        print(f"{'':16}" + ''.join(f"{engine:>14}" for engine in results))
+        for query in ('lb', 'chlb', 'u', 'count_messages', 'emotes'):
+            print(f"{query:16}" + ''.join(f"{timed(queries[query], 3 if engine == 'dicts' else 20):11.3f} ms"
+                                          for engine, queries in results.items()))
+
+        start = time.perf_counter()
+        for user in range(2000):
+            db.add_message(GUILD, user, 3, day=DAYS[-1])
+        db.write(db.pending)
+        print(f"sqlite: {(time.perf_counter() - start) / 2:.2f} ms to count and flush 1000 messages")
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -356,7 +356,8 @@ class Admin(commands.Cog):
             except KeyError:
                 config['crosspost'] = True
         else:
-            config = self.bot.db['bans'][str(ctx.guild.id)] = {'enable': False, 'channel': None, 'crosspost': True}
+            self.bot.db['bans'][str(ctx.guild.id)] = {'enable': False, 'channel': None, 'crosspost': True}
+            config = self.bot.db['bans'][str(ctx.guild.id)]
         if config['crosspost']:
             await hf.safe_send(ctx, f"Rai will now crosspost ban logs")
         else:
@@ -775,7 +776,8 @@ class Admin(commands.Cog):
             config = self.bot.db['joins'][str(ctx.guild.id)]['readd_roles']
             config['enable'] = not config['enable']
         except KeyError:  # the guild was in 'joins' but it didn't have 'readd_roles'
-            config = self.bot.db['joins'][str(ctx.guild.id)]['readd_roles'] = {'enable': True, 'users': {}, 'roles': {}}
+            self.bot.db['joins'][str(ctx.guild.id)]['readd_roles'] = {'enable': True, 'users': {}, 'roles': {}}
+            config = self.bot.db['joins'][str(ctx.guild.id)]['readd_roles']
         if config['enable']:
             if not ctx.me.guild_permissions.manage_roles:
                 await hf.safe_send(ctx, "I lack permission to manage roles.  Please fix that before enabling this")
@@ -950,7 +952,7 @@ class Admin(commands.Cog):
             return
         await self.out_of_voice(member, date_str=None)
 
-    async def out_of_voice(self, member, date_str=None):
+    async def out_of_voice(self, member, date_str=None, channel=None):
         guild = str(member.guild.id)
         member_id = str(member.id)
         config = self.bot.stats[guild]['voice']
@@ -959,23 +961,21 @@ class Admin(commands.Cog):
 
         # calculate how long they've been in voice
         join_time = datetime.strptime(config['in_voice'][str(member.id)], "%Y/%m/%d %H:%M UTC")
-        total_length = (datetime.utcnow() - join_time).seconds
+        now = datetime.utcnow()
+        total_length = (now - join_time).seconds
         hours = total_length // 3600
         minutes = total_length % 3600 // 60
         del config['in_voice'][member_id]
 
         # add to their total
-        if not date_str:
-            date_str = datetime.utcnow().strftime("%Y%m%d")
-        if date_str not in config['total_time']:
-            config['total_time'][date_str] = {}
-        today = config['total_time'][date_str]
-        if member_id not in today:
-            today[member_id] = hours * 60 + minutes
-        else:
-            if isinstance(today[member_id], list):
-                today[member_id] = today[member_id][0] * 60 + today[member_id][1]
-            today[member_id] += hours * 60 + minutes
+        if date_str:
+            date_str = int(date_str)
+        self.bot.stats_db.add_voice(member.guild.id, member.id, hours * 60 + minutes, date_str)
+
+        # and to the activity heatmap (channel 0 if we don't know which channel they were in anymore)
+        if not channel and member.voice:
+            channel = member.voice.channel
+        self.bot.stats_db.add_voice_activity(member.guild.id, channel.id if channel else 0, join_time, now)
 
     @commands.command(hidden=True)
     @commands.guild_only()
@@ -1155,8 +1155,7 @@ class Admin(commands.Cog):
         # 	in_voice:
         # 		user1:
         # 			enter_utc
-        # 	total_time:
-        # 		user1: hours
+        # 	(total time is kept in self.bot.stats_db)
         async def voice_update():
             guild = str(member.guild.id)
             if guild not in self.bot.stats:
@@ -1181,7 +1180,7 @@ class Admin(commands.Cog):
                     return
             else:  # in the database
                 if after.self_deaf or after.deaf or after.afk or not after.channel:
-                    await self.out_of_voice(member)
+                    await self.out_of_voice(member, channel=before.channel)
                     return
         await voice_update()
 
@@ -2167,6 +2166,7 @@ class Admin(commands.Cog):
             return
 
         config[word] = minutes
+        self.bot.wordfilters.invalidate(ctx.guild.id)
         try:
             await msg.delete()
         except (discord.NotFound, discord.Forbidden):
@@ -2196,6 +2196,7 @@ class Admin(commands.Cog):
             except (discord.NotFound, discord.Forbidden):
                 pass
             del(config[msg.content])
+            self.bot.wordfilters.invalidate(ctx.guild.id)
             await menu.edit(embed=hf.green_embed("Success! I've deleted that filter."))
         else:
             try:
@@ -3,7 +3,7 @@ from discord.ext import commands, tasks
 from .utils import helper_functions as hf
 from bs4 import BeautifulSoup
 import aiohttp, async_timeout
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 import traceback, sys
 
@@ -274,28 +274,11 @@ class Background(commands.Cog):
 
     @commands.command(hidden=True)
     async def _delete_old_stats_days(self, ctx):
-        for server_id in self.bot.stats:
-            config = self.bot.stats[server_id]
-            for day in config['messages'].copy():
-                days_ago = (datetime.utcnow() - datetime.strptime(day, "%Y%m%d")).days
-                if days_ago > 30:
-                    for user_id in config['messages'][day]:
-                        for channel_id in config['messages'][day][user_id]:
-                            try:
-                                int(channel_id)  # skip 'emoji' and 'lang' entries
-                            except ValueError:
-                                continue
-                            if 'member_totals' not in config:
-                                config['member_totals'] = {}
-                            if user_id in config['member_totals']:
-                                config['member_totals'][user_id] += config['messages'][day][user_id][channel_id]
-                            else:
-                                config['member_totals'][user_id] = config['messages'][day][user_id][channel_id]
-                    del config['messages'][day]
-            for day in config['voice']['total_time'].copy():
-                days_ago = (datetime.utcnow() - datetime.strptime(day, "%Y%m%d")).days
-                if days_ago > 30:
-                    del config['voice']['total_time'][day]
+        cutoff = int((datetime.utcnow() - timedelta(days=30)).strftime("%Y%m%d"))
+        await self.bot.stats_db.run(self.bot.stats_db.delete_old_days, cutoff)
+        # weekly history is kept for a year, after that it's only kept by month
+        cutoff = int((datetime.utcnow() - timedelta(days=365)).strftime("%Y%m%d"))
+        await self.bot.stats_db.run(self.bot.stats_db.compact_history, cutoff)
 
     @commands.command(hidden=True)
     async def _check_lovehug(self, ctx):
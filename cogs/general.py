@@ -2,12 +2,14 @@ import discord
 from discord.ext import commands
 from datetime import datetime, timedelta
 from .utils import helper_functions as hf
+from .utils.lru_cache import MISSING
+from .utils.antispam import SpamTracker
+from .utils.keywords import KeywordScanner
+from .utils.pipeline import Stage, run_stages
 import re
-import textblob
 from Levenshtein import distance as LDist
 import string
 import asyncio
-from urllib.error import HTTPError
 from collections import Counter
 from inspect import cleandoc
 from random import choice
@@ -34,6 +36,18 @@ ENG_ROLE = {
     320439136236601344: 474825178204078081  # r/CL Learning English Role
 }
 
+# keyword lists checked on every message, each scanner is built once here
+NAME_PING_WORDS = KeywordScanner(['ryry', 'ryan', 'らいらい', 'ライライ', '来雷', '雷来'])
+NAME_PING_IGNORED_WORDS = KeywordScanner(['bryan', 'aryan', 'biryani', 'ryan gosling', 'ryan-reynold', 'ryan reynold',
+                                          'ryan_army'])  # why do people say these so often...
+CHINESE_BANNED_WORDS = KeywordScanner(['动态网自由门', '天安門', '天安门', '法輪功', '李洪志', 'Free Tibet',
+                                       'Tiananmen Square', '反右派鬥爭', 'The Anti-Rightist Struggle', '大躍進政策',
+                                       'The Great Leap Forward', '文化大革命', '人權', 'Human Rights', '民運',
+                                       'Democratization', '自由', 'Freedom', '獨立', 'Independence'])
+SPAM_LINK_WORDS = KeywordScanner(['amazingsexdating', 'bestdatingforall', 'nakedphotos.club', 'privatepage.vip',
+                                  'viewc.site', 'libra-sale.io', 'ethway.io', 'omg-airdrop', 'linkairdrop',
+                                  "Airdrop Time!"])
+
 
 def blacklist_check():
     async def pred(ctx):
@@ -46,12 +60,16 @@ def blacklist_check():
     return commands.check(pred)
 
 
+MAX_IGNORED_CHARACTERS = 2000
+
+
 class General(commands.Cog):
     """My custom cog that does stuff!"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.ignored_characters = []
+        self.spam_tracker = SpamTracker()
+        self.ignored_characters = set()  # is_ignored_emoji() characters seen in messages, up to MAX_IGNORED_CHARACTERS
         hf.setup(bot)
 
     @commands.Cog.listener()
@@ -74,7 +92,6 @@ class General(commands.Cog):
             ctx = await self.bot.get_context(msg)
             if "AOTW recording" in msg.content:
                 await ctx.invoke(self.bot.get_command("question"), args=msg.content)
-        await burdbot_window()
 
         # """Messages/pings to Rai"""
         # async def message_to_bot():
@@ -120,47 +137,43 @@ class General(commands.Cog):
                     and msg.author.id == self.bot.owner_id and msg.content[0:3] == 'msg':
                 await self.bot.get_channel(int(msg.content[4:22])).send(str(msg.content[22:]))
 
-        await message_as_bot()
-
         """Replace tatsumaki/nadeko serverinfo posts"""
         async def replace_tatsumaki_posts():
             if msg.content in ['t!serverinfo', 't!server', 't!sinfo', '.serverinfo', '.sinfo']:
                 if msg.guild.id in [JP_SERVER_ID, SP_SERVER_ID, RY_SERVER_ID]:
                     new_ctx = await self.bot.get_context(msg)
                     await new_ctx.invoke(self.serverinfo)
-        await replace_tatsumaki_posts()
+
+        # the stages of on_message, see run_stages() at the end for how they're run
+        stages = [Stage('burdbot_window', burdbot_window),
+                  Stage('message_as_bot', message_as_bot),
+                  Stage('replace_tatsumaki_posts', replace_tatsumaki_posts)]
+        results = {}
 
         ##########################################
 
         if not msg.guild:  # all code after this has msg.guild requirement
+            await run_stages(stages)
             return
 
         ##########################################
 
+        text = hf.MessageText(msg.content)  # stripped/casefolded/emoji... versions of the content, made when needed
+
         "antispam"
         async def antispam_check():
-            if str(msg.guild.id) in self.bot.db['antispam']:
-                config = self.bot.db['antispam'][str(msg.guild.id)]
-            else:
+            config = self.bot.db['antispam'].get(msg.guild.id)
+            if config is None or not config.enable:
                 return
-            if not config['enable']:
+            if msg.channel.id in config.ignored:
                 return
-            if msg.channel.id in config['ignored']:
+            if not self.spam_tracker.is_spam(msg.guild.id, msg.author.id, msg.content,
+                                             config.message_threshhold, config.time_threshhold):
                 return
-            spam_count = 1
-
-            def check(m):
-                return m.guild == msg.guild and m.author == msg.author and m.content == msg.content
-            while spam_count < config['message_threshhold']:
-                try:
-                    await self.bot.wait_for('message', timeout=config['time_threshhold'], check=check)
-                except asyncio.TimeoutError:
-                    return
-                else:
-                    spam_count += 1
 
             reason = f"Antispam: Sent the message `{msg.content[:400]}` {config['message_threshhold']} " \
                      f"times in {config['time_threshhold']} seconds."
+            removed = config['action'] in ('ban', 'kick')
             if config['action'] == 'ban':
                 try:
                     await msg.author.ban(reason=reason)
@@ -184,42 +197,37 @@ class General(commands.Cog):
                                                                   f"[Jump URL]({msg.jump_url})"))
                 except (discord.Forbidden, discord.HTTPException):
                     pass
-        await antispam_check()
+            return removed
 
         "automatic word filter"
         async def wordfilter():
             if not msg.guild.me.guild_permissions.ban_members:
                 return
-            if str(msg.guild.id) not in self.bot.db['wordfilter']:
-                return
-            config = self.bot.db['wordfilter'][str(msg.guild.id)]
-            if not config:
+            config = self.bot.db['wordfilter'].get(msg.guild.id)
+            if not config or not msg.content:
                 return
 
             time_ago = datetime.utcnow() - msg.author.joined_at
 
-            for filter_word in config:
-                if msg.content:
-                    if re.search(filter_word, msg.content, flags=re.I):
-                        if time_ago < timedelta(minutes=int(config[filter_word])):
-                            reason = f"Rai automatic word filter ban:\n{msg.content}"[:512]
-                            if len(reason) > 509:
-                                reason = reason[:509] + "..."
-                            try:
-                                await asyncio.sleep(1)
-                                await msg.delete()
-                            except (discord.Forbidden, discord.NotFound):
-                                pass
-                            try:
-                                asyncio.sleep(3)
-                                await msg.author.ban(reason=reason)
-                            except (discord.Forbidden, discord.HTTPException):
-                                pass
-        await wordfilter()
+            for filter_word in self.bot.wordfilters.get(msg.guild.id, config).matches(msg.content):
+                if time_ago < timedelta(minutes=int(config[filter_word])):
+                    reason = f"Rai automatic word filter ban:\n{msg.content}"[:512]
+                    if len(reason) > 509:
+                        reason = reason[:509] + "..."
+                    try:
+                        await asyncio.sleep(1)
+                        await msg.delete()
+                    except (discord.Forbidden, discord.NotFound):
+                        pass
+                    try:
+                        asyncio.sleep(3)
+                        await msg.author.ban(reason=reason)
+                    except (discord.Forbidden, discord.HTTPException):
+                        pass
+                    return True
 
         """Ping me if someone says my name"""
         async def mention_ping():
-            cont = str(msg.content).casefold()
             if msg.author.bot or msg.author.id == 202995638860906496:
                 return
             try:
@@ -227,42 +235,30 @@ class General(commands.Cog):
                     return  # I ain't trying to spy on people
             except AttributeError:
                 pass
-            for word in cont.casefold():
-                for ignored_word in ['http', ':']:
-                    if ignored_word in word:
-                        cont = cont.replace(word, "")
-
-            found_word = False
-            ignored_words = ['bryan', 'aryan', 'biryani', 'ryan gosling', 'ryan-reynold', 'ryan reynold', 'ryan_army']
-            for word in ignored_words:
-                if word in cont.casefold():  # why do people say these so often...
-                    cont = re.sub(word, '', cont, flags=re.IGNORECASE)
-                if msg.guild:
-                    if msg.guild.id == SP_SERVER_ID:
-                        cont = re.sub(r'ryan', '', cont, flags=re.IGNORECASE)
+            cont = text.casefold.replace(':', '')  # already casefolded, so plain replace() is enough below
 
-            to_check_words = ['ryry', 'ryan', 'らいらい', 'ライライ', '来雷', '雷来']
-            for word in to_check_words:
-                if word in cont.casefold():
-                    found_word = True
+            for word in NAME_PING_IGNORED_WORDS.hits(cont):
+                cont = cont.replace(word, '')
+            if msg.guild.id == SP_SERVER_ID:
+                cont = cont.replace('ryan', '')
 
-            if found_word:
+            if NAME_PING_WORDS.hits(cont):
                 await self.bot.spamChan.send(
                     f'**By {msg.author.name} in {msg.channel.mention}** ({msg.channel.name}): '
                     f'\n{msg.content}'
                     f'\n{msg.jump_url} <@202995638860906496>'[:2000])
 
-        await mention_ping()
-
         """Self mute"""
-        try:
-            if self.bot.db['selfmute'][str(msg.guild.id)][str(msg.author.id)]['enable']:
-                try:
-                    await msg.delete()
-                except (discord.Forbidden, discord.NotFound):
-                    pass
-        except KeyError:
-            pass
+        async def self_mute():
+            try:
+                if self.bot.db['selfmute'][str(msg.guild.id)][str(msg.author.id)]['enable']:
+                    try:
+                        await msg.delete()
+                    except (discord.Forbidden, discord.NotFound):
+                        pass
+                    return True
+            except KeyError:
+                pass
 
         """check for servers of banned IDs"""
         async def check_guilds():
@@ -285,18 +281,11 @@ class General(commands.Cog):
                 for embed in msg.embeds:
                     if embed.description:
                         await check_user(embed.description)
-        await check_guilds()
 
         """chinese server banned words"""
-        words = ['动态网自由门', '天安門', '天安门', '法輪功', '李洪志', 'Free Tibet', 'Tiananmen Square',
-                 '反右派鬥爭', 'The Anti-Rightist Struggle', '大躍進政策', 'The Great Leap Forward', '文化大革命',
-                 '人權', 'Human Rights', '民運', 'Democratization', '自由', 'Freedom', '獨立', 'Independence']
-        if msg.guild.id in [CH_SERVER_ID, 494502230385491978, CL_SERVER_ID, RY_SERVER_ID]:
-            word_count = 0
-            for word in words:
-                if word in msg.content:
-                    word_count += 1
-                if word_count == 5:
+        async def chinese_banned_words():
+            if msg.guild.id in [CH_SERVER_ID, 494502230385491978, CL_SERVER_ID, RY_SERVER_ID]:
+                if len(CHINESE_BANNED_WORDS.hits(msg.content)) >= 5:
                     mod_channel = self.bot.get_channel(self.bot.db['mod_channel'][str(msg.guild.id)])
                     log_channel = self.bot.get_channel(self.bot.db['bans'][str(msg.guild.id)]['channel'])
                     if datetime.utcnow() - msg.author.joined_at < timedelta(minutes=60):
@@ -324,60 +313,55 @@ class General(commands.Cog):
                         await hf.safe_send(log_channel, f"Banned {msg.author.name} for the banned words spam message."
                                                         f"\nMessage was posted in {msg.channel.mention}.  Message:"
                                                         f"\n```{msg.content}"[:1850] + '```')
-
-                        break
+                        return True
                     else:
                         await hf.safe_send(mod_channel,
                                            f"Warning: {msg.author.name} may have said the banned words spam message"
                                            f"\nMessage was posted in {msg.channel.mention}.  Message:"
                                            f"\n```{msg.content}"[:1995] + '```')
-                        break
 
         """best sex dating"""
         async def spam_account_bans():
-            words = ['amazingsexdating', 'bestdatingforall', 'nakedphotos.club', 'privatepage.vip', 'viewc.site',
-                     'libra-sale.io', 'ethway.io', 'omg-airdrop', 'linkairdrop', "Airdrop Time!"]
             try:
-                for word in words:
-                    if word in msg.content:
-                        time_ago = datetime.utcnow() - msg.author.joined_at
-                        msg_text = f"Bot spam message in [{msg.guild.name}] - [{msg.channel.name}] by " \
-                                   f"{msg.author.name} (joined {time_ago.seconds//3600}h " \
-                                   f"{time_ago.seconds%3600//60}m ago [{time_ago}])```{msg.content}```"
-                        await self.bot.get_user(self.bot.owner_id).send(msg_text)
-                        if str(msg.author.guild.id) not in self.bot.db['auto_bans']:
-                            return
-                        if self.bot.db['auto_bans'][str(msg.author.guild.id)]['enable']:
-                            if time_ago < timedelta(minutes=20) or \
-                                    (msg.channel.id == 559291089018814464 and time_ago < timedelta(hours=5)):
-                                if msg.author.id in [202995638860906496, 414873201349361664]:
-                                    return
-                                await msg.author.ban(reason=f'For posting spam link: {msg.content}',
-                                                     delete_message_days=1)
-                                self.bot.db['global_blacklist']['blacklist'].append(msg.author.id)
-                                channel = self.bot.get_channel(BLACKLIST_CHANNEL_ID)
-                                emb = hf.red_embed(f"{msg.author.id} (automatic addition)")
-                                emb.add_field(name="Reason", value=msg.content)
-                                await hf.safe_send(channel, embed=emb)
-                                created_ago = datetime.utcnow() - msg.author.created_at
-                                joined_ago = datetime.utcnow() - msg.author.joined_at
-                                message = f"**Banned a user for posting a {word} link.**" \
-                                          f"\n**ID:** {msg.author.id}" \
-                                          f"\n**Server:** {msg.author.guild.name}" \
-                                          f"\n**Name:** {msg.author.name} {msg.author.mention}" \
-                                          f"\n**Account creation:** {msg.author.created_at} " \
-                                          f"({created_ago.days}d {created_ago.seconds//3600}h ago)" \
-                                          f"\n**Server join:** {msg.author.joined_at} " \
-                                          f"({joined_ago.days}d {joined_ago.seconds//3600}h ago)" \
-                                          f"\n**Message:** {msg.content}"
-                                emb2 = hf.red_embed(message)
-                                emb2.color = discord.Color(int('000000', 16))
-                                await self.bot.get_channel(BANS_CHANNEL_ID).send(embed=emb2)
-                                if str(msg.guild.id) in self.bot.db['bans']:
-                                    if self.bot.db['bans'][str(msg.guild.id)]['channel']:
-                                        channel_id = self.bot.db['bans'][str(msg.guild.id)]['channel']
-                                        await self.bot.get_channel(channel_id).send(embed=emb2)
+                for word in SPAM_LINK_WORDS.hits(msg.content):
+                    time_ago = datetime.utcnow() - msg.author.joined_at
+                    msg_text = f"Bot spam message in [{msg.guild.name}] - [{msg.channel.name}] by " \
+                               f"{msg.author.name} (joined {time_ago.seconds//3600}h " \
+                               f"{time_ago.seconds%3600//60}m ago [{time_ago}])```{msg.content}```"
+                    await self.bot.get_user(self.bot.owner_id).send(msg_text)
+                    if str(msg.author.guild.id) not in self.bot.db['auto_bans']:
+                        return
+                    if self.bot.db['auto_bans'][str(msg.author.guild.id)]['enable']:
+                        if time_ago < timedelta(minutes=20) or \
+                                (msg.channel.id == 559291089018814464 and time_ago < timedelta(hours=5)):
+                            if msg.author.id in [202995638860906496, 414873201349361664]:
                                 return
+                            await msg.author.ban(reason=f'For posting spam link: {msg.content}',
+                                                 delete_message_days=1)
+                            self.bot.db['global_blacklist']['blacklist'].append(msg.author.id)
+                            channel = self.bot.get_channel(BLACKLIST_CHANNEL_ID)
+                            emb = hf.red_embed(f"{msg.author.id} (automatic addition)")
+                            emb.add_field(name="Reason", value=msg.content)
+                            await hf.safe_send(channel, embed=emb)
+                            created_ago = datetime.utcnow() - msg.author.created_at
+                            joined_ago = datetime.utcnow() - msg.author.joined_at
+                            message = f"**Banned a user for posting a {word} link.**" \
+                                      f"\n**ID:** {msg.author.id}" \
+                                      f"\n**Server:** {msg.author.guild.name}" \
+                                      f"\n**Name:** {msg.author.name} {msg.author.mention}" \
+                                      f"\n**Account creation:** {msg.author.created_at} " \
+                                      f"({created_ago.days}d {created_ago.seconds//3600}h ago)" \
+                                      f"\n**Server join:** {msg.author.joined_at} " \
+                                      f"({joined_ago.days}d {joined_ago.seconds//3600}h ago)" \
+                                      f"\n**Message:** {msg.content}"
+                            emb2 = hf.red_embed(message)
+                            emb2.color = discord.Color(int('000000', 16))
+                            await self.bot.get_channel(BANS_CHANNEL_ID).send(embed=emb2)
+                            if str(msg.guild.id) in self.bot.db['bans']:
+                                if self.bot.db['bans'][str(msg.guild.id)]['channel']:
+                                    channel_id = self.bot.db['bans'][str(msg.guild.id)]['channel']
+                                    await self.bot.get_channel(channel_id).send(embed=emb2)
+                            return True
 
             except KeyError as e:
                 print(f'>>passed for key error on amazingsexdating: {e}<<')
@@ -386,12 +370,10 @@ class General(commands.Cog):
                 print(f'>>passed for attributeerror in amazingsexdating: {e}<<')
                 pass
 
-        await spam_account_bans()
-
         """spanish server welcome channel module"""
         async def smart_welcome(msg):
             if msg.channel.id == SP_SERVER_ID:
-                content = re.sub('> .*\n', '', msg.content.casefold())  # remove quotes in case the user quotes bot
+                content = re.sub('> .*\n', '', text.casefold)  # remove quotes in case the user quotes bot
                 content = content.translate(str.maketrans('', '', string.punctuation))  # remove punctuation
                 for word in ['hello', 'hi', 'hola', 'thanks', 'gracias']:
                     if content == word:
@@ -474,50 +456,50 @@ class General(commands.Cog):
                        "Before using the server, please read the rules in <#243859172268048385>.\n" \
                        "Antes de usar el servidor, por favor lee las reglas en <#499544213466120192>."
                 await hf.safe_send(msg.channel, msg.author.mention + txt1 + txt2)
-        await smart_welcome(msg)
 
         """mods ping on spanish server"""
-        if msg.guild.id in [SP_SERVER_ID, JP_SERVER_ID]:
-            if '<@&642782671109488641>' in msg.content or '<@&240647591770062848>' in msg.content:
-                em = discord.Embed(title=f"Staff Ping",
-                                   description=f"From {msg.author.mention} ({msg.author.name}) "
-                                               f"in {msg.channel.mention}\n[Jump URL]({msg.jump_url})",
-                                   color=discord.Color(int('FFAA00', 16)),
-                                   timestamp=datetime.utcnow())
-                content = msg.content.replace('<@&642782671109488641>', '').replace('<@&240647591770062848>', '')
-                if content:
-                    em.add_field(name="Content", value=content)
-                for user in self.bot.db['staff_ping'][str(msg.guild.id)]:
-                    await hf.safe_send(self.bot.get_user(user), embed=em)
-                if msg.guild.id == SP_SERVER_ID:
-                    await hf.safe_send(msg.guild.get_channel(643077231534407690), embed=em)
-                if msg.guild.id == JP_SERVER_ID:
-                    await hf.safe_send(msg.guild.get_channel(755269708579733626), embed=em)
+        async def staff_ping():
+            if msg.guild.id in [SP_SERVER_ID, JP_SERVER_ID]:
+                if '<@&642782671109488641>' in msg.content or '<@&240647591770062848>' in msg.content:
+                    em = discord.Embed(title=f"Staff Ping",
+                                       description=f"From {msg.author.mention} ({msg.author.name}) "
+                                                   f"in {msg.channel.mention}\n[Jump URL]({msg.jump_url})",
+                                       color=discord.Color(int('FFAA00', 16)),
+                                       timestamp=datetime.utcnow())
+                    content = msg.content.replace('<@&642782671109488641>', '').replace('<@&240647591770062848>', '')
+                    if content:
+                        em.add_field(name="Content", value=content)
+                    for user in self.bot.db['staff_ping'][str(msg.guild.id)]:
+                        await hf.safe_send(self.bot.get_user(user), embed=em)
+                    if msg.guild.id == SP_SERVER_ID:
+                        await hf.safe_send(msg.guild.get_channel(643077231534407690), embed=em)
+                    if msg.guild.id == JP_SERVER_ID:
+                        await hf.safe_send(msg.guild.get_channel(755269708579733626), embed=em)
 
         """Replace .mute on spanish server"""
-        if msg.guild.id == SP_SERVER_ID:
-            if msg.content.startswith('.mute'):
-                ctx = await self.bot.get_context(msg)
-                if not hf.submod_check(ctx):
-                    return
-                args = msg.content.split()[1:]
-                if len(args) == 1:
-                    await ctx.invoke(self.bot.get_command('mute'), args[0])
-                elif len(args) > 1:
-                    await ctx.invoke(self.bot.get_command('mute'), args[0], member=' '.join(args[1:]))
-                else:
-                    await hf.safe_send(ctx, "Use `;mute` instead")
+        async def replace_mute():
+            if msg.guild.id == SP_SERVER_ID:
+                if msg.content.startswith('.mute'):
+                    ctx = await self.bot.get_context(msg)
+                    if not hf.submod_check(ctx):
+                        return
+                    args = msg.content.split()[1:]
+                    if len(args) == 1:
+                        await ctx.invoke(self.bot.get_command('mute'), args[0])
+                    elif len(args) > 1:
+                        await ctx.invoke(self.bot.get_command('mute'), args[0], member=' '.join(args[1:]))
+                    else:
+                        await hf.safe_send(ctx, "Use `;mute` instead")
 
         """super_watch"""
         async def super_watch():
-            try:
-                config = self.bot.db['super_watch'][str(msg.guild.id)]
-            except KeyError:
+            config = self.bot.db['super_watch'].get(msg.guild.id)
+            if config is None:
                 return
-            if str(msg.author.id) in config['users']:
+            if str(msg.author.id) in config.users:
                 desc = "❗ "
                 which = 'sw'
-            elif hf.count_messages(msg.author) < 10 and config.get('enable', None):
+            elif config.get('enable', None) and hf.count_messages(msg.author) < 10:
                 minutes_ago_created = int(((datetime.utcnow() - msg.author.created_at).total_seconds()) // 60)
                 if minutes_ago_created > 60 or msg.channel.id == SP_SERVER_ID:
                     return
@@ -532,21 +514,21 @@ class General(commands.Cog):
 
             link = f"\n([Jump URL]({msg.jump_url})"
             if which == 'sw':
-                if config['users'][str(msg.author.id)]:
-                    link += f" － [Entry Reason]({config['users'][str(msg.author.id)]})"
+                if config.users[str(msg.author.id)]:
+                    link += f" － [Entry Reason]({config.users[str(msg.author.id)]})"
             link += ')'
             emb.add_field(name="Message:", value=msg.content[:2000-len(link)] + link)
 
-            await hf.safe_send(self.bot.get_channel(config['channel']), embed=emb)
-        await super_watch()
+            await hf.safe_send(self.bot.get_channel(config.channel), embed=emb)
 
         """Lang check: will check if above 3 characters + hardcore, or if above 15 characters + stats"""
         async def lang_check():
             lang = None
             hardcore = False
-            if str(msg.guild.id) not in self.bot.stats:
+            stats_config = self.bot.stats.get(msg.guild.id)
+            if stats_config is None:
                 return None, False
-            stripped_msg = hf.rem_emoji_url(msg)
+            stripped_msg = text.stripped
             check_lang = False
 
             if msg.guild.id == SP_SERVER_ID and '*' not in msg.content and len(stripped_msg):
@@ -557,106 +539,61 @@ class General(commands.Cog):
                             check_lang = True
                             hardcore = True
 
-            if str(msg.guild.id) in self.bot.stats:
-                if len(stripped_msg) > 15 and self.bot.stats[str(msg.guild.id)].get('enable', None):
-                    check_lang = True
+            if len(stripped_msg) > 15 and stats_config.get('enable', None):
+                check_lang = True
 
             if check_lang:
-                try:
-                    pass
-                    if msg.guild.id == 243838819743432704:
-                        if hasattr(self.bot, 'langdetect'):
-                            lang = hf.detect_language(stripped_msg)
-                        else:
-                            return None, False
+                sp_model = msg.guild.id == 243838819743432704
+                if not hasattr(self.bot, 'langdetect' if sp_model else 'langid'):
+                    return None, False
+                key = (sp_model, hf.lang_cache_key(stripped_msg))
+                lang = self.bot.lang_cache.get(key)
+                if lang is MISSING:
+                    if sp_model:
+                        lang = await self.bot.lang_batcher.detect(stripped_msg)
                     else:
-                        lang = await hf.textblob_detect_language(stripped_msg)
-                except (textblob.exceptions.TranslatorError, HTTPError, TimeoutError):
-                    pass
+                        lang = hf.identify_language(stripped_msg)
+                    self.bot.lang_cache.set(key, lang)
             return lang, hardcore
-        lang, hardcore = await lang_check()
 
         """Message counting"""
+        # counters live in self.bot.stats_db (stats.sqlite3), self.bot.stats only keeps the settings (a StatsConfig):
         # 'stats':
-        #     guild id: str:
+        #     guild id: int:
         #         'enable' = True/False
-        #         'messages' (for ,u):
-        #             {20200403:
-        #                 {user id: str:
-        #                   'emoji': {emoji1: 1, emoji2: 3},
-        #                   'lang': {'eng': 25, 'sp': 30},
-        #                   'channels': {
-        #                     channel id: str: 30,
-        #                     channel id: str: 20}
-        #                 user_id2:
-        #                   emoji: {emoji1: 1, emoji2: 3},
-        #                   lang: {'eng': 25, 'sp': 30},
-        #                   channels: {
-        #                     channel1: 40,
-        #                     channel2: 10}
-        #                 ...}
-        #             20200404:
-        #                 {user_id1:
-        #                   emoji: {emoji1: 1, emoji2: 3},
-        #                   lang: {'eng': 25, 'sp': 30},
-        #                   channels: {
-        #                     channel1: 30,
-        #                     channel2: 20}
-        #                 user_id2:
-        #                   emoji: {emoji1: 1, emoji2: 3},
-        #                   lang: {'eng': 25, 'sp': 30},
-        #                   channels: {
-        #                     channel1: 40,
-        #                     channel2: 10}
-        #                 ...}
-        #             ...
+        #         'hidden' = [channel id: str, ...]
+        #         'voice':
+        #             'in_voice': {user id: str: join time}
         async def msg_count():
             if msg.author.bot:
                 return
-            if str(msg.guild.id) not in self.bot.stats:
-                return
-            if not self.bot.stats[str(msg.guild.id)]['enable']:
+            stats_config = self.bot.stats.get(msg.guild.id)
+            if stats_config is None or not stats_config.enable:
                 return
 
-            config = self.bot.stats[str(msg.guild.id)]
-            date_str = datetime.utcnow().strftime("%Y%m%d")
-            if date_str not in config['messages']:
-                config['messages'][date_str] = {}
-            today = config['messages'][date_str]
-            author = str(msg.author.id)
-            channel = str(msg.channel.id)
+            stats_db = self.bot.stats_db
+            lang = (results.get('lang_check') or (None, False))[0]
 
             # message count
-            today.setdefault(author, {})
-            today[author].setdefault('channels', {})
-            today[author]['channels'][channel] = today[author]['channels'].get(channel, 0) + 1
+            stats_db.add_message(msg.guild.id, msg.author.id, msg.channel.id)
+            stats_db.add_activity(msg.guild.id, msg.channel.id)
 
             # emojis
-            emojis = re.findall(':([A-Za-z0-9\_]+):', msg.content)
-            for character in msg.content:
-                if hf.is_emoji(character):
-                    emojis.append(character)
-                if hf.is_ignored_emoji(character) and character not in self.ignored_characters:
-                    self.ignored_characters.append(character)
-
-            if emojis:
-                today[author].setdefault('emoji', {})
-                for emoji in emojis:
-                    if emoji in ['、']:
-                        continue
-                    today[author]['emoji'][emoji] = today[author]['emoji'].get(emoji, 0) + 1
-            if lang:  # language is detected in separate lang_check function
-                today[author].setdefault('lang', {})
-                today[author]['lang'][lang] = today[author]['lang'].get(lang, 0) + 1
-        await msg_count()
+            emojis = text.custom_emoji + text.emoji
+            if len(self.ignored_characters) < MAX_IGNORED_CHARACTERS:
+                self.ignored_characters.update(text.ignored_emoji)
 
-        """Ultra Hardcore"""
-        await hf.uhc_check(msg)
+            for emoji in emojis:
+                if emoji in ['、']:
+                    continue
+                stats_db.add_emoji(msg.guild.id, msg.author.id, emoji)
+            if lang:  # language is detected in separate lang_check function
+                stats_db.add_lang(msg.guild.id, msg.author.id, lang)
 
         """Chinese server hardcore mode"""
         async def cn_lang_check(check_hardcore_role=True):
-            content = re.sub("(>>>|>) .*$\n?", "", msg.content, flags=re.M)  # removes lines that start with a quote
-            if len(content) > 3:
+            content = text.unquoted  # removes lines that start with a quote
+            if len(content.content) > 3:
                 if check_hardcore_role:
                     try:
                         role = msg.guild.get_role(self.bot.db['hardcore'][str(msg.guild.id)]['role'])
@@ -670,7 +607,7 @@ class General(commands.Cog):
 
                 learning_eng = msg.guild.get_role(ENG_ROLE[msg.guild.id])  # this function is only called for two guilds
 
-                ratio = hf.jpenratio(content)
+                ratio = content.jpenratio
                 if ratio is not None:  # it might be "0" so I can't do "if ratio"
                     if learning_eng in msg.author.roles:
                         if ratio < .55:
@@ -678,7 +615,7 @@ class General(commands.Cog):
                                 await msg.delete()
                             except discord.errors.NotFound:
                                 pass
-                            if len(content) > 30:
+                            if len(content.content) > 30:
                                 await hf.long_deleted_msg_notification(msg)
                     else:
                         if ratio > .45:
@@ -686,23 +623,25 @@ class General(commands.Cog):
                                 await msg.delete()
                             except discord.errors.NotFound:
                                 pass
-                            if len(content) > 60:
+                            if len(content.content) > 60:
                                 await hf.long_deleted_msg_notification(msg)
 
-        if msg.guild.id in [CH_SERVER_ID, CL_SERVER_ID]:
-            try:
-                if msg.channel.id in self.bot.db['forcehardcore']:
-                    await cn_lang_check(check_hardcore_role=False)
+        async def chinese_server_hardcore():
+            if msg.guild.id in [CH_SERVER_ID, CL_SERVER_ID]:
+                try:
+                    if msg.channel.id in self.bot.db['forcehardcore']:
+                        await cn_lang_check(check_hardcore_role=False)
 
-                elif msg.guild.id == CH_SERVER_ID:
-                    if ('*' not in msg.content
-                            and msg.channel.id not in self.bot.db['hardcore'][str(CH_SERVER_ID)]['ignore']):
-                        await cn_lang_check()
-            except KeyError:
-                self.bot.db['forcehardcore'] = []
+                    elif msg.guild.id == CH_SERVER_ID:
+                        if ('*' not in msg.content
+                                and msg.channel.id not in self.bot.db['hardcore'][str(CH_SERVER_ID)]['ignore']):
+                            await cn_lang_check()
+                except KeyError:
+                    self.bot.db['forcehardcore'] = []
 
         """Spanish server hardcore"""
         async def spanish_server_hardcore():
+            lang, hardcore = results.get('lang_check') or (None, False)
             if not hardcore:  # this should be set in the lang_check function
                 return
             learning_eng = msg.guild.get_role(247021017740869632)
@@ -716,7 +655,7 @@ class General(commands.Cog):
                     if len(msg.content) > 30:
                         await hf.long_deleted_msg_notification(msg)
             elif learning_sp in msg.author.roles:  # learning Spanish, delete all English
-                if 'holi' in msg.content.casefold():
+                if 'holi' in text.casefold:
                     return
                 if lang == 'en':
                     try:
@@ -734,7 +673,6 @@ class General(commands.Cog):
                                           "page")
                 except discord.errors.Forbidden:
                     pass
-        await spanish_server_hardcore()
 
         """no filter hc"""
         async def no_filter_hc():
@@ -743,7 +681,7 @@ class General(commands.Cog):
                 enRole = msg.guild.get_role(197100137665921024)
                 if jpRole in msg.author.roles and enRole in msg.author.roles:
                     return
-                ratio = hf.jpenratio(msg.content.casefold())
+                ratio = text.jpenratio
                 nf = "<#193966083886153729>"
                 if ratio is None:
                     return
@@ -766,7 +704,29 @@ class General(commands.Cog):
                             await msg.author.send(f"```{msg.content[:1993]}```")
                         except (discord.errors.NotFound, discord.Forbidden):
                             pass
-        await no_filter_hc()
+
+        # Stages with nothing in `after` start right away and run side by side.  The moderation stages are terminal:
+        # when one of them bans/deletes, stages that haven't started yet (the hardcore modes, which wait for them)
+        # are skipped.
+        moderation = ('antispam_check', 'wordfilter', 'self_mute', 'chinese_banned_words', 'spam_account_bans')
+        stages += [Stage('antispam_check', antispam_check, terminal=True),
+                   Stage('wordfilter', wordfilter, terminal=True),
+                   Stage('self_mute', self_mute, terminal=True),
+                   Stage('chinese_banned_words', chinese_banned_words, terminal=True),
+                   Stage('spam_account_bans', spam_account_bans, terminal=True),
+                   Stage('mention_ping', mention_ping),
+                   Stage('check_guilds', check_guilds, timeout=60),
+                   Stage('smart_welcome', lambda: smart_welcome(msg)),
+                   Stage('staff_ping', staff_ping),
+                   Stage('replace_mute', replace_mute),
+                   Stage('super_watch', super_watch),
+                   Stage('lang_check', lang_check, timeout=10),
+                   Stage('msg_count', msg_count, after=('lang_check',)),
+                   Stage('uhc_check', lambda: hf.uhc_check(msg, text), after=moderation),
+                   Stage('chinese_server_hardcore', chinese_server_hardcore, after=moderation),
+                   Stage('spanish_server_hardcore', spanish_server_hardcore, after=moderation + ('lang_check',)),
+                   Stage('no_filter_hc', no_filter_hc, after=moderation)]
+        await run_stages(stages, results)
 
     @commands.command(hidden=True)
     @commands.bot_has_permissions(send_messages=True)
@@ -1118,14 +1078,7 @@ class General(commands.Cog):
                     emoji = reaction.emoji.name
                 except AttributeError:
                     emoji = reaction.emoji
-                config = self.bot.stats[str(user.guild.id)]
-                date_str = datetime.utcnow().strftime("%Y%m%d")
-                if date_str not in config['messages']:
-                    config['messages'][date_str] = {}
-                today = config['messages'][date_str]
-                today.setdefault(str(user.id), {})
-                today[str(user.id)].setdefault('emoji', {})
-                today[str(user.id)]['emoji'][emoji] = today[str(user.id)]['emoji'].get(emoji, 0) + 1
+                self.bot.stats_db.add_emoji(user.guild.id, user.id, emoji)
         count_emojis_for_stats()
 
         "Remove reactions for if you're self muted"
@@ -1442,7 +1395,11 @@ class General(commands.Cog):
             lang_result = f"English: {round(probs[0], 3)}\nSpanish: {round(probs[1], 3)}"
             ctx.command.reset_cooldown(ctx)
         else:
-            lang_result = await hf.textblob_detect_language(stripped_msg)
+            script, ranking = self.bot.langid.rank(stripped_msg)
+            lang_result = f"{hf.identify_language(stripped_msg)} (script: {script})\n"
+            for confidence, lang in ranking[:3]:
+                lang_result += f"{lang}: confidence {round(confidence, 3)}, " \
+                               f"needs {round(self.bot.langid.threshold(lang), 3)}\n"
         str = f"Your message:```{msg}```" \
               f"The message I see (no emojis or urls): ```{stripped_msg}```" \
               f"The language I detect: ```{lang_result}```"
@@ -1992,7 +1949,8 @@ class General(commands.Cog):
             await hf.safe_send(ctx, "Doing first-time setup of mute module.  I will create a `rai-mute` role, "
                                     "add then a permission override for it to every channel to prevent communication")
             role = await ctx.guild.create_role(name='rai-voice-mute', reason="For use with ;voicemute command")
-            config = self.bot.db['voice_mutes'][str(ctx.guild.id)] = {'role': role.id, 'timed_mutes': {}}
+            self.bot.db['voice_mutes'][str(ctx.guild.id)] = {'role': role.id, 'timed_mutes': {}}
+            config = self.bot.db['voice_mutes'][str(ctx.guild.id)]
             failed_channels = await set_channel_overrides(role)
             if failed_channels:
                 await hf.safe_send(ctx,
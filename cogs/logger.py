@@ -22,6 +22,7 @@ JP_SERV_JHO_ID = 189571157446492161
 BANS_CHANNEL_ID = 329576845949534208
 ABELIAN_ID = 414873201349361664
 SPAM_CHAN = 275879535977955330
+_invite_name = re.compile(r'(discord|discordapp).(gg|com/invite)/[A-Z0-9]{1,7}', re.I)
 
 with open(f'{dir_path}/gitignore/imgur_token.txt', 'r') as file:
     file.readline()  # comment line in text file
@@ -196,12 +197,8 @@ class Logger(commands.Cog):
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        guild = str(member.guild.id)
-        if guild in self.bot.db['voice']:
-            guild_config: dict = self.bot.db['voice'][guild]
-            if not guild_config['enable'] or not guild_config['channel']:
-                return
-        else:
+        guild_config = self.bot.db['voice'].get(member.guild.id)
+        if guild_config is None or not guild_config.enable or not getattr(guild_config, 'channel', None):
             return
 
         try:
@@ -289,12 +286,8 @@ class Logger(commands.Cog):
     @commands.Cog.listener()
     async def on_guild_channel_create(self, channel):
         """For use with voice_logging if someone creates a private voice channel"""
-        guild = str(channel.guild.id)
-        if guild in self.bot.db['voice']:
-            guild_config: dict = self.bot.db['voice'][guild]
-            if not guild_config['enable'] or not guild_config['channel']:
-                return
-        else:
+        guild_config = self.bot.db['voice'].get(channel.guild.id)
+        if guild_config is None or not guild_config.enable or not getattr(guild_config, 'channel', None):
             return
 
         description = f"⤴ **#{channel.name}** has been created."
@@ -376,11 +369,10 @@ class Logger(commands.Cog):
     async def on_message_edit(self, before, after):
         if isinstance(before.channel, discord.DMChannel):
             return
-        guild = str(before.guild.id)
         if not before.author.bot:
-            if guild in self.bot.db['edits']:
-                guild_config: dict = self.bot.db['edits'][guild]
-                if guild_config['enable']:
+            guild_config = self.bot.db['edits'].get(before.guild.id)
+            if guild_config is not None:
+                if guild_config.enable:
                     try:
                         distance_limit = guild_config["distance_limit"]
                     except KeyError:
@@ -503,11 +495,10 @@ class Logger(commands.Cog):
             return  # for keeping anonymous reports anonymous
         if not message.guild:
             return
-        guild = str(message.guild.id)
         if not message.author.bot:
-            if guild in self.bot.db['deletes']:
-                guild_config: dict = self.bot.db['deletes'][guild]
-                if guild_config['enable']:
+            guild_config = self.bot.db['deletes'].get(message.guild.id)
+            if guild_config is not None:
+                if guild_config.enable:
                     try:
                         channel = self.bot.get_channel(guild_config["channel"])
                     except KeyError:
@@ -982,8 +973,7 @@ class Logger(commands.Cog):
         """ban invite link names"""
         try:
             if self.bot.db['auto_bans'][guild]['enable']:
-                pat = re.compile(r'.*(discord|discordapp).(gg|com/invite)/[A-Z0-9]{1,7}.*', re.I)
-                if re.match(pat, member.name):
+                if _invite_name.search(member.name):
                     guild = str(member.guild.id)
                     await member.ban(reason="Name was a discord invite link")
                     message = f"Banned user `{member.name}` from {member.guild.name} for being an invite link name\n" \
@@ -1128,7 +1118,8 @@ class Logger(commands.Cog):
                 if 'roles' in config:
                     codes = {str(y): x for x, y in config['roles'].items()}  # {str(role_id): index} dictionary
                 else:
-                    codes = config['roles'] = {}
+                    config['roles'] = {}
+                    codes = {}
                 found_roles = []
                 for role in member.roles:
                     if role.name in ['Nitro Booster', 'New User'] or role.id in [249695630606336000, member.guild.id]:
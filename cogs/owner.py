@@ -11,6 +11,7 @@ import json
 from .utils import helper_functions as hf
 import re
 from ast import literal_eval
+from collections.abc import Mapping
 
 import datetime
 from datetime import datetime, timedelta
@@ -131,7 +132,7 @@ class Owner(commands.Cog):
             msg += f"{key_str}\n"
 
             if int(depth) >= 2:
-                if isinstance(config[key], dict):
+                if isinstance(config[key], Mapping):
                     for key_2 in config[key]:
                         if type(key_2) == str:
                             key_2_str = f'\"{key_2}\"'
@@ -140,7 +141,7 @@ class Owner(commands.Cog):
                         msg += f"\t{key_2_str}\n"
 
                         if int(depth) >= 3:
-                            if isinstance(config[key][key_2], dict):
+                            if isinstance(config[key][key_2], Mapping):
                                 for key_3 in config[key][key_2]:
                                     if type(key_3) == str:
                                         key_3_str = f'\"{key_3}\"'
@@ -149,7 +150,7 @@ class Owner(commands.Cog):
                                     msg += f"\t\t{key_3_str}\n"
 
                                     if int(depth) >= 4:
-                                        if isinstance(config[key][key_2][key_3], dict):
+                                        if isinstance(config[key][key_2][key_3], Mapping):
                                             for key_4 in config[key][key_2][key_3]:
                                                 if type(key_4) == str:
                                                     key_4_str = f'\"{key_4}\"'
@@ -203,6 +204,33 @@ class Owner(commands.Cog):
             in_voice_users += f"{member.display_name} - {config[user_id]}\n"
         await hf.safe_send(ctx, in_voice_users)
 
+    @commands.command(aliases=['retrain'], hidden=True)
+    async def retrain_langdetect(self, ctx):
+        """Retrains the language detection model on the CSVs in cogs/utils and saves it"""
+        await ctx.message.add_reaction('⏳')
+        train_time, load_time = await hf.retrain_language_detection_model()
+        await hf.safe_send(ctx, f"Retrained the language detection model in {train_time:.1f}s and saved it "
+                                f"(loading it from the cache takes {load_time * 1000:.0f}ms)")
+
+    @commands.command(hidden=True)
+    async def retrain_langid(self, ctx):
+        """Retrains the offline language identifier on the Tatoeba exports in cogs/utils/langid and saves it (without
+        any exports, reloads the bundled profiles)"""
+        await ctx.message.add_reaction('⏳')
+        train_time = await hf.retrain_language_identifier()
+        await hf.safe_send(ctx, f"Retrained the language identifier in {train_time:.1f}s "
+                                f"({len(self.bot.langid.profiles)} languages from n-grams)")
+
+    @commands.command(hidden=True)
+    async def langcache(self, ctx, size: int = None, ttl: int = None):
+        """Shows the hit rate of the language detection cache.  `;langcache <size> [ttl seconds]` resizes it."""
+        cache = self.bot.lang_cache
+        if size is not None:
+            cache.resize(size, ttl)
+        await hf.safe_send(ctx, f"Language cache: {len(cache)}/{cache.maxsize} entries, {cache.ttl}s TTL\n"
+                                f"{cache.hits} hits, {cache.misses} misses ({cache.expired} of them expired), "
+                                f"hit rate {cache.hit_rate:.1%}")
+
     @commands.command(hidden=True)
     async def flush(self, ctx):
         """Flushes stderr/stdout"""
@@ -240,24 +268,54 @@ class Owner(commands.Cog):
     @commands.command(aliases=['sdb', 'dump'], hidden=True)
     async def savedatabase(self, ctx):
         """Saves the database"""
-        await hf.dump_json()
+        db_result, stats_result = await hf.dump_json()
         await ctx.message.add_reaction('\u2705')
+        if ctx.command.name == 'savedatabase':
+            await hf.safe_send(ctx, f"db: wrote {db_result.files} files ({db_result.guilds} guild shards), "
+                                    f"{db_result.bytes / 1024:.1f} KB\n"
+                                    f"stats: wrote {stats_result.guilds} guild shards, "
+                                    f"{stats_result.bytes / 1024:.1f} KB")
 
     @commands.command(aliases=['rdb'], hidden=True)
     async def reload_database(self, ctx):
         """Reloads the database"""
-        with open(f"{dir_path}/db.json", "r") as read_file:
-            self.bot.db = json.load(read_file)
+        self.bot.db = self.bot.db_store.load()
         self.bot.ID = self.bot.db["ID"]
         await ctx.message.add_reaction('♻')
 
     @commands.command(aliases=['rsdb'], hidden=True)
     async def reload_stats(self, ctx):
         """Reloads the messages"""
-        with open(f"{dir_path}/stats.json", "r") as read_file:
-            self.bot.stats = json.load(read_file)
+        self.bot.stats = self.bot.stats_store.load()
         await ctx.message.add_reaction('♻')
 
+    @commands.group(invoke_without_command=True, hidden=True)
+    async def backups(self, ctx):
+        """Lists the kept database backups"""
+        generations = await self.bot.loop.run_in_executor(None, self.bot.backups.generations)
+        if not generations:
+            await hf.safe_send(ctx, "There are no backups yet")
+            return
+        msg = "```Backup           Kept as                 New data\n"
+        for name, kept_as, new_bytes in generations:
+            msg += f"{name}    {', '.join(kept_as):<20}    {new_bytes / 1024:.1f} KB\n"
+        msg += "```Restore one with `;backups restore <backup>`"
+        await hf.safe_send(ctx, msg)
+
+    @backups.command(name='restore')
+    async def backups_restore(self, ctx, name):
+        """Replaces the database and stats with a backup (the current state is backed up first)"""
+        if name not in [generation[0] for generation in
+                        await self.bot.loop.run_in_executor(None, self.bot.backups.generations)]:
+            await hf.safe_send(ctx, "I couldn't find that backup. Check `;backups` for the list.")
+            return
+        try:
+            await hf.restore_backup(name)
+        except Exception as e:
+            await hf.safe_send(ctx, f'**`ERROR:`** {type(e).__name__} - {e}')
+            raise
+        await hf.safe_send(ctx, f"Restored the backup from {name}")
+
     @commands.command(hidden=True)
     async def saveMessages(self, ctx):
         """Saves all messages in a channel to a text file"""
@@ -511,6 +569,14 @@ class Owner(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
+        for store in [self.bot.db_store, self.bot.stats_store]:
+            if store.active_guilds is not None:
+                store.active_guilds.add(str(guild.id))
+            if str(guild.id) in store.unloaded:  # a guild the bot was in before
+                store.load_guild(str(guild.id))
+        if 'messages' in self.bot.stats.get(guild.id, {}):  # counters from before stats.sqlite3
+            if self.bot.migrate_stats():
+                await hf.dump_json()
         msg = f"""__New guild__
         **Name:** {guild.name}
         **Owner:** {guild.owner.mention} ({guild.owner.name}#{guild.owner.discriminator}))
@@ -7,6 +7,7 @@ import re
 import os
 dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 SPAM_CHAN = 275879535977955330
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
 
 
 class Stats(commands.Cog):
@@ -21,6 +22,14 @@ class Stats(commands.Cog):
         else:
             raise commands.NoPrivateMessage
 
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.bot.join_order.add(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.bot.join_order.remove(member)
+
     lang_codes_dict = {'af': 'Afrikaans', 'ga': 'Irish', 'sq': 'Albanian', 'it': 'Italian', 'ar': 'Arabic',
                        'ja': 'Japanese', 'az': 'Azerbaijani', 'kn': 'Kannada', 'eu': 'Basque', 'ko': 'Korean',
                        'bn': 'Bengali', 'la': 'Latin', 'be': 'Belarusian', 'lv': 'Latvian', 'bg': 'Bulgarian',
@@ -45,19 +54,11 @@ class Stats(commands.Cog):
             member = await hf.member_converter(ctx, member)
             if not member:
                 return
-        try:
-            config = self.bot.stats[str(ctx.guild.id)]['messages']
-        except KeyError:
+        if str(ctx.guild.id) not in self.bot.stats:
             return
 
-        message_count = {}
-        for day in config:
-            if str(member.id) in config[day]:
-                if 'channels' not in config[day][str(member.id)]:
-                    continue
-                user = config[day][str(member.id)]
-                for channel in user.get('channels', []):
-                    message_count[channel] = message_count.get(channel, 0) + user['channels'][channel]
+        message_count = await self.bot.stats_db.run(self.bot.stats_db.user_channels, ctx.guild.id, member.id)
+        message_count = {str(channel): count for channel, count in message_count.items()}
         sorted_msgs = sorted(message_count.items(), key=lambda x: x[1], reverse=True)
         emb = discord.Embed(title=f'Usage stats for {member.name} ({member.nick})',
                             description="Last 30 days",
@@ -93,7 +94,14 @@ class Stats(commands.Cog):
     @commands.guild_only()
     @commands.bot_has_permissions(send_messages=True, embed_links=True)
     async def user(self, ctx, *, member: str = None):
-        """Gives info about a user.  Leave the member field blank to get info about yourself."""
+        """Gives info about a user.  Leave the member field blank to get info about yourself.
+        Add a range like `90d` or `1y` at the end to look further back than the last 30 days."""
+        since, description = None, "Last 30 days"
+        if member:
+            *rest, last_word = member.split()
+            if hf.parse_stats_range(last_word)[0]:
+                since, description = hf.parse_stats_range(last_word)
+                member = ' '.join(rest)
         if not member:
             member = ctx.author
             member_id = ctx.author.id
@@ -111,39 +119,22 @@ class Stats(commands.Cog):
                 except (discord.NotFound, discord.HTTPException):
                     await hf.safe_send(ctx, "I couldn't find the user.")
                     return
-        try:
-            config = self.bot.stats[str(ctx.guild.id)]['messages']
-        except KeyError:
+        if str(ctx.guild.id) not in self.bot.stats:
             return
 
         # ### Collect all the data from the database ###
+        channels, total_msgs_week, emojis, lang_count, voice_time = \
+            await self.bot.stats_db.run(self.bot.stats_db.user_page, ctx.guild.id, member_id, since)
+        message_count = {str(channel): count for channel, count in channels.items()}
+        total_msgs_month = sum(message_count.values())
         emoji_dict = {emoji.name: emoji for emoji in ctx.guild.emojis}
-        message_count = {}
         emoji_count = {}
-        lang_count = {}
-        total_msgs_month = 0
-        total_msgs_week = 0
-        for day in config:
-            if str(member_id) in config[day]:
-                user = config[day][str(member_id)]
-                if 'channels' not in user:
-                    continue
-                for channel in user['channels']:
-                    message_count[channel] = message_count.get(channel, 0) + user['channels'][channel]
-                    days_ago = (datetime.utcnow() - datetime.strptime(day, "%Y%m%d")).days
-                    if days_ago <= 7:
-                        total_msgs_week += user['channels'][channel]
-                    total_msgs_month += user['channels'][channel]
-                if 'emoji' in user:
-                    for emoji in user['emoji']:
-                        if emoji in emoji_dict:
-                            name = emoji_dict[emoji]
-                        else:
-                            name = emoji
-                        emoji_count[name] = emoji_count.get(name, 0) + user['emoji'][emoji]
-                if 'lang' in user:
-                    for lang in user['lang']:
-                        lang_count[lang] = lang_count.get(lang, 0) + user['lang'][lang]
+        for emoji in emojis:
+            if emoji in emoji_dict:
+                name = emoji_dict[emoji]
+            else:
+                name = emoji
+            emoji_count[name] = emoji_count.get(name, 0) + emojis[emoji]
 
         # ### Sort the data ###
         sorted_msgs = sorted(message_count.items(), key=lambda x: x[1], reverse=True)
@@ -159,11 +150,11 @@ class Stats(commands.Cog):
         else:
             title = f'Usage stats for {member_id} ({user_name}) (user left server)'
         emb = discord.Embed(title=title,
-                            description="Last 30 days",
+                            description=description,
                             color=discord.Color(int('00ccFF', 16)))
         if member:
             emb.timestamp = member.joined_at
-        emb.add_field(name="Messages sent M | W",
+        emb.add_field(name="Messages sent M | W" if not since else "Messages sent | this week",
                       value=f"{total_msgs_month} | {total_msgs_week}")
 
         # ### Find top 3 most active channels ###
@@ -203,12 +194,6 @@ class Stats(commands.Cog):
                           value=f"{channeltext}")
 
         # ### Calculate voice time / Add field to embed ###
-        voice_config = self.bot.stats[str(ctx.guild.id)]['voice']['total_time']
-        voice_time = 0
-        for day in voice_config:
-            if str(member_id) in voice_config[day]:
-                time = voice_config[day][str(member_id)]
-                voice_time += time
         hours = voice_time // 60
         minutes = voice_time % 60
         if voice_time:
@@ -218,7 +203,7 @@ class Stats(commands.Cog):
         # ### If no messages or voice in last 30 days ###
         if (not total_msgs_month or not sorted_msgs) and not voice_time:
             emb = discord.Embed(title='',
-                                description="This user hasn't said anything in the past 30 days",
+                                description=f"This user hasn't said anything in the {description.lower()}",
                                 color=discord.Color(int('00ccFF', 16)))
             if member:
                 emb.title = f"Usage stats for {member.name}"
@@ -260,20 +245,9 @@ class Stats(commands.Cog):
 
         # ### Calculate join position ###
         if member:
-            member_list = ctx.guild.members
-            for member_in_list in member_list.copy():
-                if not member_in_list.joined_at:
-                    member_list.remove(member_in_list)
-            sorted_members_by_join = sorted([(member, member.joined_at) for member in member_list],
-                                            key=lambda x: x[1],
-                                            reverse=False)
-            join_order = 0
-            for i in sorted_members_by_join:
-                if i[0].id == member.id:
-                    join_order = sorted_members_by_join.index(i)
-                    break
-            if join_order + 1:
-                emb.set_footer(text=f"(#{join_order+1} to join this server) Joined on:")
+            join_order = self.bot.join_order.rank(member)
+            if join_order:
+                emb.set_footer(text=f"(#{join_order} to join this server) Joined on:")
 
         # ### Send ###
         try:
@@ -286,10 +260,11 @@ class Stats(commands.Cog):
                 await hf.safe_send(ctx.author, "I lack the permission to send messages in that channel")
 
     @staticmethod
-    def make_leaderboard_embed(ctx, channel_in, dict_in, title):
-        sorted_dict = sorted(dict_in.items(), reverse=True, key=lambda x: x[1])
+    def make_leaderboard_embed(ctx, channel_in, ranking, title, author_rank=None, description="Last 30 days"):
+        """`ranking` is a list of (user_id, count) sorted from the top, `author_rank` is (place, count) of the
+        author for when they're further down than the end of `ranking`"""
         emb = discord.Embed(title=title,
-                            description="Last 30 days",
+                            description=description,
                             color=discord.Color(int('00ccFF', 16)),
                             timestamp=datetime.utcnow())
         if channel_in:
@@ -297,53 +272,49 @@ class Stats(commands.Cog):
                 emb.title = "Leaderboard for #" + ', #'.join([c.name for c in channel_in])
             else:
                 emb.title = f"Leaderboard for #{channel_in.name}"
+
+        def add_field(place, member, count):
+            if title.startswith("Messages"):
+                emb.add_field(name=f"{place}) {member.name}", value=count)
+            elif title.startswith("Voice"):
+                emb.add_field(name=f"{place}) {member.name}", value=f"{count // 60}h {count % 60}m")
+
         number_of_users_found = 0
         found_yourself = False
-        for i in range(len(sorted_dict)):
-            member = ctx.guild.get_member(int(sorted_dict[i][0]))
+        for user_id, count in ranking:
+            member = ctx.guild.get_member(int(user_id))
             if member:
                 if number_of_users_found < 24 or \
                         (number_of_users_found == 24 and (found_yourself or member == ctx.author)) or \
                         number_of_users_found > 24 and member == ctx.author:
-                    if title.startswith("Messages"):
-                        value = sorted_dict[i][1]
-                        emb.add_field(name=f"{number_of_users_found+1}) {member.name}",
-                                      value=sorted_dict[i][1])
-                    elif title.startswith("Voice"):
-                        hours = sorted_dict[i][1] // 60
-                        minutes = sorted_dict[i][1] % 60
-                        emb.add_field(name=f"{number_of_users_found+1}) {member.name}",
-                                      value=f"{hours}h {minutes}m")
+                    add_field(number_of_users_found + 1, member, count)
                 number_of_users_found += 1
                 if member == ctx.author:
                     found_yourself = True
             if number_of_users_found >= 25 and found_yourself:
                 break
+        if not found_yourself and author_rank and number_of_users_found >= 24:
+            add_field(author_rank[0], ctx.author, author_rank[1])
         return emb
 
-    async def make_lb(self, ctx, channels_in):
-        try:
-            config = self.bot.stats[str(ctx.guild.id)]['messages']
-        except KeyError:
+    async def make_lb(self, ctx, channels_in, since=None, description="Last 30 days"):
+        if str(ctx.guild.id) not in self.bot.stats:
             return
-        msg_count = {}
+        channel_ids = None
         if isinstance(channels_in, list):
             channel_ids = [c.id for c in channels_in]
-        for day in config:
-            for user in config[day]:
-                if 'channels' not in config[day][user]:
-                    continue
-                for channel in config[day][user]['channels']:
-                    if channels_in:
-                        if int(channel) not in channel_ids:
-                            continue
-                    try:
-                        msg_count[user] += config[day][user]['channels'][channel]
-                    except KeyError:
-                        msg_count[user] = config[day][user]['channels'][channel]
+        # only members still in the guild are shown, so they're filtered while reading the ranking
+        members = {member.id for member in ctx.guild.members}
+        ranking = await self.bot.stats_db.run(self.bot.stats_db.leaderboard, ctx.guild.id, channel_ids, 25, since,
+                                              members)
+        author_rank = None
+        if ctx.author.id not in [user_id for user_id, _ in ranking]:
+            author_rank = await self.bot.stats_db.run(self.bot.stats_db.leaderboard_rank,
+                                                      ctx.guild.id, ctx.author.id, channel_ids, since, members)
+        emb = self.make_leaderboard_embed(ctx, channels_in, ranking, "Messages Leaderboard", author_rank,
+                                          description)
         try:
-            await hf.safe_send(ctx,
-                               embed=self.make_leaderboard_embed(ctx, channels_in, msg_count, "Messages Leaderboard"))
+            await hf.safe_send(ctx, embed=emb)
         except discord.Forbidden:
             try:
                 await hf.safe_send(ctx, "I lack the permissions to send embeds in this channel")
@@ -352,9 +323,14 @@ class Stats(commands.Cog):
 
     @commands.command()
     @commands.bot_has_permissions(send_messages=True, embed_links=True)
-    async def lb(self, ctx):
-        """Shows a leaderboard of the top 25 most active users this month"""
-        await self.make_lb(ctx, False)
+    async def lb(self, ctx, time_range=None):
+        """Shows a leaderboard of the top 25 most active users this month.  Give a range like `;lb 90d` or `;lb 1y`
+        to look further back."""
+        since, description = hf.parse_stats_range(time_range)
+        if time_range and not since:
+            await hf.safe_send(ctx, "Please give a range like `90d`, `12w`, `6m` or `1y`.")
+            return
+        await self.make_lb(ctx, False, since, description or "Last 30 days")
 
     @commands.command()
     @commands.bot_has_permissions(send_messages=True, embed_links=True)
@@ -387,20 +363,23 @@ class Stats(commands.Cog):
 
     @commands.command(aliases=['vclb', 'vlb', 'voicechat'])
     @commands.bot_has_permissions(send_messages=True, embed_links=True)
-    async def vc(self, ctx):
-        """Prints a leaderboard of who has the most time in voice"""
-        try:
-            config = self.bot.stats[str(ctx.guild.id)]['voice']['total_time']
-        except KeyError:
+    async def vc(self, ctx, time_range=None):
+        """Prints a leaderboard of who has the most time in voice.  Give a range like `;vc 90d` or `;vc 1y` to
+        look further back than the last 30 days."""
+        if str(ctx.guild.id) not in self.bot.stats:
             return
-        lb_dict = {}
-        for day in config:
-            for user in config[day]:
-                if user in lb_dict:
-                    lb_dict[user] += config[day][user]
-                else:
-                    lb_dict[user] = config[day][user]
-        await hf.safe_send(ctx, embed=self.make_leaderboard_embed(ctx, None, lb_dict, "Voice Leaderboard"))
+        since, description = hf.parse_stats_range(time_range)
+        if time_range and not since:
+            await hf.safe_send(ctx, "Please give a range like `90d`, `12w`, `6m` or `1y`.")
+            return
+        members = {member.id for member in ctx.guild.members}
+        ranking = await self.bot.stats_db.run(self.bot.stats_db.voice_leaderboard, ctx.guild.id, 25, since, members)
+        author_rank = None
+        if ctx.author.id not in [user_id for user_id, _ in ranking]:
+            author_rank = await self.bot.stats_db.run(self.bot.stats_db.voice_rank, ctx.guild.id, ctx.author.id,
+                                                      since, members)
+        await hf.safe_send(ctx, embed=self.make_leaderboard_embed(ctx, None, ranking, "Voice Leaderboard",
+                                                                  author_rank, description or "Last 30 days"))
 
     @commands.command(aliases=['emojis', 'emoji'])
     @commands.bot_has_permissions(embed_links=True)
@@ -414,26 +393,11 @@ class Stats(commands.Cog):
         `;emojis -me` - Shows only your emoji stats"""
         if str(ctx.guild.id) not in self.bot.stats:
             return
-        config = self.bot.stats[str(ctx.guild.id)]['messages']
-        emojis = {}
-
         if args == '-me':
-            me = True
+            user_id = ctx.author.id
         else:
-            me = False
-
-        for date in config:
-            for user_id in config[date]:
-                if me:
-                    if int(user_id) != ctx.author.id:
-                        continue
-                if 'emoji' not in config[date][user_id]:
-                    continue
-                for emoji in config[date][user_id]['emoji']:
-                    if emoji in emojis:
-                        emojis[emoji] += config[date][user_id]['emoji'][emoji]
-                    else:
-                        emojis[emoji] = config[date][user_id]['emoji'][emoji]
+            user_id = None
+        emojis = await self.bot.stats_db.run(self.bot.stats_db.emoji_counts, ctx.guild.id, user_id)
 
         emoji_dict = {emoji.name: emoji for emoji in ctx.guild.emojis}
         msg = 'Top Emojis:\n'
@@ -540,6 +504,54 @@ class Stats(commands.Cog):
                     break
             await hf.safe_send(ctx, embed=emb)
 
+    @commands.command()
+    @commands.bot_has_permissions(send_messages=True, embed_links=True)
+    async def activity(self, ctx, channel=None):
+        """Shows when the server (or one channel) is busiest, as a heatmap of messages (or time in voice for voice
+        channels) over the hours of the week in UTC.  `;activity` or `;activity #channel`"""
+        if str(ctx.guild.id) not in self.bot.stats:
+            return
+        if channel:
+            if re.findall(r"^<#\d{17,22}>$", channel):
+                channel = channel[2:-1]
+            try:
+                channel = ctx.guild.get_channel(int(channel))
+            except ValueError:
+                channel = None
+            if not channel:
+                await hf.safe_send(ctx, "I couldn't find that channel. Try `;activity #channel`.")
+                return
+        messages, minutes = await self.bot.stats_db.run(self.bot.stats_db.activity, ctx.guild.id,
+                                                        channel.id if channel else None)
+        if isinstance(channel, discord.VoiceChannel):
+            counts, unit = minutes, "minutes in voice"
+        else:
+            counts, unit = messages, "messages"
+        if not any(counts):
+            await hf.safe_send(ctx, "I don't have any activity recorded for that yet.")
+            return
+
+        shades = ' ░▒▓█'
+        busiest = max(counts)
+        heatmap = "```\n     0     6     12    18   \n"
+        for day, day_name in enumerate(WEEKDAYS):
+            row = counts[day * 24:(day + 1) * 24]
+            heatmap += f"{day_name}  " + ''.join(shades[(4 * count + busiest - 1) // busiest] for count in row) + "\n"
+        heatmap += "```"
+        top_hours = sorted(range(168), key=lambda hour: counts[hour], reverse=True)[:3]
+        heatmap += "Busiest: " + ', '.join(f"{WEEKDAYS[hour // 24]} "
+                                           f"{hour % 24:02d}:00 ({counts[hour]})" for hour in top_hours)
+
+        emb = discord.Embed(title=f"Activity of #{channel.name}" if channel else f"Activity of {ctx.guild.name}",
+                            description=heatmap, color=discord.Color(int('00ccFF', 16)))
+        emb.set_footer(text=f"Total {unit} per hour of the week, times in UTC")
+        if not channel and any(minutes):
+            busiest_voice = max(range(168), key=lambda hour: minutes[hour])
+            emb.add_field(name="Busiest hour in voice",
+                          value=f"{WEEKDAYS[busiest_voice // 24]} "
+                                f"{busiest_voice % 24:02d}:00 ({minutes[busiest_voice]} minutes)")
+        await hf.safe_send(ctx, embed=emb)
+
     @commands.group(invoke_without_command=True)
     @hf.is_admin()
     async def stats(self, ctx):
@@ -549,11 +561,9 @@ class Stats(commands.Cog):
             self.bot.stats[guild]['enable'] = not self.bot.stats[guild]['enable']
         else:
             self.bot.stats[guild] = {'enable': True,
-                                     'messages': {},
                                      'hidden': [],
                                      'voice':
-                                         {'in_voice': {},
-                                          'total_time': {}}
+                                         {'in_voice': {}}
                                      }
         await hf.safe_send(ctx, f"Logging of stats is now set to {self.bot.stats[guild]['enable']}.")
 
@@ -238,7 +238,8 @@ class Submod(commands.Cog):
             await hf.safe_send(ctx, "Doing first-time setup of mute module.  I will create a `rai-mute` role, "
                                     "add then a permission override for it to every channel to prevent communication")
             role = await ctx.guild.create_role(name='rai-mute', reason="For use with ;mute command")
-            config = self.bot.db['mutes'][str(ctx.guild.id)] = {'role': role.id, 'timed_mutes': {}}
+            self.bot.db['mutes'][str(ctx.guild.id)] = {'role': role.id, 'timed_mutes': {}}
+            config = self.bot.db['mutes'][str(ctx.guild.id)]
             failed_channels = await set_channel_overrides(role)
             if failed_channels:
                 await hf.safe_send(ctx,
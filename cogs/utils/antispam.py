@@ -0,0 +1,44 @@
+import time
+from collections import deque
+
+
+class SpamTracker:
+    """Counts repeats of the same message by the same user for the antispam module.
+
+    Each (guild, author, content hash) has a deque of the times that message was sent, and times older than the
+    guild's window are dropped from the left when the next one comes in, so deciding whether a message is spam
+    never waits for later messages and takes constant time.  Keys nobody has used for a while are swept out every
+    SWEEP_INTERVAL seconds."""
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self.windows = {}  # (guild id, author id, hash of the content): deque of time.monotonic() times
+        self.longest_window = 0
+        self.last_sweep = time.monotonic()
+
+    def is_spam(self, guild_id, author_id, content, message_threshhold, time_threshhold, now=None):
+        """Records a message and returns True once the author has sent it `message_threshhold` times within
+        `time_threshhold` seconds.  The count then starts over, so a raid triggers the action once per
+        `message_threshhold` copies instead of on every message after that."""
+        if now is None:
+            now = time.monotonic()
+        if now - self.last_sweep > self.SWEEP_INTERVAL:
+            self.sweep(now)
+        self.longest_window = max(self.longest_window, time_threshhold)
+
+        key = (guild_id, author_id, hash(content))
+        times = self.windows.get(key)
+        if times is None:
+            times = self.windows[key] = deque()
+        while times and now - times[0] > time_threshhold:
+            times.popleft()
+        times.append(now)
+        if len(times) >= message_threshhold:
+            times.clear()
+            return True
+        return False
+
+    def sweep(self, now):
+        self.windows = {key: times for key, times in self.windows.items()
+                        if times and now - times[-1] <= self.longest_window}
+        self.last_sweep = now
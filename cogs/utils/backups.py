@@ -0,0 +1,259 @@
+import os
+import json
+import zlib
+import shutil
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+
+# database_backups/
+#     chunks/ab/abcdef...    zlib compressed pieces of the database, named by the sha256 of their contents
+#     generations/20210310-140000.json    one manifest per backup, listing which chunks make up each file
+#
+# Files where every key is a guild ID are cut into one chunk per guild, everything else (like the guild shards) is
+# one chunk per file, and the stats sqlite database is cut into 1 MB blocks.  A chunk that didn't change since an
+# earlier backup is just referenced again, so a backup of a mostly unchanged database only costs a few kilobytes.
+
+SQLITE_BLOCK_SIZE = 1024 * 1024
+
+
+class BackupStore:
+    def __init__(self, directory, sources, stats_db=None, keep_hourly=24, keep_daily=7, keep_weekly=8):
+        """`sources` is a dict of {name: folder of json files}, for example {'db': 'db/', 'stats': 'stats/'}"""
+        self.directory = directory
+        self.sources = sources
+        self.stats_db = stats_db
+        self.keep = {'hourly': keep_hourly, 'daily': keep_daily, 'weekly': keep_weekly}
+        self._file_cache = {}  # sha256 of a whole file: how it was chunked, so unchanged files aren't parsed again
+        # backup/prune/restore run in executor threads.  prune() deletes every chunk no manifest lists yet, which
+        # includes the chunks of a backup that is still being written, so only one of them may run at a time.
+        self._lock = threading.RLock()
+        os.makedirs(os.path.join(directory, 'chunks'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'generations'), exist_ok=True)
+
+    def _chunk_file(self, digest):
+        return os.path.join(self.directory, 'chunks', digest[:2], digest)
+
+    def _manifest_file(self, name):
+        return os.path.join(self.directory, 'generations', f"{name}.json")
+
+    def _put(self, data):
+        """Stores one chunk if it isn't stored yet.  Returns (hash, number of new bytes written)."""
+        digest = hashlib.sha256(data).hexdigest()
+        file_name = self._chunk_file(digest)
+        if os.path.exists(file_name):
+            return digest, 0
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        with open(f"{file_name}.tmp", 'wb') as write_file:
+            write_file.write(compressed)
+        os.replace(f"{file_name}.tmp", file_name)
+        return digest, len(compressed)
+
+    def _get(self, digest):
+        with open(self._chunk_file(digest), 'rb') as read_file:
+            return zlib.decompress(read_file.read())
+
+    def _chunk_json(self, raw):
+        file_hash = hashlib.sha256(raw).hexdigest()
+        if file_hash in self._file_cache and all(os.path.exists(self._chunk_file(digest))
+                                                 for digest in _chunks_of(self._file_cache[file_hash])):
+            return self._file_cache[file_hash], 0
+        data = json.loads(raw)
+        new_bytes = 0
+        if isinstance(data, dict) and data and all(str(key).isdigit() for key in data):
+            guilds = {}
+            for guild_id, value in data.items():
+                guilds[guild_id], written = self._put(json.dumps(value).encode('utf-8'))
+                new_bytes += written
+            spec = {'guilds': guilds}
+        else:
+            digest, new_bytes = self._put(raw)
+            spec = {'chunk': digest}
+        self._file_cache[file_hash] = spec
+        return spec, new_bytes
+
+    def backup(self):
+        """Takes a backup of all sources.  This reads and compresses files, so run it in the executor.
+        Returns (name of the generation, number of new bytes written)."""
+        with self._lock:
+            return self._backup()
+
+    def _new_name(self):
+        """A generation name that isn't taken yet, like 20210310-140005 (or 20210310-140005-2 for the second backup
+        in the same second), so a backup never overwrites the manifest of an earlier one"""
+        name = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        number = 1
+        while os.path.exists(self._manifest_file(name if number == 1 else f"{name}-{number}")):
+            number += 1
+        return name if number == 1 else f"{name}-{number}"
+
+    def _backup(self, keep=()):
+        name = self._new_name()
+        manifest = {'created': name, 'sources': {}, 'sqlite': None}
+        new_bytes = 0
+        for source, folder in self.sources.items():
+            files = {}
+            for root, folders, file_names in os.walk(folder):
+                folders.sort()
+                for file_name in sorted(file_names):
+                    if not file_name.endswith('.json'):
+                        continue
+                    try:
+                        with open(os.path.join(root, file_name), 'rb') as read_file:
+                            raw = read_file.read()
+                    except FileNotFoundError:  # deleted while listing
+                        continue
+                    relative_name = os.path.relpath(os.path.join(root, file_name), folder)
+                    files[relative_name], written = self._chunk_json(raw)
+                    new_bytes += written
+            manifest['sources'][source] = files
+
+        if self.stats_db:
+            temp_file = os.path.join(self.directory, 'stats.sqlite3.tmp')
+            self.stats_db.backup(temp_file)
+            blocks = []
+            with open(temp_file, 'rb') as read_file:
+                block = read_file.read(SQLITE_BLOCK_SIZE)
+                while block:
+                    digest, written = self._put(block)
+                    blocks.append(digest)
+                    new_bytes += written
+                    block = read_file.read(SQLITE_BLOCK_SIZE)
+            os.remove(temp_file)
+            manifest['sqlite'] = blocks
+
+        manifest['new_bytes'] = new_bytes
+        with open(f"{self._manifest_file(name)}.tmp", 'w') as write_file:
+            json.dump(manifest, write_file)
+        os.replace(f"{self._manifest_file(name)}.tmp", self._manifest_file(name))
+        self._prune(keep)
+        return name, new_bytes
+
+    def _generation_names(self):
+        return sorted((file_name[:-5] for file_name in os.listdir(os.path.join(self.directory, 'generations'))
+                       if file_name.endswith('.json')), reverse=True)
+
+    def _load_manifest(self, name):
+        with open(self._manifest_file(name), 'r') as read_file:
+            return json.load(read_file)
+
+    def generations(self):
+        """Returns a list of (name, [hourly/daily/weekly], new bytes) for the kept backups, newest first"""
+        kept = _retention(self._generation_names(), self.keep)
+        generations = []
+        for name in kept:
+            try:
+                new_bytes = self._load_manifest(name).get('new_bytes', 0)
+            except FileNotFoundError:
+                continue
+            generations.append((name, kept[name], new_bytes))
+        return generations
+
+    def prune(self):
+        """Deletes the generations that fall out of the retention policy and then any chunk nobody uses anymore"""
+        with self._lock:
+            self._prune()
+
+    def _prune(self, keep=()):
+        """`keep` are generations to keep even if the retention policy drops them"""
+        names = self._generation_names()
+        kept = _retention(names, self.keep)
+        kept.update({name: [] for name in keep if name in names and name not in kept})
+        for name in names:
+            if name not in kept:
+                os.remove(self._manifest_file(name))
+
+        used = set()
+        for name in kept:
+            used.update(_chunks_of(self._load_manifest(name)))
+        chunks_folder = os.path.join(self.directory, 'chunks')
+        for prefix in os.listdir(chunks_folder):
+            for digest in os.listdir(os.path.join(chunks_folder, prefix)):
+                if digest not in used:
+                    os.remove(os.path.join(chunks_folder, prefix, digest))
+        self._file_cache = {file_hash: spec for file_hash, spec in self._file_cache.items()
+                            if all(digest in used for digest in _chunks_of(spec))}
+
+    def restore(self, name):
+        """Backs up the current files and then puts the backup `name` back in their place, so a restore can be
+        undone.  The bot has to reload its databases afterwards.  Run this in the executor.
+        Returns the name of the backup of the current files."""
+        with self._lock:
+            self._load_manifest(name)  # raises FileNotFoundError before anything is touched
+            # the retention policy only keeps the newest backup of each hour, so the backup just taken would
+            # otherwise get `name` pruned when it's from the same hour
+            current, _ = self._backup(keep=(name,))
+            self._restore(name)
+            return current
+
+    def _restore(self, name):
+        manifest = self._load_manifest(name)
+        for source, files in manifest['sources'].items():
+            folder = self.sources[source]
+            restore_folder = f"{folder}.restore"
+            shutil.rmtree(restore_folder, ignore_errors=True)
+            for file_name, spec in files.items():
+                os.makedirs(os.path.dirname(os.path.join(restore_folder, file_name)), exist_ok=True)
+                with open(os.path.join(restore_folder, file_name), 'wb') as write_file:
+                    if 'chunk' in spec:
+                        write_file.write(self._get(spec['chunk']))
+                    else:
+                        write_file.write(b'{' + b', '.join(json.dumps(guild_id).encode('utf-8') + b': ' +
+                                                           self._get(digest)
+                                                           for guild_id, digest in spec['guilds'].items()) + b'}')
+            old_folder = f"{folder}.old"
+            shutil.rmtree(old_folder, ignore_errors=True)
+            os.replace(folder, old_folder)
+            os.replace(restore_folder, folder)
+
+        if manifest['sqlite'] and self.stats_db:
+            temp_file = os.path.join(self.directory, 'stats.sqlite3.restore')
+            with open(temp_file, 'wb') as write_file:
+                for digest in manifest['sqlite']:
+                    write_file.write(self._get(digest))
+            source = sqlite3.connect(temp_file)
+            try:
+                self.stats_db.restore(source)
+            finally:
+                source.close()
+                os.remove(temp_file)
+
+
+def _chunks_of(spec):
+    """All chunk hashes used by a manifest or a part of one"""
+    if isinstance(spec, dict):
+        if 'chunk' in spec:
+            yield spec['chunk']
+        elif 'guilds' in spec:
+            yield from spec['guilds'].values()
+        else:
+            for value in spec.values():
+                yield from _chunks_of(value)
+    elif isinstance(spec, list):
+        yield from spec
+
+
+def _retention(names, keep):
+    """Decides which generations to keep: the newest backup of each of the last `keep['hourly']` hours, of the
+    last `keep['daily']` days and of the last `keep['weekly']` weeks.  Returns {name: [reasons]}, newest first."""
+    seen = {'hourly': set(), 'daily': set(), 'weekly': set()}
+    kept = {}
+    for name in sorted(names, reverse=True):
+        time = _backup_time(name)
+        keys = {'hourly': time.strftime("%Y%m%d%H"),
+                'daily': time.strftime("%Y%m%d"),
+                'weekly': time.isocalendar()[:2]}
+        for kind, key in keys.items():
+            if key not in seen[kind] and len(seen[kind]) < keep[kind]:
+                seen[kind].add(key)
+                kept.setdefault(name, []).append(kind)
+    return kept
+
+
+def _backup_time(name):
+    """The time in a generation name: 20210310-140005, 20210310-140005-2, or 20210310-1400 from before backups
+    were named to the second"""
+    day, time = name.split('-')[:2]
+    return datetime.strptime(f"{day}-{time}", "%Y%m%d-%H%M%S" if len(time) == 6 else "%Y%m%d-%H%M")
@@ -0,0 +1,153 @@
+from collections.abc import MutableMapping
+
+from .database import track
+
+
+class Config(MutableMapping):
+    """Base class of the typed per-guild configs in bot.db and bot.stats.
+
+    The fields of a config are __slots__, so a guild's config takes a fraction of the memory of a dict, and hot code
+    can read a field with a plain attribute lookup (`config.enable`).  Item access (`config['enable']`, `in`, `get()`,
+    `setdefault()`...) works exactly like it did with the old dicts, so older code doesn't need to change.  A field
+    that's missing in the json is simply not set, and keys that aren't fields of the class are kept in `_extra`, so
+    the json layout comes back out unchanged."""
+    __slots__ = ('_db', '_path', '_extra')
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.fields = tuple(field for klass in reversed(cls.__mro__) for field in klass.__dict__.get('__slots__', ())
+                           if not field.startswith('_'))
+        cls._field_set = frozenset(cls.fields)
+
+    def __init__(self, data, db, path):
+        object.__setattr__(self, '_db', db)
+        object.__setattr__(self, '_path', path)
+        object.__setattr__(self, '_extra', None)
+        for key, value in data.items():
+            if key in self._field_set:
+                object.__setattr__(self, key, track(value, db, path + (key,)))
+            else:
+                if self._extra is None:
+                    object.__setattr__(self, '_extra', {})
+                self._extra[key] = track(value, db, path + (key,))
+
+    def __setattr__(self, key, value):
+        if key not in self._field_set:
+            raise AttributeError(f"{type(self).__name__} has no field {key!r}")
+        value = track(value, self._db, self._path + (key,))
+        self._db.mark(self._path + (key,))
+        object.__setattr__(self, key, value)
+
+    def __delattr__(self, key):
+        self._db.mark(self._path + (key,))
+        object.__delattr__(self, key)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+            return
+        value = track(value, self._db, self._path + (key,))
+        self._db.mark(self._path + (key,))
+        if self._extra is None:
+            object.__setattr__(self, '_extra', {})
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._field_set:
+            delattr(self, key)
+        else:
+            self._db.mark(self._path + (key,))
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for field in self.fields:
+            if hasattr(self, field):
+                yield field
+        if self._extra is not None:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_json(self):
+        return {key: self[key] for key in self}
+
+    def copy(self):
+        return self.to_json()
+
+    def __copy__(self):
+        return self.to_json()
+
+    def __deepcopy__(self, memo):
+        from copy import deepcopy
+        return deepcopy(self.to_json(), memo)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_json()!r})"
+
+
+class ModuleConfig(Config):
+    """The logging modules: db['deletes'], db['voice'], db['nicknames'] (and the base of edits/joins)"""
+    __slots__ = ('enable', 'channel')
+
+
+class EditsConfig(ModuleConfig):
+    __slots__ = ('distance_limit',)
+
+
+class JoinsConfig(ModuleConfig):
+    __slots__ = ('invites', 'invites_enable', 'readd_roles')
+
+
+class MutesConfig(Config):
+    __slots__ = ('role', 'timed_mutes')
+
+
+class AntispamConfig(Config):
+    __slots__ = ('enable', 'action', 'message_threshhold', 'time_threshhold', 'ignored')
+
+
+class SuperWatchConfig(Config):
+    __slots__ = ('enable', 'channel', 'users')
+
+
+class StatsConfig(Config):
+    """A guild in bot.stats"""
+    __slots__ = ('enable', 'hidden', 'voice')
+
+
+# sections of bot.db keyed by int guild IDs, with the class of each guild's config (None: keep the plain value, for
+# example the channel ID in 'mod_channel' or the {word: minutes} dict in 'wordfilter')
+DB_CONFIGS = {
+    'mod_channel': None,
+    'wordfilter': None,
+    'mutes': MutesConfig,
+    'antispam': AntispamConfig,
+    'super_watch': SuperWatchConfig,
+    'joins': JoinsConfig,
+    'deletes': ModuleConfig,
+    'edits': EditsConfig,
+    'voice': ModuleConfig,
+    'nicknames': ModuleConfig,
+}
+
+# bot.stats is keyed by guild ID at the top level, which is what the `None` section means
+STATS_CONFIGS = {None: StatsConfig}
@@ -0,0 +1,639 @@
+import os
+import sys
+import json
+import shutil
+import asyncio
+import threading
+from copy import deepcopy
+from collections import namedtuple
+from collections.abc import Mapping
+
+# bot.db and bot.stats are made out of these tracked dicts/lists.  They behave exactly like normal dicts and lists,
+# but every change to them is reported to their Database, which remembers which shards (one per guild plus the global
+# one) were changed since the last save.  On save, only the files of the changed shards are written again, and if
+# nothing changed at all, nothing is written.
+#
+# Changes are reported right *before* they happen.  That's what lets saving work from a copy-on-write snapshot: the
+# shards are serialized by the executor thread from the live objects, and if the bot is about to change a shard that
+# the thread didn't get to yet, that shard is serialized on the loop first, so the save always sees every shard as it
+# was at the moment of the snapshot.
+#
+# Each node knows its path from the root, for example ('mutes', '243838819743432704', 'timed_mutes').  Items inside
+# of a list have `None` in their path instead of their index, since the index of an item can change.
+
+DumpResult = namedtuple('DumpResult', ['bytes', 'files', 'guilds'])
+
+GLOBAL = 'global'  # the shard with everything that doesn't belong to one guild
+
+
+def json_default(obj):
+    """`default` for json.dumps(), turns the typed configs from configs.py back into dicts"""
+    return obj.to_json()
+
+
+def track(value, db, path):
+    """Wraps dicts and lists (recursively) so that changes to them get reported to `db`"""
+    if isinstance(value, dict):
+        return TrackedDict(value, db, path)
+    if isinstance(value, list):
+        return TrackedList(value, db, path)
+    return value
+
+
+class TrackedDict(dict):
+    __slots__ = ('_db', '_path')
+
+    def __init__(self, data, db, path):
+        super().__init__()
+        self._db = db
+        self._path = path
+        for key, value in data.items():
+            dict.__setitem__(self, key, track(value, db, path + (key,)))
+
+    def __setitem__(self, key, value):
+        value = track(value, self._db, self._path + (key,))
+        self._db.mark(self._path + (key,))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._db.mark(self._path + (key,))
+        dict.__delitem__(self, key)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._db.mark(self._path + (key,))
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        if self:
+            self._db.mark(self._path + (next(reversed(dict.keys(self))),))
+        return dict.popitem(self)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self._db.mark(self._path)
+        dict.clear(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {deepcopy(key, memo): deepcopy(value, memo) for key, value in self.items()}
+
+
+class TrackedList(list):
+    __slots__ = ('_db', '_path')
+
+    def __init__(self, data, db, path):
+        super().__init__(track(value, db, path + (None,)) for value in data)
+        self._db = db
+        self._path = path
+
+    def _track(self, value):
+        return track(value, self._db, self._path + (None,))
+
+    def _changed(self):
+        self._db.mark(self._path)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [self._track(v) for v in value]
+        else:
+            value = self._track(value)
+        self._changed()
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._changed()
+        list.__delitem__(self, index)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        self._changed()
+        list.__imul__(self, n)
+        return self
+
+    def append(self, value):
+        value = self._track(value)
+        self._changed()
+        list.append(self, value)
+
+    def extend(self, values):
+        values = [self._track(v) for v in values]
+        self._changed()
+        list.extend(self, values)
+
+    def insert(self, index, value):
+        value = self._track(value)
+        self._changed()
+        list.insert(self, index, value)
+
+    def remove(self, value):
+        self._changed()
+        list.remove(self, value)
+
+    def pop(self, *index):
+        self._changed()
+        return list.pop(self, *index)
+
+    def clear(self):
+        self._changed()
+        list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self._changed()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._changed()
+        list.reverse(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(value, memo) for value in self]
+
+
+class GuildSection(TrackedDict):
+    """A section keyed by guild ID, the shards of its guilds are read by the Database when they're needed.
+
+    With `int_keys` the guild IDs are stored as ints, and every guild is stored under str(guild.id) too, so looking it
+    up with an int or with a str is the same plain dict lookup (looping, len() and the views only show the int keys).
+    With `config`, every guild's dict is turned into that class from configs.py.
+
+    A section starts out as a LazySection and turns into a LoadedSection (by swapping __class__) once the shards of
+    every guild the bot is in are read (Database.load_active())."""
+    __slots__ = ('_int_keys', '_config')
+
+    def __init__(self, data, db, path, int_keys=False, config=None):
+        super().__init__({}, db, path)
+        self._int_keys = int_keys
+        self._config = config
+        for key, value in data.items():
+            self._adopt(key, value)
+
+    def _key(self, key):
+        if self._int_keys:
+            try:
+                return int(key)
+            except (TypeError, ValueError):
+                pass
+        return key
+
+    def _store(self, key, value):
+        """Sets the guild `key` (already passed through _key()) and its str alias, without marking anything"""
+        dict.__setitem__(self, key, value)
+        if type(key) is int and self._int_keys:
+            dict.__setitem__(self, sys.intern(str(key)), value)
+
+    def _remove(self, key):
+        dict.__delitem__(self, key)
+        if type(key) is int and self._int_keys:
+            dict.pop(self, str(key), None)
+
+    def _wrap(self, key, value):
+        if self._config is not None and isinstance(value, Mapping):
+            return self._config(dict(value), self._db, self._path + (key,))
+        return track(value, self._db, self._path + (key,))
+
+    def _adopt(self, key, value):
+        """Adds a guild read from disk, without marking anything as changed"""
+        key = self._key(key)
+        if not dict.__contains__(self, key):
+            self._store(key, self._wrap(key, value))
+
+    def _need(self, key):
+        try:
+            if self._db.unloaded and str(key) in self._db.unloaded:
+                self._db.load_guild(str(key))
+        except TypeError:  # unhashable key, let dict raise the error
+            pass
+
+    def _guilds(self):
+        """{guild ID: config} without the str aliases"""
+        if not self._int_keys:
+            return dict(dict.items(self))
+        return {key: value for key, value in dict.items(self) if type(key) is not str or not key.isdecimal()}
+
+    def __setitem__(self, key, value):
+        key = self._key(key)
+        self._need(key)
+        value = self._wrap(key, value)
+        self._db.mark(self._path + (key,))
+        self._store(key, value)
+
+    def __delitem__(self, key):
+        key = self._key(key)
+        self._need(key)
+        self._db.mark(self._path + (key,))
+        self._remove(key)
+
+    def setdefault(self, key, default=None):
+        key = self._key(key)
+        self._need(key)
+        if not dict.__contains__(self, key):
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        key = self._key(key)
+        self._need(key)
+        if not dict.__contains__(self, key):
+            return dict.pop(self, key, *default)
+        value = dict.__getitem__(self, key)
+        del self[key]
+        return value
+
+    def popitem(self):
+        guilds = self._guilds()
+        if not guilds:
+            raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(guilds))
+        return key, self.pop(key)
+
+    def clear(self):
+        if not self._path:  # clearing the root of a sharded database deletes every shard
+            self._db.unloaded.clear()
+        TrackedDict.clear(self)
+
+    def __iter__(self):
+        return iter(self._guilds())
+
+    def __len__(self):
+        return len(self._guilds())
+
+    def keys(self):
+        return self._guilds().keys()
+
+    def values(self):
+        return self._guilds().values()
+
+    def items(self):
+        return self._guilds().items()
+
+    def copy(self):
+        return self._guilds()
+
+    def __repr__(self):
+        return repr(self._guilds())
+
+
+class LazySection(GuildSection):
+    """A GuildSection while shards of guilds the bot is in may still be unread: every lookup reads the guild's shard
+    first if it's one of them, and looping over the section reads all of them."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        self._need(key)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._need(key)
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        self._need(key)
+        return dict.get(self, key, default)
+
+    def _guilds(self):
+        if self._db.unloaded:
+            self._db.load_active()
+        return GuildSection._guilds(self)
+
+
+class LoadedSection(GuildSection):
+    """A GuildSection once every guild the bot is in was read.  The shards left are those of guilds the bot has left,
+    so `in` and get() don't look at them anymore and a lookup of a guild that's in memory is one plain dict lookup.
+    Indexing a guild that was left still reads its shard (__missing__), and so does any change to it."""
+    __slots__ = ()
+
+    def __missing__(self, key):
+        key = self._key(key)
+        self._need(key)
+        if dict.__contains__(self, key):  # only look it up if it's there, dict.__getitem__ would call this again
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+
+class _Snapshot:
+    """The shards of one save, frozen at the moment the save started.  `frozen` fills up with serialized shards, either
+    from the saving thread or from the loop right before the bot changes a shard (see Database.mark())."""
+    __slots__ = ('shards', 'sharded', 'frozen', 'lock')
+
+    def __init__(self, shards, sharded):
+        self.shards = shards
+        self.sharded = sharded  # which sections were sharded at that moment
+        self.frozen = {}  # shard: json bytes, or None if the shard was deleted
+        self.lock = threading.Lock()
+
+
+class Database:
+    """A json database split into shards: `directory/guilds/<guild id>.json` holds everything of one guild and
+    `directory/global.json` holds the sections that don't belong to any guild.
+
+    Only global.json is read on load.  Guild shards are read the first time something of that guild is used, or all
+    together by load_active() once the bot knows which guilds it's in, so guilds the bot has left are never read at
+    all.  For bot.db the guilds are one level down (db['mutes'][guild_id],
+    only the sections in `guild_sections` or `configs` are sharded, every other section stays in global.json), for
+    bot.stats the guilds are the top level keys (`sharded_root=True`).
+
+    `configs` are the sections keyed by int guild IDs, see configs.DB_CONFIGS (`None` stands for the root of a
+    `sharded_root` database).
+    `legacy_file` is the old single-file database (db.json), which is only read if `directory` doesn't exist yet.
+    `journal` is an optional journal.Journal for the sections that shouldn't lose any changes on a crash."""
+
+    def __init__(self, directory, legacy_file=None, journal=None, guild_sections=(), sharded_root=False, configs=None):
+        self.directory = directory
+        self.legacy_file = legacy_file
+        self.journal = journal
+        self.sharded_root = sharded_root
+        self.configs = configs or {}  # {section: config class or None} of the sections keyed by int guild IDs
+        self.guild_sections = frozenset(guild_sections) | {section for section in self.configs if section is not None}
+        self.sharded = set()  # sections that are split into the guild shards
+        self.shards = set()  # guild shards on disk
+        self.unloaded = set()  # guild shards on disk that haven't been read yet
+        self.active_guilds = None  # IDs (str) of the guilds the bot is in, None means all of them
+        self.converted = False  # True if the last load() converted an old layout
+        self.dirty = set()  # shards that changed since the last save
+        self.data = TrackedDict({}, self, ())
+        self._snapshot = None  # the _Snapshot of the save that's running right now
+
+    def _shard_of(self, path):
+        if self.sharded_root:
+            return str(path[0]) if path else None
+        if len(path) > 1 and path[0] in self.sharded:
+            return str(path[1])
+        return GLOBAL
+
+    def mark(self, path):
+        """Called by the tracked dicts/lists right before something changes: `path` is the path of whatever changes"""
+        shard = self._shard_of(path)
+        snapshot = self._snapshot
+        if shard is None or (shard == GLOBAL and path and path[0] in self.sharded):
+            if snapshot is not None:  # this touches more than one shard, freeze all of them
+                for frozen_shard in snapshot.shards:
+                    self._freeze(snapshot, frozen_shard)
+        elif snapshot is not None and shard in snapshot.shards:
+            self._freeze(snapshot, shard)
+
+        if shard is None:  # the root of bot.stats is being cleared
+            self.dirty |= self.shards
+        elif shard == GLOBAL and path and path[0] in self.sharded:
+            # a whole sharded section is replaced or deleted: keep it in the global shard from now on, old copies
+            # of it in the guild shards are ignored on load
+            self.sharded.discard(path[0])
+            self.dirty.add(GLOBAL)
+        else:
+            self.dirty.add(shard)
+        if self.journal is not None and path and path[0] in self.journal.sections:
+            # json keys are always strings, int guild IDs too
+            self.journal.record(tuple(str(key) if isinstance(key, int) else key for key in path))
+
+    # ### Loading ###
+
+    def _read(self, file_name):
+        with open(os.path.join(self.directory, file_name), 'r', encoding='utf-8') as read_file:
+            return json.load(read_file)
+
+    def _add_guild(self, data, guild_id):
+        """Puts the contents of a guild shard into `data` without marking anything as changed"""
+        self.unloaded.discard(guild_id)
+        shard = self._read(os.path.join('guilds', f"{guild_id}.json"))
+        if self.sharded_root:
+            sections = {None: shard}
+            data = {None: data}
+        else:
+            sections = {section: config for section, config in shard.items()
+                        if section in self.sharded and dict.__contains__(data, section)}
+        for section, config in sections.items():
+            target = dict.__getitem__(data, section)
+            if isinstance(target, GuildSection):
+                target._adopt(guild_id, config)
+            elif guild_id not in target:  # plain dicts while the journal is replayed
+                target[guild_id] = config
+
+    def load_guild(self, guild_id):
+        self._add_guild(self.data, guild_id)
+
+    def load_active(self):
+        """Reads the shards of all guilds the bot is in"""
+        for guild_id in list(self.unloaded):
+            if self.active_guilds is None or guild_id in self.active_guilds:
+                self.load_guild(guild_id)
+        self._settle()
+
+    def _settle(self):
+        """Turns the LazySections into LoadedSections once no guild the bot is in is left to read"""
+        if self.unloaded and (self.active_guilds is None or self.unloaded & self.active_guilds):
+            return
+        for section in [self.data] if self.sharded_root else dict.values(self.data):
+            if type(section) is LazySection:
+                section.__class__ = LoadedSection
+
+    def _wrap(self, data):
+        if self.sharded_root:
+            return LazySection(data, self, (), None in self.configs, self.configs.get(None))
+        root = TrackedDict({}, self, ())
+        for section, value in data.items():
+            if section in self.sharded:
+                dict.__setitem__(root, section, LazySection(value, self, (section,), section in self.configs,
+                                                            self.configs.get(section)))
+            else:
+                dict.__setitem__(root, section, track(value, self, (section,)))
+        return root
+
+    def _is_sharded(self, section, value):
+        return section in self.guild_sections and isinstance(value, dict)
+
+    def load(self):
+        self.converted = False
+        if os.path.exists(os.path.join(self.directory, 'global.json')):
+            saved = self._read('global.json')
+            self.sharded = set(saved['sharded'])
+            data = saved['sections']
+            for section in self.sharded:
+                data.setdefault(section, {})
+            self.shards = {file_name[:-5] for file_name in os.listdir(os.path.join(self.directory, 'guilds'))
+                           if file_name.endswith('.json')}
+            self.unloaded = set(self.shards)
+            self.dirty = set()
+            rewrite = set()
+            stray = self.sharded - self.guild_sections
+            if stray:
+                # sections that aren't keyed by guild but were sharded anyway (older versions guessed from the keys):
+                # read every shard once to put them back together in the global shard
+                for guild_id in list(self.unloaded):
+                    self._add_guild(data, guild_id)
+                self.sharded -= stray
+                rewrite |= {GLOBAL} | self.shards
+            moved = set()
+            for section in self.guild_sections:  # guild sections that are still in the global shard, move them out
+                if section not in self.sharded and isinstance(data.get(section), dict):
+                    self.sharded.add(section)
+                    moved |= set(data[section])
+            if self.journal is not None:
+                # changes from right before the last crash/shutdown, read the guilds they belong to first
+                for path in self.journal.paths():
+                    shard = self._shard_of(path)
+                    if shard in self.unloaded:
+                        self._add_guild(data, shard)
+                self.dirty = {self._shard_of(path) for path in self.journal.replay(data)}
+            self.dirty |= rewrite
+            self.data = self._wrap(data)
+            if moved:
+                for guild_id in moved & self.unloaded:  # their shards are about to be rewritten
+                    self.load_guild(guild_id)
+                self.dirty |= {GLOBAL} | moved
+            if self.active_guilds is not None:  # reloaded while running
+                self.load_active()
+            return self.data
+
+        data = {}
+        if os.path.isdir(self.directory):  # one file per section
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith('.json'):
+                    data[file_name[:-5]] = self._read(file_name)
+            if self.journal is not None:
+                self.journal.replay(data)
+        elif self.legacy_file and os.path.exists(self.legacy_file):
+            with open(self.legacy_file, 'r', encoding='utf-8') as read_file:
+                data = json.load(read_file)
+        if self.sharded_root:
+            self.sharded = set()
+            guilds = set(data)
+        else:
+            self.sharded = {section for section, value in data.items() if self._is_sharded(section, value)}
+            guilds = {guild_id for section in self.sharded for guild_id in data[section]}
+        self.shards = set()
+        self.unloaded = set()
+        self.data = self._wrap(data)
+        self.converted = True
+
+        # write the new layout to a temporary folder first so that a crash here can't leave behind a half-written
+        # database
+        self.dirty = {GLOBAL} | guilds
+        temp_directory = f"{self.directory}.tmp"
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        os.makedirs(os.path.join(temp_directory, 'guilds'))
+        self._write_snapshot(self._take_snapshot(), temp_directory)
+        self._finish_snapshot()
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        os.replace(temp_directory, self.directory)
+        self._settle()
+        return self.data
+
+    # ### Saving ###
+
+    def save(self):
+        """Writes the changed shards right away, blocking.  Use `await dump()` while the bot is running."""
+        if self.dirty:
+            self._write_snapshot(self._take_snapshot())
+            self._finish_snapshot()
+
+    def _guild_shard(self, guild_id, sharded):
+        if self.sharded_root:
+            key = self.data._key(guild_id)
+            if dict.__contains__(self.data, key):
+                return dict.__getitem__(self.data, key)
+            return None
+        shard = {}
+        for section in sorted(sharded):
+            section_data = self.data[section]
+            key = section_data._key(guild_id) if isinstance(section_data, GuildSection) else guild_id
+            if dict.__contains__(section_data, key):
+                shard[section] = dict.__getitem__(section_data, key)
+        return shard or None
+
+    def _serialize(self, shard, sharded):
+        if shard == GLOBAL:
+            sections = {}
+            if not self.sharded_root:
+                sections = {section: value for section, value in dict.items(self.data) if section not in sharded}
+            return json.dumps({'sharded': sorted(sharded), 'sections': sections},
+                              default=json_default).encode('utf-8')
+        data = self._guild_shard(shard, sharded)
+        if data is None:
+            return None  # the guild was deleted
+        return json.dumps(data, default=json_default).encode('utf-8')
+
+    def _freeze(self, snapshot, shard):
+        with snapshot.lock:
+            if shard not in snapshot.frozen:
+                snapshot.frozen[shard] = self._serialize(shard, snapshot.sharded)
+
+    def _take_snapshot(self):
+        """Starts a save of the changed shards.  This only swaps out the set of changed shards, nothing is copied."""
+        self._snapshot = _Snapshot(self.dirty, frozenset(self.sharded))
+        self.dirty = set()
+        return self._snapshot
+
+    def _finish_snapshot(self):
+        snapshot, self._snapshot = self._snapshot, None
+        for shard, data in snapshot.frozen.items():
+            if shard == GLOBAL:
+                continue
+            if data is None:
+                self.shards.discard(shard)
+            else:
+                self.shards.add(shard)
+        return snapshot
+
+    @staticmethod
+    def _file_name(shard):
+        if shard == GLOBAL:
+            return 'global.json'
+        return os.path.join('guilds', f"{shard}.json")
+
+    def _write_snapshot(self, snapshot, directory=None):
+        """Serializes whatever shards of the snapshot the loop didn't already serialize and writes them.  This runs
+        in the executor."""
+        for shard in snapshot.shards:
+            self._freeze(snapshot, shard)
+        for shard in snapshot.shards:
+            file_name = os.path.join(directory or self.directory, self._file_name(shard))
+            data = snapshot.frozen[shard]
+            if data is None:
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+                continue
+            with open(f"{file_name}.tmp", 'wb') as write_file:
+                write_file.write(data)
+            os.replace(f"{file_name}.tmp", file_name)
+
+    async def dump(self):
+        """Writes the shards that changed since the last dump.  Returns a DumpResult with the number of bytes,
+        files and guild shards that were written."""
+        if not self.dirty:
+            return DumpResult(0, 0, 0)
+        old_segments = []
+        if self.journal is not None:
+            old_segments = await self.journal.rotate(self.data)
+        snapshot = self._take_snapshot()
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._write_snapshot, snapshot)
+        except Exception:
+            self._snapshot = None
+            self.dirty |= snapshot.shards  # try again next time
+            raise
+        self._finish_snapshot()
+        if old_segments:
+            self.journal.remove(old_segments)  # everything in them is saved now
+        return DumpResult(sum(len(data) for data in snapshot.frozen.values() if data), len(snapshot.shards),
+                          len(snapshot.shards - {GLOBAL}))
@@ -3,18 +3,20 @@ import asyncio
 import os
 import re
 from discord.ext import commands
-import json, csv
+import csv
 import sys
+import time
+import pickle
+import hashlib
 from datetime import datetime, timedelta
-from copy import deepcopy
-import shutil
-from textblob import TextBlob as tb
-from functools import partial
+from functools import cached_property
 import numpy as np
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.feature_extraction.text import CountVectorizer
+from .langid import load_profiles, read_tatoeba, LanguageIdentifier
 
 dir_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
@@ -74,18 +76,9 @@ _loop = asyncio.get_event_loop()
 
 def count_messages(member, guild=None):
     """Returns an integer of number of messages sent in the last month"""
-    msgs = 0
     if not guild:
         guild = member.guild
-    try:
-        config = here.bot.stats[str(guild.id)]['messages']
-        for day in config:
-            if str(member.id) in config[day]:
-                user = config[day][str(member.id)]
-                msgs += sum([user['channels'][c] for c in user['channels']])
-        return msgs
-    except KeyError:
-        return 0
+    return here.bot.stats_db.count_messages(guild.id, member.id)
 
 
 def add_to_modlog(ctx, user, type, reason, silent, length=None):
@@ -174,6 +167,20 @@ def parse_time(time):
     return time_string, length
 
 
+def parse_stats_range(text):
+    """Reads a range for the stats commands like `90d`, `12w`, `6m` or `1y`.  Returns (the first day like 20200403,
+    description like "Last 90 days"), or (None, None) if `text` isn't a range."""
+    range_re = re.fullmatch('(\d+)([dwmy])', text.strip().lower()) if text else None
+    if not range_re:
+        return None, None
+    number = int(range_re.group(1))
+    unit = {'d': 'day', 'w': 'week', 'm': 'month', 'y': 'year'}[range_re.group(2)]
+    # capped at 100 years, which is older than any stored day, so `9999y` can't go past year 1
+    days = min(number * {'d': 1, 'w': 7, 'm': 30, 'y': 365}[range_re.group(2)], 36500)
+    since = int((datetime.utcnow() - timedelta(days=days)).strftime("%Y%m%d"))
+    return since, f"Last {number} {unit}{'s' if number != 1 else ''}"
+
+
 async def member_converter(ctx, user_in):
     # check for an ID
     user_id = re.findall("(^<@!?\d{17,22}>$|^\d{17,22}$)", str(user_in))
@@ -209,31 +216,28 @@ async def member_converter(ctx, user_in):
     return None
 
 
-def _predump_json():
-    db_copy = deepcopy(here.bot.db)
-    stats_copy = deepcopy(here.bot.stats)
-    shutil.copy(f'{dir_path}/db_3.json', f'{dir_path}/db_4.json')
-    shutil.copy(f'{dir_path}/db_2.json', f'{dir_path}/db_3.json')
-    shutil.copy(f'{dir_path}/db.json', f'{dir_path}/db_2.json')
-    with open(f'{dir_path}/db_temp.json', 'w') as write_file:
-        json.dump(db_copy, write_file, indent=4)
-    shutil.copy(f'{dir_path}/db_temp.json', f'{dir_path}/db.json')
-
-    shutil.copy(f'{dir_path}/stats_3.json', f'{dir_path}/stats_4.json')
-    shutil.copy(f'{dir_path}/stats_2.json', f'{dir_path}/stats_3.json')
-    shutil.copy(f'{dir_path}/stats.json', f'{dir_path}/stats_2.json')
-    with open(f'{dir_path}/stats_temp.json', 'w') as write_file:
-        json.dump(stats_copy, write_file, indent=1)
-    shutil.copy(f'{dir_path}/stats_temp.json', f'{dir_path}/stats.json')
+async def dump_json():
+    """Saves the parts of bot.db and bot.stats that changed since the last save (and writes out the buffered stats
+    counters).  Returns a DumpResult for each (number of bytes, sections and guild subtrees written)."""
+    with await _lock:
+        await here.bot.stats_db.flush()
+        db_result = await here.bot.db_store.dump()
+        stats_result = await here.bot.stats_store.dump()
+    return db_result, stats_result
 
 
-async def dump_json():
+async def restore_backup(name):
+    """Replaces bot.db, bot.stats and the stats sqlite database with the backup `name`.  The current state is
+    backed up first, so a restore can always be undone."""
     with await _lock:
-        try:
-            await _loop.run_in_executor(None, _predump_json)
-        except RuntimeError:
-            print("Restarting dump_json on a RuntimeError")
-            await _loop.run_in_executor(None, _predump_json)
+        await here.bot.db_store.dump()
+        await here.bot.stats_store.dump()
+        await here.bot.stats_db.flush()
+        await _loop.run_in_executor(None, here.bot.backups.restore, name)
+        here.bot.db_store.journal.clear()  # the journal belongs to the database that was just replaced
+        here.bot.db = here.bot.db_store.load()
+        here.bot.ID = here.bot.db["ID"]
+        here.bot.stats = here.bot.stats_store.load()
 
 
 def submod_check(ctx):
@@ -295,18 +299,17 @@ def database_toggle(ctx, module_name):
         config = module_name[str(ctx.guild.id)]
         config['enable'] = not config['enable']
     except KeyError:
-        config = module_name[str(ctx.guild.id)] = {'enable': True}
+        module_name[str(ctx.guild.id)] = {'enable': True}
+        config = module_name[str(ctx.guild.id)]
     return config
 
 
 def rem_emoji_url(msg):
     if isinstance(msg, discord.Message):
         msg = msg.content
-    new_msg = _emoji.sub('', _url.sub('', msg))
-    for char in msg:
-        if is_emoji(char):
-            new_msg = new_msg.replace(char, '').replace('  ', '')
-    return new_msg
+    if not isinstance(msg, MessageText):
+        msg = MessageText(msg)
+    return msg.stripped
 
 
 async def ban_check_servers(bot, bans_channel, member, ping=False):
@@ -318,16 +321,9 @@ async def ban_check_servers(bot, bans_channel, member, ping=False):
         if guild.id in bot.db['ignored_servers']:
             continue
         if member in guild.members:
-            messages: int = count_messages(member, guild)
-            day = None
-            if messages:
-                try:
-                    config = bot.stats[str(guild.id)]['messages']
-                    for day in reversed(list(config)):  # type: str
-                        if str(member.id) in config[day]:
-                            break
-                except KeyError:
-                    pass
+            messages, day = bot.stats_db.message_summary(guild.id, member.id)
+            if day:
+                day = str(day)
             guilds.append([guild, messages, day])
 
     for guild in guilds:  # type: list
@@ -347,121 +343,199 @@ async def ban_check_servers(bot, bans_channel, member, ping=False):
 
 
 def jpenratio(msg_content):
-    text = _emoji.sub('', _url.sub('', msg_content))
-    en, jp, total = get_character_spread(text)
-    return en / total if total else None
+    if not isinstance(msg_content, MessageText):
+        msg_content = MessageText(msg_content)
+    return msg_content.jpenratio
 
 
 def get_character_spread(text):
-    english = 0
-    japanese = 0
-    for ch in text:
-        if is_cjk(ch):
-            japanese += 1
-        elif is_english(ch):
-            english += 1
+    japanese = len(_cjk_chars.findall(text))
+    english = len(_english_chars.findall(text))
     return english, japanese, english + japanese
 
+
+# Unicode ranges for the character classes below.  Each one is compiled to a regex character class once, so a whole
+# string can be searched or counted in one pass with findall()/sub() instead of checking every character in Python.
+GENEROUS_EMOJI_RANGES = (
+    (0x0080, 0x02AF),
+    (0x0300, 0x03FF),
+    (0x0600, 0x06FF),
+    (0x0C00, 0x0C7F),
+    (0x1DC0, 0x1DFF),
+    (0x1E00, 0x1EFF),
+    (0x2000, 0x209F),
+    (0x20D0, 0x214F),
+    (0x2190, 0x23FF),
+    (0x2460, 0x25FF),
+    (0x2600, 0x27EF),
+    (0x2900, 0x2935),
+    (0x2B00, 0x2BFF),
+    (0x2C60, 0x2C7F),
+    (0x2E00, 0x2E7F),
+    (0x3000, 0x303F),
+    (0xA490, 0xA4CF),
+    (0xE000, 0xF8FF),
+    (0xFE00, 0xFE0F),
+    (0xFE30, 0xFE4F),
+    (0x2757, 0x2757),
+    (0x1F000, 0x1F02F),
+    (0x1F0A0, 0x1F0FF),
+    (0x1F100, 0x1F64F),
+    (0x1F680, 0x1F6FF),
+    (0x1F910, 0x1F96B),
+    (0x1F980, 0x1F9E0),
+)
+
+EMOJI_RANGES = (
+    (0xA490, 0xA4CF),
+    (0xE000, 0xF8FF),
+    (0xFE00, 0xFE0F),
+    (0xFE30, 0xFE4F),
+    (0x1F000, 0x1F02F),
+    (0x1F0A0, 0x1F0FF),
+    (0x1F100, 0x1F64F),
+    (0x1F680, 0x1F6FF),
+    (0x1F910, 0x1F96B),
+    (0x1F980, 0x1F9E0),
+)
+
+IGNORED_EMOJI_RANGES = (
+    (0x0080, 0x02AF),
+    (0x0300, 0x03FF),
+    (0x0600, 0x06FF),
+    (0x0C00, 0x0C7F),
+    (0x1DC0, 0x1DFF),
+    (0x1E00, 0x1EFF),
+    (0x2000, 0x209F),
+    (0x20D0, 0x214F)
+)
+
+CJK_RANGES = (
+    (0x3040, 0x30FF),  # Hiragana + Katakana
+    (0xFF66, 0xFF9D),  # Half-Width Katakana
+    (0x4E00, 0x9FAF)  # Common/Uncommon Kanji
+)
+
+# basically English characters save for w because of laughter
+ENGLISH_RANGES = (
+    (0x61, 0x76),  # a to v
+    (0x78, 0x7a),  # x to z
+    (0x41, 0x56),  # A to V
+    (0x58, 0x5a),  # X to Z
+    (0xFF41, 0xFF56),  # ａ to ｖ
+    (0xFF58, 0xFF5A),  # ｘ to ｚ
+    (0xFF21, 0xFF36),  # Ａ to Ｖ
+    (0xFF38, 0xFF3A),  # Ｘ to Ｚ
+)
+
+
+def _char_class(ranges):
+    return re.compile('[' + ''.join(f"\\U{start:08x}-\\U{end:08x}" for start, end in ranges) + ']')
+
+
+_generous_emoji_chars = _char_class(GENEROUS_EMOJI_RANGES)
+_emoji_chars = _char_class(EMOJI_RANGES)
+_ignored_emoji_chars = _char_class(IGNORED_EMOJI_RANGES)
+_cjk_chars = _char_class(CJK_RANGES)
+_english_chars = _char_class(ENGLISH_RANGES)
+
+
 def generous_is_emoji(char):
-    EMOJI_MAPPING = (
-        (0x0080, 0x02AF),
-        (0x0300, 0x03FF),
-        (0x0600, 0x06FF),
-        (0x0C00, 0x0C7F),
-        (0x1DC0, 0x1DFF),
-        (0x1E00, 0x1EFF),
-        (0x2000, 0x209F),
-        (0x20D0, 0x214F),
-        (0x2190, 0x23FF),
-        (0x2460, 0x25FF),
-        (0x2600, 0x27EF),
-        (0x2900, 0x2935),
-        (0x2B00, 0x2BFF),
-        (0x2C60, 0x2C7F),
-        (0x2E00, 0x2E7F),
-        (0x3000, 0x303F),
-        (0xA490, 0xA4CF),
-        (0xE000, 0xF8FF),
-        (0xFE00, 0xFE0F),
-        (0xFE30, 0xFE4F),
-        (0x2757, 0x2757),
-        (0x1F000, 0x1F02F),
-        (0x1F0A0, 0x1F0FF),
-        (0x1F100, 0x1F64F),
-        (0x1F680, 0x1F6FF),
-        (0x1F910, 0x1F96B),
-        (0x1F980, 0x1F9E0),
-    )
-    return any(start <= ord(char) <= end for start, end in EMOJI_MAPPING)
+    return bool(_generous_emoji_chars.match(char))
+
 
 def is_emoji(char):
-    EMOJI_MAPPING = (
-        # (0x0080, 0x02AF),
-        # (0x0300, 0x03FF),
-        # (0x0600, 0x06FF),
-        # (0x0C00, 0x0C7F),
-        # (0x1DC0, 0x1DFF),
-        # (0x1E00, 0x1EFF),
-        # (0x2000, 0x209F),
-        # (0x20D0, 0x214F),
-        # (0x2190, 0x23FF),
-        # (0x2460, 0x25FF),
-        # (0x2600, 0x27EF),
-        # (0x2900, 0x2935),
-        # (0x2B00, 0x2BFF),
-        # (0x2C60, 0x2C7F),
-        # (0x2E00, 0x2E7F),
-        # (0x3000, 0x303F),
-        (0xA490, 0xA4CF),
-        (0xE000, 0xF8FF),
-        (0xFE00, 0xFE0F),
-        (0xFE30, 0xFE4F),
-        (0x1F000, 0x1F02F),
-        (0x1F0A0, 0x1F0FF),
-        (0x1F100, 0x1F64F),
-        (0x1F680, 0x1F6FF),
-        (0x1F910, 0x1F96B),
-        (0x1F980, 0x1F9E0),
-    )
-    return any(start <= ord(char) <= end for start, end in EMOJI_MAPPING)
+    return bool(_emoji_chars.match(char))
 
 
 def is_ignored_emoji(char):
-    EMOJI_MAPPING = (
-        (0x0080, 0x02AF),
-        (0x0300, 0x03FF),
-        (0x0600, 0x06FF),
-        (0x0C00, 0x0C7F),
-        (0x1DC0, 0x1DFF),
-        (0x1E00, 0x1EFF),
-        (0x2000, 0x209F),
-        (0x20D0, 0x214F)
-    )
-    return any(start <= ord(char) <= end for start, end in EMOJI_MAPPING)
+    return bool(_ignored_emoji_chars.match(char))
 
 
 def is_cjk(char):
-    CJK_MAPPING = (
-        (0x3040, 0x30FF),  # Hiragana + Katakana
-        (0xFF66, 0xFF9D),  # Half-Width Katakana
-        (0x4E00, 0x9FAF)  # Common/Uncommon Kanji
-    )
-    return any(start <= ord(char) <= end for start, end in CJK_MAPPING)
+    return bool(_cjk_chars.match(char))
 
 
 def is_english(char):
-    # basically English characters save for w because of laughter
-    RANGE_CHECK = (
-        (0x61, 0x76),  # a to v
-        (0x78, 0x7a),  # x to z
-        (0x41, 0x56),  # A to V
-        (0x58, 0x5a),  # X to Z
-        (0xFF41, 0xFF56),  # ａ to ｖ
-        (0xFF58, 0xFF5A),  # ｘ to ｚ
-        (0xFF21, 0xFF36),  # Ａ to Ｖ
-        (0xFF58, 0xFF3A),  # Ｘ to Ｚ
-    )
-    return any(start <= ord(char) <= end for start, end in RANGE_CHECK)
+    return bool(_english_chars.match(char))
+
+
+def find_emoji(text):
+    """Every character of a string that is_emoji(), in order"""
+    return _emoji_chars.findall(text)
+
+
+def find_ignored_emoji(text):
+    """Every character of a string that is_ignored_emoji(), in order"""
+    return _ignored_emoji_chars.findall(text)
+
+
+_quote_lines = re.compile("(>>>|>) .*$\n?", flags=re.M)
+
+
+class MessageText:
+    """The text work that several on_message stages need, each piece computed the first time it's asked for and
+    then kept.  General.on_message makes one per message and hands it to every stage instead of each stage running
+    the URL/emoji regexes or casefolding again."""
+
+    def __init__(self, content):
+        self.content = content
+
+    @cached_property
+    def casefold(self):
+        return self.content.casefold()
+
+    @cached_property
+    def url_spans(self):
+        return [match.span() for match in _url.finditer(self.content)]
+
+    @cached_property
+    def without_urls_emoji(self):
+        """The content without URLs, custom emojis and mentions"""
+        pieces = []
+        end = 0
+        for span_start, span_end in self.url_spans:
+            pieces.append(self.content[end:span_start])
+            end = span_end
+        pieces.append(self.content[end:])
+        return _emoji.sub('', ''.join(pieces))
+
+    @cached_property
+    def stripped(self):
+        """What rem_emoji_url() returns: without_urls_emoji with unicode emojis removed too"""
+        text, emoji_count = _emoji_chars.subn('', self.without_urls_emoji)
+        if emoji_count:
+            text = text.replace('  ', '')
+        return text
+
+    @cached_property
+    def custom_emoji(self):
+        """Names of the real custom emojis (<:name:id> / <a:name:id>), not any text between two colons"""
+        return re.findall('<a?:([A-Za-z0-9\_]+):[0-9]+>', self.content)
+
+    @cached_property
+    def emoji(self):
+        return find_emoji(self.content)
+
+    @cached_property
+    def ignored_emoji(self):
+        return find_ignored_emoji(self.content)
+
+    @cached_property
+    def unquoted(self):
+        """The message without lines that start with a quote, as its own MessageText (self if there were none)"""
+        content = _quote_lines.sub('', self.content)
+        return self if content == self.content else MessageText(content)
+
+    @cached_property
+    def character_spread(self):
+        """(English, Japanese, total) letters, not counting URLs and emojis"""
+        return get_character_spread(self.without_urls_emoji)
+
+    @cached_property
+    def jpenratio(self):
+        english, japanese, total = self.character_spread
+        return english / total if total else None
 
 
 async def long_deleted_msg_notification(msg):
@@ -472,15 +546,20 @@ async def long_deleted_msg_notification(msg):
         return
 
 
-async def uhc_check(msg):
+async def uhc_check(msg, text=None):
     try:
         if msg.guild.id == 189571157446492161 and len(msg.content) > 3:
             if here.bot.db['ultraHardcore']['users'].get(str(msg.author.id), [False])[0]:
-                lowercase_msg_content = msg.content.casefold().replace('what is your native language', '') \
+                if text is None:
+                    text = MessageText(msg.content)
+                lowercase_msg_content = text.casefold.replace('what is your native language', '') \
                     .replace('welcome', '').replace("what's your native language", "")
                 jpRole = msg.guild.get_role(196765998706196480)
 
-                ratio = jpenratio(lowercase_msg_content)
+                if lowercase_msg_content == text.casefold:
+                    ratio = text.jpenratio
+                else:
+                    ratio = jpenratio(lowercase_msg_content)
                 # if I delete a long message
 
                 if not lowercase_msg_content:
@@ -517,10 +596,35 @@ async def uhc_check(msg):
         pass
 
 
-def _pre_load_language_dection_model():
+LANGDETECT_CSVS = ['principiante.csv', 'avanzado.csv', 'beginner.csv', 'advanced.csv']
+LANGDETECT_CACHE = f"{dir_path}/langdetect_model.pickle"
+
+
+def _langdetect_data_hash():
+    """Hash of the training CSVs (and the sklearn version, since pickles don't load across versions)"""
+    sha = hashlib.sha256(sklearn.__version__.encode())
+    for csv_name in LANGDETECT_CSVS:
+        with open(f"{dir_path}/cogs/utils/{csv_name}", 'rb') as csvfile:
+            sha.update(csvfile.read())
+    return sha.hexdigest()
+
+
+def _load_language_detection_cache():
+    """Returns (pipeline, hash of the data it was trained on), or (None, None) if there's no usable cache"""
+    try:
+        with open(LANGDETECT_CACHE, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+        return cache['pipeline'], cache['hash']
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError, ImportError, ValueError):
+        return None, None
+
+
+def _train_language_detection_model():
+    """Trains the pipeline on the CSVs and saves it to LANGDETECT_CACHE.  Returns the pipeline."""
+    data_hash = _langdetect_data_hash()
     english = []
     spanish = []
-    for csv_name in ['principiante.csv', 'avanzado.csv', 'beginner.csv', 'advanced.csv']:
+    for csv_name in LANGDETECT_CSVS:
         with open(f"{dir_path}/cogs/utils/{csv_name}", newline='', encoding='utf-8') as csvfile:
             reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
             if csv_name in ['principiante.csv', 'avanzado.csv']:
@@ -561,27 +665,132 @@ def _pre_load_language_dection_model():
 
         return pipeline
 
-    here.bot.langdetect = make_set(english, spanish, make_set(english, spanish, make_set(english, spanish)))
+    pipeline = make_set(english, spanish, make_set(english, spanish, make_set(english, spanish)))
+    with open(f"{LANGDETECT_CACHE}.tmp", 'wb') as cache_file:
+        pickle.dump({'hash': data_hash, 'pipeline': pipeline}, cache_file)
+    os.replace(f"{LANGDETECT_CACHE}.tmp", LANGDETECT_CACHE)
+    return pipeline
 
 
 def detect_language(text):
-    probs = here.bot.langdetect.predict_proba([text])[0]
-    if probs[0] > 0.9:
-        return 'en'
-    elif probs[0] < 0.1:
-        return 'es'
-    else:
-        return None
+    return detect_languages([text])[0]
+
+
+def detect_languages(texts):
+    """detect_language() for a list of texts with one call to the model, used by bot.lang_batcher"""
+    results = []
+    for probs in here.bot.langdetect.predict_proba(texts):
+        if probs[0] > 0.9:
+            results.append('en')
+        elif probs[0] < 0.1:
+            results.append('es')
+        else:
+            results.append(None)
+    return results
 
 
 async def load_language_dection_model():
-    await _loop.run_in_executor(None, _pre_load_language_dection_model)
+    """Loads the language detection pipeline from its cache.  If the training CSVs changed since it was saved, the
+    old pipeline is used until a new one is trained in the background (with no cache at all, this waits for the
+    training)."""
+    pipeline, cached_hash = await _loop.run_in_executor(None, _load_language_detection_cache)
+    if pipeline is None:
+        await retrain_language_detection_model()
+        return
+    here.bot.langdetect = pipeline
+    if cached_hash != await _loop.run_in_executor(None, _langdetect_data_hash):
+        _loop.create_task(retrain_language_detection_model())
+
+
+async def retrain_language_detection_model():
+    """Trains a new pipeline in the executor and swaps it in.  Returns (seconds training, seconds loading it back
+    from the cache)."""
+    start = time.perf_counter()
+    here.bot.langdetect = await _loop.run_in_executor(None, _train_language_detection_model)
+    here.bot.lang_cache.clear()
+    trained = time.perf_counter()
+    await _loop.run_in_executor(None, _load_language_detection_cache)
+    return trained - start, time.perf_counter() - trained
 
 
-def _predetect(text):
-    return tb(text).detect_language()
+LANGID_CORPORA = f"{dir_path}/cogs/utils/langid"  # Tatoeba exports, sentences.csv or per-language .tsv files
+LANGID_CACHE = f"{dir_path}/langid_model.pickle"
+# n-gram counts for the common languages, used while there are no Tatoeba exports (tools/build_langid_profiles.py)
+LANGID_PROFILES = f"{dir_path}/cogs/utils/langid_profiles.json.gz"
+LANGID_VERSION = 1  # bump when LanguageIdentifier's training changes
+
+
+def _langid_corpora():
+    try:
+        return sorted(f"{LANGID_CORPORA}/{name}" for name in os.listdir(LANGID_CORPORA)
+                      if name.endswith(('.csv', '.tsv')))
+    except FileNotFoundError:
+        return []
 
 
-async def textblob_detect_language(text):
-    return await _loop.run_in_executor(None, partial(_predetect, text))
+def _langid_data_hash():
+    """The Tatoeba dumps are hundreds of MB, so this hashes their names, sizes and modification times"""
+    sha = hashlib.sha256(str(LANGID_VERSION).encode())
+    for path in _langid_corpora():
+        stat = os.stat(path)
+        sha.update(f"{path} {stat.st_size} {stat.st_mtime_ns}".encode())
+    return sha.hexdigest()
+
+
+def _load_language_identifier_cache():
+    """Returns (identifier, hash of the data it was trained on), or (None, None) if there's no usable cache"""
+    try:
+        with open(LANGID_CACHE, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+        return cache['identifier'], cache['hash']
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError, ImportError):
+        return None, None
+
+
+def _load_bundled_language_identifier():
+    try:
+        return load_profiles(LANGID_PROFILES)
+    except OSError:
+        return LanguageIdentifier()
+
+
+def _train_language_identifier():
+    """Trains a LanguageIdentifier on the corpora in LANGID_CORPORA and saves it to LANGID_CACHE.  Without any
+    corpora, returns the one built from the bundled profiles."""
+    if not _langid_corpora():
+        return _load_bundled_language_identifier()
+    data_hash = _langid_data_hash()
+    identifier = LanguageIdentifier.train(read_tatoeba(_langid_corpora()))
+    with open(f"{LANGID_CACHE}.tmp", 'wb') as cache_file:
+        pickle.dump({'hash': data_hash, 'identifier': identifier}, cache_file)
+    os.replace(f"{LANGID_CACHE}.tmp", LANGID_CACHE)
+    return identifier
+
+
+async def load_language_identifier():
+    """Like load_language_dection_model() for the identifier used outside of the Spanish server.  Until one is
+    trained on Tatoeba, bot.langid uses the bundled profiles."""
+    identifier, cached_hash = await _loop.run_in_executor(None, _load_language_identifier_cache)
+    here.bot.langid = identifier or await _loop.run_in_executor(None, _load_bundled_language_identifier)
+    if cached_hash != await _loop.run_in_executor(None, _langid_data_hash) and _langid_corpora():
+        _loop.create_task(retrain_language_identifier())
+
+
+async def retrain_language_identifier():
+    """Trains a new identifier in the executor and swaps it in.  Returns the seconds it took."""
+    start = time.perf_counter()
+    here.bot.langid = await _loop.run_in_executor(None, _train_language_identifier)
+    here.bot.lang_cache.clear()
+    return time.perf_counter() - start
+
+
+def lang_cache_key(text):
+    """Messages that only differ in case and spacing share an entry in bot.lang_cache"""
+    return ' '.join(text.lower().split())
+
+
+def identify_language(text):
+    """The language code of a message (see Stats.lang_codes_dict), or None.  Runs in well under a millisecond, so it
+    doesn't need the executor."""
+    return here.bot.langid.identify(text)
 
@@ -0,0 +1,38 @@
+from bisect import bisect_left, insort
+
+
+class JoinOrder:
+    """The members of every guild sorted by when they joined, for the "#N to join this server" footer of `;u`.
+
+    Each guild is a sorted list of (joined_at, member_id), built once in on_ready (or the first time the guild is
+    asked about) and kept up to date by on_member_join/on_member_remove, so finding a member's place is a binary
+    search instead of sorting the whole member list."""
+
+    def __init__(self):
+        self.guilds = {}  # guild_id: [(joined_at, member_id), ...]
+
+    def build(self, guild):
+        self.guilds[guild.id] = sorted((m.joined_at, m.id) for m in guild.members if m.joined_at)
+
+    def add(self, member):
+        if member.guild.id in self.guilds and member.joined_at:
+            insort(self.guilds[member.guild.id], (member.joined_at, member.id))
+
+    def remove(self, member):
+        members = self.guilds.get(member.guild.id)
+        if not members or not member.joined_at:
+            return
+        i = bisect_left(members, (member.joined_at, member.id))
+        if i < len(members) and members[i] == (member.joined_at, member.id):
+            del members[i]
+
+    def rank(self, member):
+        """Returns 1 for the first member to join a guild, or None if the member isn't in the index"""
+        if member.guild.id not in self.guilds:
+            self.build(member.guild)
+        if not member.joined_at:
+            return None
+        members = self.guilds[member.guild.id]
+        i = bisect_left(members, (member.joined_at, member.id))
+        if i < len(members) and members[i] == (member.joined_at, member.id):
+            return i + 1
@@ -0,0 +1,148 @@
+import os
+import json
+import asyncio
+from collections.abc import Mapping
+
+from .database import json_default
+
+# Sections of bot.db where losing the last minute of changes on a crash hurts (bans, mutes, modlog entries...)
+CRITICAL_SECTIONS = ('modlog', 'mutes', 'bans', 'global_blacklist', 'banlog', 'selfmute')
+
+_DELETED = object()
+
+
+def _lookup(data, path):
+    node = data
+    for key in path:
+        if not isinstance(node, Mapping) or key not in node:
+            return _DELETED
+        node = node[key]
+    return node
+
+
+def _apply(data, path, value):
+    node = data
+    for key in path[:-1]:
+        if not isinstance(node, dict):
+            return
+        if key not in node:
+            if value is _DELETED:
+                return
+            node[key] = {}
+        node = node[key]
+    if not isinstance(node, dict):
+        return
+    if value is _DELETED:
+        node.pop(path[-1], None)
+    else:
+        node[path[-1]] = value
+
+
+class Journal:
+    """A write-ahead log for the critical sections of a Database.
+
+    Every change in one of those sections is noted by its path, and every `interval` seconds the current values at
+    all noted paths are appended to the journal and fsynced.  Because each record holds the full new value at its
+    path (or says that the path was deleted), replaying a record twice does no harm, so on startup the whole journal
+    is simply replayed on top of whatever was last saved to disk.
+
+    The journal is split into numbered segment files.  When the Database saves, it starts a new segment, and once
+    the save is on disk the older segments are deleted, since everything in them has been saved.  This keeps the
+    journal down to roughly the last minute of changes."""
+
+    def __init__(self, directory, sections=CRITICAL_SECTIONS, interval=0.25):
+        self.directory = directory
+        self.sections = frozenset(sections)
+        self.interval = interval
+        self.pending = {}  # path: None, a dict is used as an ordered set
+        self._lock = asyncio.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.log'))
+        self.segment = (self.segments[-1] + 1) if self.segments else 1
+
+    def _segment_file(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}.log")
+
+    def record(self, path):
+        """Called by the Database for every change inside of one of the journaled sections"""
+        if None in path:  # somewhere inside of a list, journal the whole list
+            path = path[:path.index(None)]
+        self.pending[path] = None
+
+    def _records(self):
+        for segment in self.segments:
+            with open(self._segment_file(segment), 'r', encoding='utf-8') as read_file:
+                for line in read_file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        break  # a half-written last line from a crash
+
+    def paths(self):
+        """Returns the paths of all records in the journal"""
+        return [tuple(record[0]) for record in self._records()]
+
+    def replay(self, data):
+        """Applies every journal record on top of `data` (plain dicts freshly loaded from disk).  Returns the set of
+        sections that were changed."""
+        changed = set()
+        for record in self._records():
+            path = tuple(record[0])
+            _apply(data, path, record[1] if len(record) > 1 else _DELETED)
+            changed.add(path[:2])
+        return changed
+
+    def _write(self, segment, lines):
+        with open(self._segment_file(segment), 'a', encoding='utf-8') as write_file:
+            write_file.write(''.join(lines))
+            write_file.flush()
+            os.fsync(write_file.fileno())
+
+    async def flush(self, data):
+        """Appends the current values at all changed paths to the journal"""
+        async with self._lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            lines = []
+            for path in pending:
+                value = _lookup(data, path)
+                if value is _DELETED:
+                    lines.append(json.dumps([path]) + '\n')
+                else:
+                    lines.append(json.dumps([path, value], default=json_default) + '\n')
+            if self.segment not in self.segments:
+                self.segments.append(self.segment)
+            await asyncio.get_event_loop().run_in_executor(None, self._write, self.segment, lines)
+
+    async def rotate(self, data):
+        """Flushes and starts a new segment.  Returns the old segments, which can be deleted with `remove()` once
+        the Database has been saved."""
+        await self.flush(data)
+        async with self._lock:
+            old_segments = [segment for segment in self.segments if segment <= self.segment]
+            self.segment += 1
+        return old_segments
+
+    def remove(self, segments):
+        for segment in segments:
+            try:
+                os.remove(self._segment_file(segment))
+            except FileNotFoundError:
+                pass
+            if segment in self.segments:
+                self.segments.remove(segment)
+
+    def clear(self):
+        """Throws away the whole journal, for when the saved database is replaced by a backup"""
+        self.pending = {}
+        self.remove(list(self.segments))
+
+    async def run(self, database):
+        """The fsync loop, start it once with loop.create_task()"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(database.data)
+            except OSError as e:
+                print(f"Error writing to the db journal: {e}")
@@ -0,0 +1,12 @@
+class KeywordScanner:
+    """Finds which of a fixed list of keywords appear in a text, built once for the list.
+
+    `hits()` returns every keyword found (overlapping ones too, like "自由" inside "动态网自由门"), in the order of
+    the list.  Each `keyword in text` check is a C-level substring search, which for lists this short beats any
+    pass over the text in Python."""
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keywords))
+
+    def hits(self, text):
+        return [keyword for keyword in self.keywords if keyword in text]
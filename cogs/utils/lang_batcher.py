@@ -0,0 +1,48 @@
+import asyncio
+
+
+class DetectionBatcher:
+    """Runs language detection for many messages at once.
+
+    `detect()` puts a text in a queue and waits for its result.  `run()` hands everything that is queued (up to
+    `max_batch` texts) to `predict` in the executor right away, without waiting for more texts to arrive.  Texts that
+    come in while a batch is being predicted queue up for the next one, so a quiet server gets one call per message
+    with no added latency, and under load the per-call overhead of the model is paid once per batch instead of once
+    per message.  The event loop never runs the model itself."""
+
+    def __init__(self, predict, max_batch=64):
+        self.predict = predict  # list of texts -> list of results, called in the executor
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    async def detect(self, text):
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def run(self):
+        """The batching loop, start it once with loop.create_task()"""
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.predict, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), result in zip(batch, results):
+                if not future.done():  # the waiting lang_check might have been cancelled
+                    future.set_result(result)
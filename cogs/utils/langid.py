@@ -0,0 +1,241 @@
+import gzip
+import json
+import math
+import re
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from itertools import islice, repeat
+from operator import mul
+
+# Tatoeba's ISO 639-3 codes -> the codes used in Stats.lang_codes_dict.  Mandarin isn't here because Chinese,
+# like every language with a script of its own, is recognized from the script alone (see _SCRIPT_LANGUAGES).
+TATOEBA_CODES = {'afr': 'af', 'gle': 'ga', 'sqi': 'sq', 'ita': 'it', 'ara': 'ar', 'arz': 'ar', 'aze': 'az',
+                 'eus': 'eu', 'lat': 'la', 'bel': 'be', 'lvs': 'lv', 'lav': 'lv', 'bul': 'bg', 'lit': 'lt',
+                 'cat': 'ca', 'mkd': 'mk', 'zsm': 'ms', 'msa': 'ms', 'mlt': 'mt', 'hrv': 'hr', 'nob': 'no',
+                 'nno': 'no', 'ces': 'cs', 'pes': 'fa', 'fas': 'fa', 'dan': 'da', 'pol': 'pl', 'nld': 'nl',
+                 'por': 'pt', 'eng': 'en', 'ron': 'ro', 'epo': 'eo', 'rus': 'ru', 'est': 'et', 'ekk': 'et',
+                 'srp': 'sr', 'tgl': 'tl', 'slk': 'sk', 'fin': 'fi', 'slv': 'sl', 'fra': 'fr', 'spa': 'es',
+                 'glg': 'gl', 'swh': 'sw', 'swa': 'sw', 'swe': 'sv', 'deu': 'de', 'hat': 'ht', 'tur': 'tr',
+                 'heb': 'iw', 'ukr': 'uk', 'urd': 'ur', 'hun': 'hu', 'vie': 'vi', 'isl': 'is', 'cym': 'cy',
+                 'ind': 'id', 'yid': 'yi'}
+
+# (first code point, script), a script runs until the start of the next range
+_SCRIPT_RANGES = [(0x0000, None), (0x0041, 'Latin'), (0x0250, None), (0x0370, 'Greek'), (0x0400, 'Cyrillic'),
+                  (0x0530, None), (0x0590, 'Hebrew'), (0x0600, 'Arabic'), (0x0700, None), (0x0750, 'Arabic'),
+                  (0x0780, None), (0x0900, 'Devanagari'), (0x0980, 'Bengali'), (0x0A00, None),
+                  (0x0A80, 'Gujarati'), (0x0B00, None), (0x0B80, 'Tamil'), (0x0C00, 'Telugu'), (0x0C80, 'Kannada'),
+                  (0x0D00, None), (0x0E00, 'Thai'), (0x0E80, None), (0x10A0, 'Georgian'), (0x1100, 'Hangul'),
+                  (0x1200, None), (0x1E00, 'Latin'), (0x1F00, 'Greek'), (0x2000, None), (0x3040, 'Kana'),
+                  (0x3100, None), (0x3130, 'Hangul'), (0x3190, None), (0x3400, 'Han'), (0x4DC0, None),
+                  (0x4E00, 'Han'), (0xA000, None), (0xAC00, 'Hangul'), (0xD7B0, None), (0xF900, 'Han'),
+                  (0xFB00, None), (0xFB50, 'Arabic'), (0xFE00, None), (0xFE70, 'Arabic'), (0xFF00, None),
+                  (0xFF66, 'Kana'), (0xFFA0, None)]
+_SCRIPT_STARTS = [start for start, _ in _SCRIPT_RANGES]
+
+# scripts that only one language in Stats.lang_codes_dict is written in
+_SCRIPT_LANGUAGES = {'Greek': 'el', 'Devanagari': 'hi', 'Bengali': 'bn', 'Gujarati': 'gu', 'Tamil': 'ta',
+                     'Telugu': 'te', 'Kannada': 'kn', 'Thai': 'th', 'Georgian': 'ka', 'Hangul': 'ko', 'Kana': 'ja'}
+
+# common characters that are only used in one of the two ways of writing Chinese
+_SIMPLIFIED = set("这个们说时会来对国么为学过发见里开关长问门东车书话语点电买卖边还没让请谢欢爱现经头样动实间听"
+                  "号汉网钱写读认识难给钟飞鸟马鱼气业场")
+_TRADITIONAL = set("這個們說時會來對國麼為學過發見裡開關長問門東車書話語點電買賣邊還沒讓請謝歡愛現經頭樣動實間聽"
+                   "號漢網錢寫讀認識難給鐘飛鳥馬魚氣業場")
+
+_non_letters = re.compile(r"[\W\d_]+")
+
+NGRAM_SIZES = (3, 2, 1)  # trigrams first, the shortlist is picked from them
+MAX_NGRAMS = 8000  # n-grams kept per language, the rest count as unseen
+MAX_CHARACTERS = 200  # only the start of long messages is looked at
+SHORTLIST = 6  # with more candidates than this, only the best on the first SHORTLIST_NGRAMS are fully scored
+SHORTLIST_NGRAMS = 40
+TARGET_PRECISION = 0.95  # thresholds are set so that at least this many of a language's detections are right
+DEFAULT_THRESHOLD = 0.05  # for languages without enough held out sentences to pick one
+
+
+def script_of(character):
+    if character < 'ɐ':
+        return 'Latin' if character.isalpha() else None
+    return _SCRIPT_RANGES[bisect_right(_SCRIPT_STARTS, ord(character)) - 1][1]
+
+
+def main_script(text):
+    """The script most of the letters of a text are written in (Japanese mixes in Han, but any kana makes it
+    Japanese), or None if there are no letters"""
+    scripts = Counter(script_of(c) for c in text if c.isalpha())
+    scripts.pop(None, None)
+    if not scripts:
+        return None
+    if scripts['Kana'] and scripts['Kana'] + scripts['Han'] >= sum(scripts.values()) / 2:
+        return 'Kana'
+    return scripts.most_common(1)[0][0]
+
+
+def ngrams(text):
+    text = f" {' '.join(_non_letters.sub(' ', text[:MAX_CHARACTERS].lower()).split())} "
+    return [text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1)]
+
+
+class LanguageIdentifier:
+    """Identifies the language of a message offline, for the "Most used languages" stats and `;cl`.
+
+    Languages with a script of their own (Greek, Korean, Thai...) are identified from the script.  The rest are
+    told apart by a character n-gram naive Bayes model, scoring only the languages written in the message's script.
+    The model is trained on Tatoeba sentences, or built from the n-gram counts of the bundled profiles until there
+    are any.  A language is only reported when its confidence (how much more likely it is than the runner up, per
+    n-gram, as a log ratio) reaches that language's threshold, which is picked from held out sentences."""
+
+    def __init__(self, profiles=None, thresholds=None, scripts=None):
+        self.profiles = profiles or {}  # lang: ({ngram: log probability}, log probability of an unseen ngram)
+        self.thresholds = thresholds or {}  # lang: lowest confidence it's reported at
+        self.scripts = scripts or {}  # script: [langs written in it]
+
+    def rank(self, text):
+        """Returns (script, [(confidence, lang), ...] best first).  Script-identified languages have confidence 1."""
+        script = main_script(text)
+        if script == 'Han':
+            simplified = sum(c in _SIMPLIFIED for c in text)
+            traditional = sum(c in _TRADITIONAL for c in text)
+            return script, [(1.0, 'zh-TW' if traditional > simplified else 'zh-CN')]
+        if script in _SCRIPT_LANGUAGES:
+            return script, [(1.0, _SCRIPT_LANGUAGES[script])]
+        langs = self.scripts.get(script)
+        if not langs:
+            return script, []
+        grams = Counter(ngrams(text))
+        if len(langs) > SHORTLIST:
+            first = list(islice(grams, SHORTLIST_NGRAMS))
+            langs = sorted(langs, key=lambda lang: -sum(map(self.profiles[lang][0].get, first,
+                                                            repeat(self.profiles[lang][1]))))[:SHORTLIST]
+        counts = list(grams.values())
+        total = sum(counts)
+        scores = []
+        for lang in langs:
+            profile, unseen = self.profiles[lang]
+            scores.append((sum(map(mul, map(profile.get, grams, repeat(unseen)), counts)) / total, lang))
+        scores.sort(reverse=True)
+        if len(scores) == 1:
+            return script, [(1.0, scores[0][1])]
+        return script, [(score - scores[i + 1][0] if i + 1 < len(scores) else 0.0, lang)
+                        for i, (score, lang) in enumerate(scores)]
+
+    def threshold(self, lang):
+        return self.thresholds.get(lang, DEFAULT_THRESHOLD)
+
+    def identify(self, text):
+        """Returns the language code of a text, or None if it can't tell confidently enough"""
+        ranking = self.rank(text)[1]
+        if not ranking:
+            return None
+        confidence, lang = ranking[0]
+        if confidence >= self.threshold(lang):
+            return lang
+
+    def pick_thresholds(self, held_out):
+        """Sets the threshold of every language from (lang, sentence) pairs that weren't used for training"""
+        detections = defaultdict(list)
+        for lang, sentence in held_out:
+            ranking = self.rank(sentence)[1]
+            if ranking:
+                confidence, detected = ranking[0]
+                detections[detected].append((confidence, detected == lang))
+        self.thresholds = {lang: _pick_threshold(detections[lang]) for lang in self.profiles}
+
+    @classmethod
+    def train(cls, sentences):
+        """Trains a model from an iterable of (lang, sentence).  Every tenth sentence of each language is held out
+        to pick its threshold."""
+        training = defaultdict(Counter)
+        held_out = []
+        script_counts = defaultdict(Counter)
+        seen = Counter()
+        for lang, sentence in sentences:
+            seen[lang] += 1
+            script_counts[lang][main_script(sentence)] += 1
+            if seen[lang] % 10 == 0:
+                held_out.append((lang, sentence))
+            else:
+                training[lang].update(ngrams(sentence))
+
+        model = cls({lang: _profile(counts) for lang, counts in training.items()}, {}, _scripts(script_counts))
+        model.pick_thresholds(held_out)
+        return model
+
+    @classmethod
+    def from_counts(cls, counts, totals, thresholds=None):
+        """A model from n-gram counts instead of sentences, like the bundled profiles (see load_profiles()).
+        `counts` is {lang: Counter of its most common n-grams} and `totals` is {lang: number of n-grams in the text
+        they were counted in}.  Each language is put under the scripts of its single letters."""
+        script_counts = defaultdict(Counter)
+        for lang, lang_counts in counts.items():
+            for gram, count in lang_counts.items():
+                if len(gram) == 1:
+                    script_counts[lang][script_of(gram)] += count
+        profiles = {lang: _profile(lang_counts, totals[lang]) for lang, lang_counts in counts.items()}
+        return cls(profiles, thresholds, _scripts(script_counts))
+
+
+def _profile(counts, total=None):
+    """({ngram: log probability}, log probability of an unseen ngram) of a language, from the n-gram counts of its
+    text.  `total` is the number of n-grams in the text, for when `counts` only has the most common ones."""
+    total = (total or sum(counts.values())) + MAX_NGRAMS
+    return ({gram: math.log((count + 1) / total) for gram, count in counts.most_common(MAX_NGRAMS)},
+            math.log(1 / total))
+
+
+def _scripts(script_counts):
+    """{script: [langs]} from {lang: Counter of the scripts of its sentences or letters}"""
+    scripts = defaultdict(list)
+    for lang, counts in script_counts.items():
+        for script, count in counts.items():
+            # Serbian is written in both Cyrillic and Latin
+            if script and script not in _SCRIPT_LANGUAGES and count >= sum(counts.values()) / 10:
+                scripts[script].append(lang)
+    return dict(scripts)
+
+
+def _pick_threshold(detections):
+    """The lowest confidence at which the detections at or above it are still TARGET_PRECISION right"""
+    if len(detections) < 20:
+        return DEFAULT_THRESHOLD
+    threshold = math.inf
+    right = 0
+    for i, (confidence, correct) in enumerate(sorted(detections, key=lambda d: -d[0]), 1):
+        right += correct
+        if right / i >= TARGET_PRECISION:
+            threshold = confidence
+    return threshold
+
+
+def read_tatoeba(paths, max_per_language=20000):
+    """Yields (lang, sentence) from Tatoeba exports (id<tab>ISO 639-3 code<tab>sentence per line), either the full
+    sentences.csv or the per-language files"""
+    counts = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as corpus:
+            for line in corpus:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) < 3:
+                    continue
+                lang = TATOEBA_CODES.get(parts[1])
+                if lang and counts[lang] < max_per_language:
+                    counts[lang] += 1
+                    yield lang, parts[2]
+
+
+def load_profiles(path):
+    """Reads a LanguageIdentifier from a gzipped json file of n-gram counts written by save_profiles()"""
+    with gzip.open(path, 'rt', encoding='utf-8') as profiles_file:
+        data = json.load(profiles_file)
+    counts = {lang: Counter(profile['ngrams']) for lang, profile in data['profiles'].items()}
+    totals = {lang: profile['total'] for lang, profile in data['profiles'].items()}
+    return LanguageIdentifier.from_counts(counts, totals, data['thresholds'])
+
+
+def save_profiles(path, counts, totals, thresholds, source):
+    """Writes the n-gram counts of a model as gzipped json.  `source` says where the counts came from."""
+    data = {'source': source, 'thresholds': thresholds,
+            'profiles': {lang: {'total': totals[lang], 'ngrams': dict(counts[lang].most_common())}
+                         for lang in sorted(counts)}}
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=9) as profiles_file:
+        json.dump(data, profiles_file, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()  # returned by LRUCache.get() on a miss, since None is a result worth caching
+
+
+class LRUCache:
+    """A dict that holds at most `maxsize` items, forgets the least recently used one first, and treats items older
+    than `ttl` seconds as missing.  Counts its hits and misses for `;langcache`."""
+
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()  # key: (time added, value)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+        if time.monotonic() - item[0] > self.ttl:
+            del self.items[key]
+            self.expired += 1
+            self.misses += 1
+            return MISSING
+        self.items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self.items[key] = (time.monotonic(), value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def resize(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        if ttl is not None:
+            self.ttl = ttl
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
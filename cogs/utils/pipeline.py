@@ -0,0 +1,62 @@
+import asyncio
+
+
+class Stage:
+    """One step of General.on_message.  `func` is called with no arguments and awaited; its return value goes in
+    the pipeline's results under `name`.  A stage starts as soon as the stages named in `after` are done.  A
+    `terminal` stage returns True when it removed the message or its author (a delete, a ban...), after which
+    stages that haven't started yet are skipped."""
+    __slots__ = ('name', 'func', 'after', 'terminal', 'timeout')
+
+    def __init__(self, name, func, after=(), terminal=False, timeout=30):
+        self.name = name
+        self.func = func
+        self.after = after
+        self.terminal = terminal
+        self.timeout = timeout
+
+
+async def _run_stage(stage):
+    return await asyncio.wait_for(stage.func(), timeout=stage.timeout)
+
+
+async def run_stages(stages, results=None):
+    """Runs the stages concurrently, each once its dependencies are done, and returns the results dict.
+
+    A stage that times out is reported and counts as done with a result of None, so the stages after it still run.
+    If a stage raises, the rest still run and the first exception is raised at the end, so it reaches on_error like
+    it did when the stages were awaited one by one."""
+    if results is None:
+        results = {}
+    waiting = list(stages)
+    running = {}  # task: stage
+    stopped = False
+    error = None
+    try:
+        while waiting or running:
+            if not stopped:
+                for stage in [stage for stage in waiting if all(name in results for name in stage.after)]:
+                    waiting.remove(stage)
+                    running[asyncio.ensure_future(_run_stage(stage))] = stage
+            if not running:
+                break  # stopped by a terminal stage, or the rest depend on stages that don't exist
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = running.pop(task)
+                try:
+                    results[stage.name] = task.result()
+                except asyncio.TimeoutError:
+                    print(f">>on_message stage {stage.name} timed out after {stage.timeout}s<<")
+                    results[stage.name] = None
+                except Exception as e:
+                    results[stage.name] = None
+                    if error is None:
+                        error = e
+                if stage.terminal and results[stage.name]:
+                    stopped = True
+    finally:
+        for task in running:
+            task.cancel()
+    if error is not None:
+        raise error
+    return results
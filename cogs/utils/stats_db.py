@@ -0,0 +1,699 @@
+import sqlite3
+import threading
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+
+# stats.sqlite3
+#     messages:      (guild, day, user, channel) -> count
+#     emoji:         (guild, day, user, emoji) -> count
+#     lang:          (guild, day, user, lang) -> count
+#     voice:         (guild, day, user) -> minutes
+#     member_totals: (guild, user) -> count  (messages from days older than 30 days)
+#     activity:      (guild, channel, hour) -> messages, minutes (in voice), for all time.  `hour` is the hour of the
+#                    week in UTC, 0 to 167, with 0 being Monday 00:00-01:00 (see hour_of_week())
+# days are stored as integers like 20200403, all IDs are stored as integers
+# The per-user indexes end in the count column, so the stats queries are answered from the index alone without
+# touching the table rows (and without the planner falling back to a range scan over the whole guild).
+#
+# The rolling_* tables hold the totals of all days still in the tables above (the last 30 days), so the leaderboards
+# and user pages don't have to add up every day each time:
+#     rolling_users:         (guild, user) -> count, last_day (the last day the user sent a message)
+#     rolling_user_channels: (guild, user, channel) -> count
+#     rolling_channels:      (guild, channel) -> count
+#     rolling_voice:         (guild, user) -> minutes
+#     rolling_emoji:         (guild, emoji) -> count
+# Triggers add every new message/voice count to them, and delete_old_days() subtracts the days it deletes.
+#
+# Days older than 30 days aren't thrown away but folded into the history_* tables, which have the same columns as
+# the tables above with the day replaced by a (tier, period):
+#     tier 'w': weekly rollups for the last year, period is the Monday that starts the week (like 20200406)
+#     tier 'm': monthly rollups for everything older, period is the first of the month (like 20200401)
+# The *_all views put the days and the rollups together, so a query for "the last 90 days" is a query on
+# messages_all/emoji_all/lang_all/voice_all with `day >= days_ago(90)`, precise to a week (or month) at the start.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    guild INTEGER NOT NULL, day INTEGER NOT NULL, user INTEGER NOT NULL, channel INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, day, user, channel)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_user_days ON messages (guild, user, day, count);
+
+CREATE TABLE IF NOT EXISTS emoji (
+    guild INTEGER NOT NULL, day INTEGER NOT NULL, user INTEGER NOT NULL, emoji TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, day, user, emoji)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS emoji_user_counts ON emoji (guild, user, emoji, count);
+
+CREATE TABLE IF NOT EXISTS lang (
+    guild INTEGER NOT NULL, day INTEGER NOT NULL, user INTEGER NOT NULL, lang TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, day, user, lang)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS lang_user_counts ON lang (guild, user, lang, count);
+
+CREATE TABLE IF NOT EXISTS voice (
+    guild INTEGER NOT NULL, day INTEGER NOT NULL, user INTEGER NOT NULL,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, day, user)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS voice_user ON voice (guild, user, day);
+
+CREATE TABLE IF NOT EXISTS member_totals (
+    guild INTEGER NOT NULL, user INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, user)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS activity (
+    guild INTEGER NOT NULL, channel INTEGER NOT NULL, hour INTEGER NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0, minutes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, channel, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rolling_users (
+    guild INTEGER NOT NULL, user INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0, last_day INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, user)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rolling_users_lb ON rolling_users (guild, count);
+
+CREATE TABLE IF NOT EXISTS rolling_user_channels (
+    guild INTEGER NOT NULL, user INTEGER NOT NULL, channel INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, user, channel)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rolling_user_channels_channel ON rolling_user_channels (guild, channel, user, count);
+
+CREATE TABLE IF NOT EXISTS rolling_channels (
+    guild INTEGER NOT NULL, channel INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, channel)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rolling_voice (
+    guild INTEGER NOT NULL, user INTEGER NOT NULL,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, user)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rolling_voice_lb ON rolling_voice (guild, minutes);
+
+CREATE TABLE IF NOT EXISTS rolling_emoji (
+    guild INTEGER NOT NULL, emoji TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, emoji)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS history_messages (
+    guild INTEGER NOT NULL, tier TEXT NOT NULL, period INTEGER NOT NULL, user INTEGER NOT NULL,
+    channel INTEGER NOT NULL, count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, tier, period, user, channel)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_messages_user ON history_messages (guild, user, period, channel, count);
+
+CREATE TABLE IF NOT EXISTS history_emoji (
+    guild INTEGER NOT NULL, tier TEXT NOT NULL, period INTEGER NOT NULL, user INTEGER NOT NULL,
+    emoji TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, tier, period, user, emoji)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_emoji_user ON history_emoji (guild, user, period, emoji, count);
+
+CREATE TABLE IF NOT EXISTS history_lang (
+    guild INTEGER NOT NULL, tier TEXT NOT NULL, period INTEGER NOT NULL, user INTEGER NOT NULL,
+    lang TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, tier, period, user, lang)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_lang_user ON history_lang (guild, user, period, lang, count);
+
+CREATE TABLE IF NOT EXISTS history_voice (
+    guild INTEGER NOT NULL, tier TEXT NOT NULL, period INTEGER NOT NULL, user INTEGER NOT NULL,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild, tier, period, user)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_voice_user ON history_voice (guild, user, period, minutes);
+
+CREATE VIEW IF NOT EXISTS messages_all AS
+    SELECT guild, day, user, channel, count FROM messages
+    UNION ALL SELECT guild, period, user, channel, count FROM history_messages;
+CREATE VIEW IF NOT EXISTS emoji_all AS
+    SELECT guild, day, user, emoji, count FROM emoji
+    UNION ALL SELECT guild, period, user, emoji, count FROM history_emoji;
+CREATE VIEW IF NOT EXISTS lang_all AS
+    SELECT guild, day, user, lang, count FROM lang
+    UNION ALL SELECT guild, period, user, lang, count FROM history_lang;
+CREATE VIEW IF NOT EXISTS voice_all AS
+    SELECT guild, day, user, minutes FROM voice
+    UNION ALL SELECT guild, period, user, minutes FROM history_voice;
+
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO rolling_users VALUES (NEW.guild, NEW.user, NEW.count, NEW.day)
+        ON CONFLICT (guild, user) DO UPDATE SET count = count + excluded.count,
+                                                last_day = MAX(last_day, excluded.last_day);
+    INSERT INTO rolling_user_channels VALUES (NEW.guild, NEW.user, NEW.channel, NEW.count)
+        ON CONFLICT (guild, user, channel) DO UPDATE SET count = count + excluded.count;
+    INSERT INTO rolling_channels VALUES (NEW.guild, NEW.channel, NEW.count)
+        ON CONFLICT (guild, channel) DO UPDATE SET count = count + excluded.count;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_update AFTER UPDATE OF count ON messages BEGIN
+    INSERT INTO rolling_users VALUES (NEW.guild, NEW.user, NEW.count - OLD.count, NEW.day)
+        ON CONFLICT (guild, user) DO UPDATE SET count = count + excluded.count,
+                                                last_day = MAX(last_day, excluded.last_day);
+    INSERT INTO rolling_user_channels VALUES (NEW.guild, NEW.user, NEW.channel, NEW.count - OLD.count)
+        ON CONFLICT (guild, user, channel) DO UPDATE SET count = count + excluded.count;
+    INSERT INTO rolling_channels VALUES (NEW.guild, NEW.channel, NEW.count - OLD.count)
+        ON CONFLICT (guild, channel) DO UPDATE SET count = count + excluded.count;
+END;
+CREATE TRIGGER IF NOT EXISTS emoji_insert AFTER INSERT ON emoji BEGIN
+    INSERT INTO rolling_emoji VALUES (NEW.guild, NEW.emoji, NEW.count)
+        ON CONFLICT (guild, emoji) DO UPDATE SET count = count + excluded.count;
+END;
+CREATE TRIGGER IF NOT EXISTS emoji_update AFTER UPDATE OF count ON emoji BEGIN
+    INSERT INTO rolling_emoji VALUES (NEW.guild, NEW.emoji, NEW.count - OLD.count)
+        ON CONFLICT (guild, emoji) DO UPDATE SET count = count + excluded.count;
+END;
+CREATE TRIGGER IF NOT EXISTS voice_insert AFTER INSERT ON voice BEGIN
+    INSERT INTO rolling_voice VALUES (NEW.guild, NEW.user, NEW.minutes)
+        ON CONFLICT (guild, user) DO UPDATE SET minutes = minutes + excluded.minutes;
+END;
+CREATE TRIGGER IF NOT EXISTS voice_update AFTER UPDATE OF minutes ON voice BEGIN
+    INSERT INTO rolling_voice VALUES (NEW.guild, NEW.user, NEW.minutes - OLD.minutes)
+        ON CONFLICT (guild, user) DO UPDATE SET minutes = minutes + excluded.minutes;
+END;
+"""
+
+# the day a day-like integer column falls in, as the Monday of its week / the first of its month
+_WEEK_OF = "CAST(strftime('%Y%m%d', printf('%04d-%02d-%02d', {0} / 10000, {0} / 100 % 100, {0} % 100), " \
+           "'-6 days', 'weekday 1') AS INTEGER)"
+_MONTH_OF = "({0} / 100 * 100 + 1)"
+
+# the columns of each counter table besides guild, day and user, and its count column
+_COUNTERS = {'messages': (['channel'], 'count'),
+             'emoji': (['emoji'], 'count'),
+             'lang': (['lang'], 'count'),
+             'voice': ([], 'minutes')}
+
+_UPSERTS = {table: f"INSERT INTO {table} VALUES ({', '.join('?' * (len(columns) + 4))}) "
+                   f"ON CONFLICT (guild, day, user{''.join(', ' + c for c in columns)}) "
+                   f"DO UPDATE SET {count} = {count} + excluded.{count}"
+            for table, (columns, count) in _COUNTERS.items()}
+
+# bumped whenever a change to the schema needs the existing data to be converted, see StatsDB._upgrade()
+SCHEMA_VERSION = 4
+
+
+def today():
+    """Returns today's date (UTC) as an integer like 20200403"""
+    return int(datetime.utcnow().strftime("%Y%m%d"))
+
+
+def hour_of_week(time=None):
+    """Returns the hour of the week of a (UTC) datetime, 0 for Monday 00:00 to 167 for Sunday 23:00"""
+    time = time or datetime.utcnow()
+    return time.weekday() * 24 + time.hour
+
+
+def days_ago(days):
+    """Returns the date from `days` days ago (UTC) as an integer like 20200403"""
+    return int((datetime.utcnow() - timedelta(days=days)).strftime("%Y%m%d"))
+
+
+class StatsDB:
+    """The message/emoji/language/voice counters of the stats module, kept in an SQLite database in WAL mode.
+
+    Every thread gets its own connection, so the read queries for the stats commands can be sent to the executor
+    with `await stats_db.run(...)`.  The add_* functions called for every message/reaction only add to a Counter
+    in memory, which `flusher()` writes to the database in one transaction every `flush_interval` seconds."""
+
+    def __init__(self, path, flush_interval=5):
+        self.path = path
+        self._local = threading.local()
+        self.pending = Counter()  # (table, guild, day, user, channel/emoji/lang or None): count
+        self.flush_interval = flush_interval
+        # refreshed by flusher(), so the add_* functions don't have to format the date
+        self.day = today()
+        self.hour = hour_of_week()
+        self._conn().executescript(_SCHEMA)
+        self._upgrade()
+
+    def _conn(self):
+        try:
+            return self._local.conn
+        except AttributeError:
+            conn = self._local.conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+
+    def _upgrade(self):
+        conn = self._conn()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with conn:
+            conn.execute("BEGIN")
+            if version < 2:  # replaced by the covering indexes in _SCHEMA
+                for index in ['messages_user', 'emoji_user', 'lang_user']:
+                    conn.execute(f"DROP INDEX IF EXISTS {index}")
+                conn.execute("DROP INDEX IF EXISTS rolling_user_channels_channel")
+                conn.execute("CREATE INDEX rolling_user_channels_channel "
+                             "ON rolling_user_channels (guild, channel, user, count)")
+            if version < 3:
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(rolling_users)")]
+                if 'last_day' not in columns:
+                    conn.execute("ALTER TABLE rolling_users ADD COLUMN last_day INTEGER NOT NULL DEFAULT 0")
+                    # the old triggers don't fill last_day, they're made again from _SCHEMA below
+                    conn.execute("DROP TRIGGER IF EXISTS messages_insert")
+                    conn.execute("DROP TRIGGER IF EXISTS messages_update")
+            if version < 4:  # rolling totals in version 1, rolling_users.last_day in 3, rolling_emoji in 4
+                conn.execute("DROP INDEX IF EXISTS emoji_guild_counts")
+                self._rebuild_rolling(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _rebuild_rolling(conn):
+        for table in ['rolling_users', 'rolling_user_channels', 'rolling_channels', 'rolling_voice', 'rolling_emoji']:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("INSERT INTO rolling_users SELECT guild, user, SUM(count), MAX(day) FROM messages "
+                     "GROUP BY guild, user")
+        conn.execute("INSERT INTO rolling_user_channels SELECT guild, user, channel, SUM(count) FROM messages "
+                     "GROUP BY guild, user, channel")
+        conn.execute("INSERT INTO rolling_channels SELECT guild, channel, SUM(count) FROM messages "
+                     "GROUP BY guild, channel")
+        conn.execute("INSERT INTO rolling_voice SELECT guild, user, SUM(minutes) FROM voice GROUP BY guild, user")
+        conn.execute("INSERT INTO rolling_emoji SELECT guild, emoji, SUM(count) FROM emoji GROUP BY guild, emoji")
+
+    async def run(self, func, *args):
+        """Runs one of the query functions below in the executor"""
+        return await asyncio.get_event_loop().run_in_executor(None, partial(func, *args))
+
+    def close(self):
+        try:
+            self._local.conn.close()
+            del self._local.conn
+        except AttributeError:
+            pass
+
+    def backup(self, path):
+        """Makes a consistent copy of the database at `path` while the bot keeps writing to it"""
+        dest = sqlite3.connect(path)
+        try:
+            self._conn().backup(dest)
+        finally:
+            dest.close()
+
+    def restore(self, source):
+        """Replaces the whole database with the contents of the sqlite3 connection `source`"""
+        source.backup(self._conn())
+        self._conn().executescript(_SCHEMA)  # the backup might be from before the last schema change
+        self._upgrade()
+
+    # ### Writing ###
+    # Counts added here show up in the queries after the next flush(), at most `flush_interval` seconds later
+
+    def add_message(self, guild_id, user_id, channel_id, day=None, count=1):
+        self.pending['messages', guild_id, day or self.day, user_id, channel_id] += count
+
+    def add_emoji(self, guild_id, user_id, emoji, day=None, count=1):
+        self.pending['emoji', guild_id, day or self.day, user_id, emoji] += count
+
+    def add_lang(self, guild_id, user_id, lang, day=None, count=1):
+        self.pending['lang', guild_id, day or self.day, user_id, lang] += count
+
+    def add_voice(self, guild_id, user_id, minutes, day=None):
+        self.pending['voice', guild_id, day or self.day, user_id, None] += minutes
+
+    def add_activity(self, guild_id, channel_id, count=1):
+        """Counts a message in the activity heatmap of the current hour"""
+        self.pending['activity', guild_id, self.hour, channel_id, 'messages'] += count
+
+    def add_voice_activity(self, guild_id, channel_id, start, end):
+        """Spreads a voice session from the datetime `start` to `end` (UTC) over the hours of the activity heatmap"""
+        while start < end:
+            next_hour = start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            minutes = int((min(next_hour, end) - start).total_seconds() // 60)
+            if minutes:
+                self.pending['activity', guild_id, hour_of_week(start), channel_id, 'minutes'] += minutes
+            start = next_hour
+
+    def write(self, pending):
+        """Adds a Counter like self.pending to the database"""
+        rows = {table: [] for table in _COUNTERS}
+        activity = {'messages': [], 'minutes': []}
+        for (table, guild_id, day, user_id, key), count in pending.items():
+            if table == 'activity':  # (hour, channel, 'messages'/'minutes') in the place of (day, user, key)
+                activity[key].append((int(guild_id), int(user_id), day, count))
+            elif table == 'messages':
+                rows[table].append((int(guild_id), day, int(user_id), int(key), count))
+            elif table == 'voice':
+                rows[table].append((int(guild_id), day, int(user_id), count))
+            else:
+                rows[table].append((int(guild_id), day, int(user_id), key, count))
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            for table, table_rows in rows.items():
+                if table_rows:
+                    conn.executemany(_UPSERTS[table], table_rows)
+            for column, activity_rows in activity.items():
+                if activity_rows:
+                    conn.executemany(f"INSERT INTO activity (guild, channel, hour, {column}) VALUES (?, ?, ?, ?) "
+                                     f"ON CONFLICT (guild, channel, hour) "
+                                     f"DO UPDATE SET {column} = {column} + excluded.{column}", activity_rows)
+
+    async def flush(self):
+        """Writes everything counted since the last flush to the database (in the executor)"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, Counter()
+        try:
+            await self.run(self.write, pending)
+        except sqlite3.Error:
+            self.pending.update(pending)  # try again next time
+            raise
+
+    async def flusher(self):
+        """The flush loop, start it once with loop.create_task()"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.day = today()
+            self.hour = hour_of_week()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"Error writing to the stats database: {e}")
+
+    def delete_old_days(self, cutoff):
+        """Deletes all days before `cutoff`, folding them into the weekly history, adding the message counts of
+        those days to member_totals and taking them out of the rolling totals"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            for table, (columns, count) in _COUNTERS.items():
+                self._fold(conn, table, f"history_{table}", 'day', _WEEK_OF.format('day'), 'w', columns, count,
+                           "day < ?", (cutoff,))
+            conn.execute("INSERT INTO member_totals "
+                         "SELECT guild, user, SUM(count) FROM messages WHERE day < ? GROUP BY guild, user "
+                         "ON CONFLICT (guild, user) DO UPDATE SET count = count + excluded.count", (cutoff,))
+            conn.execute("INSERT INTO rolling_users "
+                         "SELECT guild, user, -SUM(count), 0 FROM messages WHERE day < ? GROUP BY guild, user "
+                         "ON CONFLICT (guild, user) DO UPDATE SET count = count + excluded.count", (cutoff,))
+            conn.execute("INSERT INTO rolling_user_channels "
+                         "SELECT guild, user, channel, -SUM(count) FROM messages WHERE day < ? "
+                         "GROUP BY guild, user, channel "
+                         "ON CONFLICT (guild, user, channel) DO UPDATE SET count = count + excluded.count", (cutoff,))
+            conn.execute("INSERT INTO rolling_channels "
+                         "SELECT guild, channel, -SUM(count) FROM messages WHERE day < ? GROUP BY guild, channel "
+                         "ON CONFLICT (guild, channel) DO UPDATE SET count = count + excluded.count", (cutoff,))
+            conn.execute("INSERT INTO rolling_voice "
+                         "SELECT guild, user, -SUM(minutes) FROM voice WHERE day < ? GROUP BY guild, user "
+                         "ON CONFLICT (guild, user) DO UPDATE SET minutes = minutes + excluded.minutes", (cutoff,))
+            conn.execute("INSERT INTO rolling_emoji "
+                         "SELECT guild, emoji, -SUM(count) FROM emoji WHERE day < ? GROUP BY guild, emoji "
+                         "ON CONFLICT (guild, emoji) DO UPDATE SET count = count + excluded.count", (cutoff,))
+            for table in ['messages', 'emoji', 'lang', 'voice']:
+                conn.execute(f"DELETE FROM {table} WHERE day < ?", (cutoff,))
+            for table in ['rolling_users', 'rolling_user_channels', 'rolling_channels', 'rolling_emoji']:
+                conn.execute(f"DELETE FROM {table} WHERE count <= 0")
+            conn.execute("DELETE FROM rolling_voice WHERE minutes <= 0")
+
+    def compact_history(self, cutoff):
+        """Folds the weekly rollups of weeks starting before `cutoff` into monthly rollups.  Like delete_old_days(),
+        this runs every day, so each run only has the one or two weeks that just got too old to move."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            for table, (columns, count) in _COUNTERS.items():
+                history = f"history_{table}"
+                self._fold(conn, history, history, 'period', _MONTH_OF.format('period'), 'm', columns, count,
+                           "tier = 'w' AND period < ?", (cutoff,))
+                conn.execute(f"DELETE FROM {history} WHERE tier = 'w' AND period < ?", (cutoff,))
+
+    @staticmethod
+    def _fold(conn, source, history, day_column, period, tier, columns, count, where, params):
+        """Adds up the rows of `source` matching `where` into the `tier` rollups of `history`"""
+        keys = ', '.join(['user'] + columns)
+        conn.execute(f"INSERT INTO {history} (guild, tier, period, {keys}, {count}) "
+                     f"SELECT guild, '{tier}', {period} AS p, {keys}, SUM({count}) FROM {source} WHERE {where} "
+                     f"GROUP BY guild, p, {keys} "
+                     f"ON CONFLICT (guild, tier, period, {keys}) DO UPDATE SET {count} = {count} + excluded.{count}",
+                     params)
+
+    # ### Reading ###
+
+    def count_messages(self, guild_id, user_id, since=None):
+        """Returns the number of messages a user sent in the last 30 days (or since the day `since`)"""
+        if not since:
+            return self.message_summary(guild_id, user_id)[0]
+        row = self._conn().execute("SELECT SUM(count) FROM messages WHERE guild = ? AND user = ? AND day >= ?",
+                                   (int(guild_id), int(user_id), since)).fetchone()
+        return row[0] or 0
+
+    def last_message_day(self, guild_id, user_id):
+        """Returns the last day (like 20200403) a user sent a message, or None"""
+        return self.message_summary(guild_id, user_id)[1]
+
+    def message_summary(self, guild_id, user_id):
+        """Returns (messages in the last 30 days, last day they sent a message or None), a single row lookup"""
+        row = self._conn().execute("SELECT count, last_day FROM rolling_users WHERE guild = ? AND user = ?",
+                                   (int(guild_id), int(user_id))).fetchone()
+        return tuple(row) if row else (0, None)
+
+    # The functions below take an optional `since` (a day like 20200403) to look further back than the last 30
+    # days, which is answered from the *_all views (days + weekly/monthly history)
+
+    def user_channels(self, guild_id, user_id, since=None):
+        """Returns a dict of {channel_id: messages} for one user"""
+        if since:
+            rows = self._conn().execute("SELECT channel, SUM(count) FROM messages_all "
+                                        "WHERE guild = ? AND user = ? AND day >= ? GROUP BY channel",
+                                        (int(guild_id), int(user_id), since))
+        else:
+            rows = self._conn().execute("SELECT channel, count FROM rolling_user_channels "
+                                        "WHERE guild = ? AND user = ?", (int(guild_id), int(user_id)))
+        return dict(rows)
+
+    def user_emoji(self, guild_id, user_id, since=None):
+        table = 'emoji_all' if since else 'emoji'
+        rows = self._conn().execute(f"SELECT emoji, SUM(count) FROM {table} WHERE guild = ? AND user = ? "
+                                    f"AND day >= ? GROUP BY emoji", (int(guild_id), int(user_id), since or 0))
+        return dict(rows)
+
+    def user_langs(self, guild_id, user_id, since=None):
+        table = 'lang_all' if since else 'lang'
+        rows = self._conn().execute(f"SELECT lang, SUM(count) FROM {table} WHERE guild = ? AND user = ? "
+                                    f"AND day >= ? GROUP BY lang", (int(guild_id), int(user_id), since or 0))
+        return dict(rows)
+
+    def user_voice(self, guild_id, user_id, since=None):
+        """Returns the total minutes a user has spent in voice"""
+        if since:
+            row = self._conn().execute("SELECT SUM(minutes) FROM voice_all WHERE guild = ? AND user = ? "
+                                       "AND day >= ?", (int(guild_id), int(user_id), since)).fetchone()
+            return row[0] or 0
+        row = self._conn().execute("SELECT minutes FROM rolling_voice WHERE guild = ? AND user = ?",
+                                   (int(guild_id), int(user_id))).fetchone()
+        return row[0] if row else 0
+
+    def user_page(self, guild_id, user_id, since=None):
+        """Collects everything the `;user` command shows:
+        ({channel_id: messages}, messages this week, {emoji: count}, {lang: count}, voice minutes)"""
+        channels = self.user_channels(guild_id, user_id, since)
+        week = self.count_messages(guild_id, user_id, since=days_ago(7))
+        return (channels, week, self.user_emoji(guild_id, user_id, since), self.user_langs(guild_id, user_id, since),
+                self.user_voice(guild_id, user_id, since))
+
+    @staticmethod
+    def _place(higher, members):
+        """The place of someone below the users in the rows `higher`, only counting the users in `members`"""
+        return 1 + sum(1 for user, in higher if members is None or user in members)
+
+    @staticmethod
+    def _top(rows, limit, members):
+        """The first `limit` of the leaderboard rows `rows` (sorted from the top), only counting the users in
+        `members`.  The rows are read one by one, so the query only runs as far as it needs to."""
+        return list(islice((row for row in rows if members is None or row[0] in members), limit))
+
+    @staticmethod
+    def _limit(limit, members):
+        """The LIMIT clause of a leaderboard query and its parameters, there's none when the rows are filtered by
+        `members` afterwards"""
+        return (" LIMIT ?", (limit,)) if members is None else ("", ())
+
+    def _history_ranking(self, view, value, guild_id, since, channel_ids=None, limit=None, user_id=None,
+                         members=None):
+        """The leaderboards for a `since`, from one of the *_all views.  Returns the top `limit` users as a list of
+        (user_id, total), or with `user_id` that user's (place, total) or None."""
+        where = "guild = ? AND day >= ?"
+        params = [int(guild_id), since]
+        if channel_ids:
+            where += f" AND channel IN ({', '.join('?' * len(channel_ids))})"
+            params += [int(c) for c in channel_ids]
+        totals = f"SELECT user, SUM({value}) AS total FROM {view} WHERE {where} GROUP BY user"
+        if user_id is None:
+            limit_clause, limit_params = self._limit(limit, members)
+            rows = self._conn().execute(f"{totals} ORDER BY total DESC{limit_clause}", (*params, *limit_params))
+            return self._top(rows, limit, members)
+        row = self._conn().execute(f"SELECT SUM({value}) FROM {view} WHERE {where} AND user = ?",
+                                   (*params, int(user_id))).fetchone()
+        if not row[0]:
+            return None
+        higher = self._conn().execute(f"SELECT user FROM ({totals}) WHERE total > ?", (*params, row[0]))
+        return self._place(higher, members), row[0]
+
+    def leaderboard(self, guild_id, channel_ids=None, limit=100, since=None, members=None):
+        """Returns the top `limit` users as a list of (user_id, messages), optionally only counting messages in
+        `channel_ids`.  With a set of user IDs as `members`, only those users are on it."""
+        if since:
+            return self._history_ranking('messages_all', 'count', guild_id, since, channel_ids, limit,
+                                         members=members)
+        limit_clause, limit_params = self._limit(limit, members)
+        if channel_ids:
+            channel_ids = [int(c) for c in channel_ids]
+            # without the hint, sqlite walks the whole guild in primary key order to save the GROUP BY sort
+            rows = self._conn().execute(f"SELECT user, SUM(count) AS total FROM rolling_user_channels "
+                                        f"INDEXED BY rolling_user_channels_channel "
+                                        f"WHERE guild = ? AND channel IN ({', '.join('?' * len(channel_ids))}) "
+                                        f"GROUP BY user ORDER BY total DESC{limit_clause}",
+                                        (int(guild_id), *channel_ids, *limit_params))
+        else:
+            rows = self._conn().execute(f"SELECT user, count FROM rolling_users WHERE guild = ? "
+                                        f"ORDER BY count DESC{limit_clause}", (int(guild_id), *limit_params))
+        return self._top(rows, limit, members)
+
+    def leaderboard_rank(self, guild_id, user_id, channel_ids=None, since=None, members=None):
+        """Returns (place on the leaderboard, messages) of one user, or None if they have no messages.  With a set of
+        user IDs as `members`, only the users in it take up places above them (the leaderboard commands pass the
+        members still in the guild, since they skip everyone who left)."""
+        if since:
+            return self._history_ranking('messages_all', 'count', guild_id, since, channel_ids, user_id=user_id,
+                                         members=members)
+        if channel_ids:
+            channel_ids = [int(c) for c in channel_ids]
+            in_channels = f"channel IN ({', '.join('?' * len(channel_ids))})"
+            row = self._conn().execute(f"SELECT SUM(count) FROM rolling_user_channels "
+                                       f"WHERE guild = ? AND user = ? AND {in_channels}",
+                                       (int(guild_id), int(user_id), *channel_ids)).fetchone()
+            if not row[0]:
+                return None
+            higher = self._conn().execute(f"SELECT user FROM (SELECT user, SUM(count) AS total "
+                                          f"FROM rolling_user_channels INDEXED BY rolling_user_channels_channel "
+                                          f"WHERE guild = ? AND {in_channels} "
+                                          f"GROUP BY user) WHERE total > ?",
+                                          (int(guild_id), *channel_ids, row[0]))
+            return self._place(higher, members), row[0]
+        row = self._conn().execute("SELECT count FROM rolling_users WHERE guild = ? AND user = ?",
+                                   (int(guild_id), int(user_id))).fetchone()
+        if not row:
+            return None
+        higher = self._conn().execute("SELECT user FROM rolling_users WHERE guild = ? AND count > ?",
+                                      (int(guild_id), row[0]))
+        return self._place(higher, members), row[0]
+
+    def channel_counts(self, guild_id, channel_ids=None):
+        """Returns a dict of {channel_id: messages}"""
+        rows = self._conn().execute("SELECT channel, count FROM rolling_channels WHERE guild = ?", (int(guild_id),))
+        if channel_ids:
+            channel_ids = {int(c) for c in channel_ids}
+            return {channel: count for channel, count in rows if channel in channel_ids}
+        return dict(rows)
+
+    def voice_leaderboard(self, guild_id, limit=100, since=None, members=None):
+        """Returns the top `limit` users as a list of (user_id, minutes in voice).  `members` works like in
+        leaderboard()."""
+        if since:
+            return self._history_ranking('voice_all', 'minutes', guild_id, since, limit=limit, members=members)
+        limit_clause, limit_params = self._limit(limit, members)
+        rows = self._conn().execute(f"SELECT user, minutes FROM rolling_voice WHERE guild = ? "
+                                    f"ORDER BY minutes DESC{limit_clause}", (int(guild_id), *limit_params))
+        return self._top(rows, limit, members)
+
+    def voice_rank(self, guild_id, user_id, since=None, members=None):
+        """Returns (place on the voice leaderboard, minutes) of one user, or None.  `members` works like in
+        leaderboard_rank()."""
+        if since:
+            return self._history_ranking('voice_all', 'minutes', guild_id, since, user_id=user_id, members=members)
+        row = self._conn().execute("SELECT minutes FROM rolling_voice WHERE guild = ? AND user = ?",
+                                   (int(guild_id), int(user_id))).fetchone()
+        if not row:
+            return None
+        higher = self._conn().execute("SELECT user FROM rolling_voice WHERE guild = ? AND minutes > ?",
+                                      (int(guild_id), row[0]))
+        return self._place(higher, members), row[0]
+
+    def activity(self, guild_id, channel_id=None):
+        """Returns the heatmap of a guild (or of one channel) as two lists of 168 hours of the week: messages and
+        minutes in voice"""
+        if channel_id:
+            rows = self._conn().execute("SELECT hour, messages, minutes FROM activity "
+                                        "WHERE guild = ? AND channel = ?", (int(guild_id), int(channel_id)))
+        else:
+            rows = self._conn().execute("SELECT hour, SUM(messages), SUM(minutes) FROM activity WHERE guild = ? "
+                                        "GROUP BY hour", (int(guild_id),))
+        messages, minutes = [0] * 168, [0] * 168
+        for hour, hour_messages, hour_minutes in rows:
+            messages[hour] = hour_messages
+            minutes[hour] = hour_minutes
+        return messages, minutes
+
+    def emoji_counts(self, guild_id, user_id=None):
+        """Returns a dict of {emoji: uses} for the whole guild or for one user"""
+        if user_id:
+            return self.user_emoji(guild_id, user_id)
+        rows = self._conn().execute("SELECT emoji, count FROM rolling_emoji WHERE guild = ?", (int(guild_id),))
+        return dict(rows)
+
+    # ### Migration ###
+
+    def migrate_from_json(self, stats):
+        """One-shot import of the old stats.json layout.  Removes the imported 'messages', 'member_totals' and
+        voice 'total_time' trees from `stats` so only the settings ('enable', 'hidden', 'in_voice') are left.
+        Returns the number of guilds that were migrated."""
+        migrated = 0
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            for guild_id, config in stats.items():
+                if 'messages' not in config:
+                    continue
+                guild = int(guild_id)
+                messages, emoji, lang = [], [], []
+                for day, users in config['messages'].items():
+                    for user_id, user in users.items():
+                        for channel_id, count in user.get('channels', {}).items():
+                            messages.append((guild, int(day), int(user_id), int(channel_id), count))
+                        for name, count in user.get('emoji', {}).items():
+                            emoji.append((guild, int(day), int(user_id), name, count))
+                        for code, count in user.get('lang', {}).items():
+                            lang.append((guild, int(day), int(user_id), code, count))
+                voice = []
+                for day, users in config.get('voice', {}).get('total_time', {}).items():
+                    for user_id, minutes in users.items():
+                        if isinstance(minutes, list):  # very old [hours, minutes] entries
+                            minutes = minutes[0] * 60 + minutes[1]
+                        voice.append((guild, int(day), int(user_id), minutes))
+                totals = [(guild, int(user_id), count) for user_id, count in config.get('member_totals', {}).items()]
+
+                # upserts instead of INSERT OR REPLACE so that the triggers keep the rolling totals right
+                conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?) ON CONFLICT (guild, day, user, channel) "
+                                 "DO UPDATE SET count = excluded.count", messages)
+                conn.executemany("INSERT INTO emoji VALUES (?, ?, ?, ?, ?) ON CONFLICT (guild, day, user, emoji) "
+                                 "DO UPDATE SET count = excluded.count", emoji)
+                conn.executemany("INSERT INTO lang VALUES (?, ?, ?, ?, ?) ON CONFLICT (guild, day, user, lang) "
+                                 "DO UPDATE SET count = excluded.count", lang)
+                conn.executemany("INSERT INTO voice VALUES (?, ?, ?, ?) ON CONFLICT (guild, day, user) "
+                                 "DO UPDATE SET minutes = excluded.minutes", voice)
+                conn.executemany("INSERT INTO member_totals VALUES (?, ?, ?) ON CONFLICT (guild, user) "
+                                 "DO UPDATE SET count = excluded.count", totals)
+                migrated += 1
+
+        for config in stats.values():
+            config.pop('messages', None)
+            config.pop('member_totals', None)
+            config.setdefault('voice', {}).pop('total_time', None)
+            config['voice'].setdefault('in_voice', {})
+            config.setdefault('hidden', [])
+        return migrated
@@ -0,0 +1,62 @@
+import re
+
+# patterns that can't be put in one alternation with others: they refer to their own groups by number or name
+_backreference = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def _combinable(pattern, compiled):
+    if compiled.groupindex or _backreference.search(pattern):
+        return False
+    try:  # inline flags like (?i) are only allowed at the start of the whole regex
+        re.compile(f"(?:{pattern})|")
+    except re.error:
+        return False
+    return True
+
+
+class WordFilter:
+    """One guild's wordfilter patterns, compiled once.
+
+    Most messages match nothing, so every pattern that can be combined goes into a single case-insensitive
+    alternation that rejects a message in one search.  Only when that (or one of the patterns that had to stay
+    separate) finds something is each pattern checked on its own, so the caller learns every pattern that hit and can
+    apply each one's ban window."""
+
+    def __init__(self, patterns):
+        self.compiled = {}  # pattern: compiled pattern
+        self.separate = []
+        combinable = []
+        for pattern in patterns:
+            try:
+                compiled = re.compile(pattern, re.I)
+            except re.error:
+                continue  # wordfilter_add checks patterns, but the db can be edited by hand
+            self.compiled[pattern] = compiled
+            if _combinable(pattern, compiled):
+                combinable.append(pattern)
+            else:
+                self.separate.append(compiled)
+        self.combined = re.compile('|'.join(f"(?:{pattern})" for pattern in combinable), re.I) if combinable else None
+
+    def matches(self, text):
+        """Returns the patterns that match somewhere in the text"""
+        if (self.combined and self.combined.search(text)) or any(c.search(text) for c in self.separate):
+            return [pattern for pattern, compiled in self.compiled.items() if compiled.search(text)]
+        return []
+
+
+class WordFilters:
+    """bot.wordfilters: a WordFilter per guild, rebuilt when Admin.wordfilter_add/wordfilter_delete call
+    invalidate() or when the guild's config in bot.db['wordfilter'] has been replaced or changed size"""
+
+    def __init__(self):
+        self.guilds = {}  # guild id: (config it was built from, number of patterns, WordFilter)
+
+    def get(self, guild_id, config):
+        cached = self.guilds.get(guild_id)
+        if cached is None or cached[0] is not config or cached[1] != len(config):
+            cached = self.guilds[guild_id] = (config, len(config), WordFilter(config))
+        return cached[2]
+
+    def invalidate(self, guild_id):
+        self.guilds.pop(guild_id, None)
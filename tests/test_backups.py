@@ -0,0 +1,35 @@
+import os
+import json
+
+from cogs.utils.backups import BackupStore, _retention
+
+
+def write_db(folder, data):
+    with open(os.path.join(folder, 'db.json'), 'w') as write_file:
+        json.dump(data, write_file)
+
+
+def read_db(folder):
+    with open(os.path.join(folder, 'db.json')) as read_file:
+        return json.load(read_file)
+
+
+def test_restore_a_backup_from_the_same_minute(tmp_path):
+    db_folder = tmp_path / 'db'
+    db_folder.mkdir()
+    store = BackupStore(str(tmp_path / 'backups'), {'db': str(db_folder)})
+
+    write_db(db_folder, {'prefix': {'1': ';'}})
+    name, _ = store.backup()
+    write_db(db_folder, {'prefix': {'1': '!'}})
+
+    current = store.restore(name)  # backs up the changed file in the same minute first
+    assert current != name
+    assert read_db(db_folder) == {'prefix': {'1': ';'}}
+    store.restore(current)
+    assert read_db(db_folder) == {'prefix': {'1': '!'}}
+
+def test_retention_reads_old_and_new_names():
+    kept = _retention(['20210310-1400', '20210310-150000', '20210310-150000-2'], {'hourly': 24, 'daily': 7,
+                                                                                   'weekly': 8})
+    assert list(kept) == ['20210310-150000-2', '20210310-1400']
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+import pytest
+
+hf = pytest.importorskip('cogs.utils.helper_functions')  # needs discord.py and scikit-learn
+
+
+def test_parse_stats_range():
+    since, description = hf.parse_stats_range('2w')
+    assert description == "Last 2 weeks"
+    assert since < int(datetime.utcnow().strftime("%Y%m%d"))
+    assert hf.parse_stats_range('soon') == (None, None)
+
+
+def test_parse_stats_range_far_back():
+    since, description = hf.parse_stats_range('9999y')
+    assert description == "Last 9999 years"
+    assert since < 19500101
+    assert hf.parse_stats_range('99999999999d')[0] == since
@@ -0,0 +1,19 @@
+from cogs.utils.stats_db import StatsDB, days_ago
+
+GUILD = 1
+
+
+def test_leaderboard_skips_users_who_left(tmp_path):
+    db = StatsDB(str(tmp_path / 'stats.sqlite3'))
+    for user in range(200):
+        db.add_message(GUILD, user, 10, count=200 - user)
+    db.write(db.pending)
+    members = set(range(150, 200))  # the 150 most active users left
+
+    ranking = db.leaderboard(GUILD, limit=25, members=members)
+    assert [user for user, _ in ranking] == list(range(150, 175))
+    assert db.leaderboard(GUILD, [10], limit=25, members=members) == ranking
+    assert db.leaderboard(GUILD, limit=25, since=days_ago(7), members=members) == ranking
+    assert db.leaderboard_rank(GUILD, 180, members=members) == (31, 20)
+    assert len(db.leaderboard(GUILD, limit=25)) == 25
+    db.close()
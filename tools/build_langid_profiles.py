@@ -0,0 +1,116 @@
+"""Builds cogs/utils/langid_profiles.json.gz, the n-gram profiles the language identifier uses until it's trained on
+Tatoeba (see helper_functions.load_language_identifier()).
+
+The counts come from the language profiles of the langdetect package (Apache License 2.0, built from Wikipedia
+abstracts), lowercased and cut down to PROFILE_SIZE n-grams per language.  The per-language thresholds are picked
+on half of a set of held out sentences, and the accuracy is reported on the other half.  The held out sentences are
+either a file of lang<tab>sentence lines or random sentences of frequent words from the word lists of the wordfreq
+package.  Sentences of languages without a profile (Icelandic, Malay...) are kept, so the thresholds also learn to
+not mistake them for a close language.
+
+    pip download --no-deps langdetect wordfreq    (and unpack both)
+    python tools/build_langid_profiles.py langdetect/profiles --wordfreq wordfreq/data
+    python tools/build_langid_profiles.py langdetect/profiles --sentences held_out.tsv
+"""
+import os
+import sys
+import gzip
+import json
+import random
+import argparse
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from cogs.utils.langid import LanguageIdentifier, TATOEBA_CODES, save_profiles, load_profiles
+
+OUTPUT = os.path.join(ROOT, 'cogs', 'utils', 'langid_profiles.json.gz')
+PROFILE_SIZE = 2000  # n-grams kept per language, more barely changes the accuracy but doubles the file
+TOTAL = 2_000_000  # every profile is scaled to this many n-grams, so no language gets a smaller unseen penalty
+CODES = {'he': 'iw', 'nb': 'no', 'fil': 'tl'}  # langdetect/wordfreq codes -> Stats.lang_codes_dict codes
+LANGUAGES = set(TATOEBA_CODES.values())  # the languages that need n-grams, the others are told by their script
+
+
+def read_langdetect(directory):
+    """Returns ({lang: Counter of n-grams}, {lang: total}) from langdetect's profiles folder"""
+    counts, totals = {}, {}
+    for name in sorted(os.listdir(directory)):
+        lang = CODES.get(name, name)
+        if lang not in LANGUAGES:
+            continue
+        with open(os.path.join(directory, name), encoding='utf-8') as profile_file:
+            profile = json.load(profile_file)
+        lang_counts = Counter()
+        for gram, count in profile['freq'].items():
+            gram = gram.lower()
+            if gram.strip() and '  ' not in gram and all(c.isalpha() or c == ' ' for c in gram):
+                lang_counts[gram] += count
+        scale = TOTAL / sum(profile['n_words'])
+        counts[lang] = Counter({gram: round(count * scale) for gram, count in lang_counts.most_common(PROFILE_SIZE)
+                                if round(count * scale)})
+        totals[lang] = TOTAL
+    return counts, totals
+
+
+def read_sentences(path):
+    with open(path, encoding='utf-8') as sentences_file:
+        return [tuple(line.rstrip('\n').split('\t', 1)) for line in sentences_file if '\t' in line]
+
+
+def wordfreq_sentences(directory, per_language=400, seed=1):
+    """Random sentences of 2 to 12 words, picked by how common they are from the 30000 most common words"""
+    import msgpack
+    rng = random.Random(seed)
+    sentences = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('small_') and name.endswith('.msgpack.gz')):
+            continue
+        code = name[len('small_'):-len('.msgpack.gz')]
+        lang = CODES.get(code, code)
+        with gzip.open(os.path.join(directory, name)) as word_file:
+            bins = msgpack.load(word_file, raw=False)[1:]  # bin i holds the words with a frequency of 10^(-i/100)
+        words, weights = [], []
+        for i, bin_words in enumerate(bins):
+            if len(words) > 30000:
+                break
+            words += bin_words
+            weights += [10 ** (-i / 100)] * len(bin_words)
+        sentences += [(lang, ' '.join(rng.choices(words, weights, k=rng.randint(2, 12))))
+                      for _ in range(per_language)]
+    return sentences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('langdetect_profiles')
+    held_out = parser.add_mutually_exclusive_group(required=True)
+    held_out.add_argument('--sentences', help="a file of lang<tab>sentence lines")
+    held_out.add_argument('--wordfreq', help="wordfreq's data folder")
+    parser.add_argument('--output', default=OUTPUT)
+    args = parser.parse_args()
+
+    counts, totals = read_langdetect(args.langdetect_profiles)
+    if args.sentences:
+        sentences, source = read_sentences(args.sentences), os.path.basename(args.sentences)
+    else:
+        sentences, source = wordfreq_sentences(args.wordfreq), "sentences of wordfreq's most common words"
+    sentences = [(lang, sentence) for lang, sentence in sentences if lang in LANGUAGES]
+    tuning, testing = sentences[::2], sentences[1::2]
+    model = LanguageIdentifier.from_counts(counts, totals)
+    model.pick_thresholds(tuning)
+    save_profiles(args.output, counts, totals, model.thresholds,
+                  f"n-gram counts from the langdetect 1.0.9 profiles (Copyright (c) 2010-2014 Cybozu Labs, Inc., "
+                  f"Apache License 2.0), thresholds picked on {source}")
+
+    model = load_profiles(args.output)
+    known = [(lang, model.identify(sentence)) for lang, sentence in testing if lang in counts]
+    unknown = [model.identify(sentence) for lang, sentence in testing if lang not in counts]
+    answered = [(lang, detected) for lang, detected in known if detected]
+    print(f"{len(counts)} languages, {os.path.getsize(args.output) / 1024:.0f} KiB.  On the other half of the held "
+          f"out sentences: {len(answered) / len(known):.1%} answered, "
+          f"{sum(lang == detected for lang, detected in answered) / len(answered):.1%} of those right, and "
+          f"{sum(map(bool, unknown))} of {len(unknown)} sentences in languages without a profile answered (wrongly)")
+
+
+if __name__ == '__main__':
+    main()